@@ -0,0 +1,203 @@
+import os
+import json
+import bisect
+import hashlib
+import logging
+from scheduler import Slot, DEFAULT_SLOTS
+from topic_search import Topic, DEFAULT_TOPICS
+from twitter_clients import TwitterClientProvider, TwitterCredentials
+
+log = logging.getLogger(__name__)
+
+DEFAULT_COMMUNITY_QUERY = "(Cardano OR ADA OR Web3) -is:retweet lang:en"
+
+class Account:
+    """Configuration of one bot persona
+
+    Credentials are read from the usual variables (API_KEY, ACCESS_TOKEN,
+    ...) prefixed with `env_prefix`, so secrets stay out of the accounts
+    file. State files (tracker, jobs, cursors, buffer, caches) live in `state_dir`.
+    `token_budget` is the daily generation token budget (default
+    TOKEN_BUDGET_DAILY, 0 for none).
+    """
+
+    def __init__(self, name, assistant_id, env_prefix='', handle=None,
+                 slots=None, topics=None, community_query=DEFAULT_COMMUNITY_QUERY,
+                 state_dir='.', tracker_file='replied_tweets.db', token_budget=None):
+        self.name = name
+        self.assistant_id = assistant_id
+        self.env_prefix = env_prefix
+        self.handle = handle or name
+        self.slots = slots or DEFAULT_SLOTS
+        self.topics = topics or DEFAULT_TOPICS
+        self.community_query = community_query
+        self.state_dir = state_dir
+        self.tracker_file = tracker_file
+        self.token_budget = int(os.getenv('TOKEN_BUDGET_DAILY', '0') if token_budget is None
+                                else token_budget)
+
+    def __repr__(self):
+        return f"Account({self.name!r})"
+
+    def path(self, filename):
+        return os.path.join(self.state_dir, filename)
+
+    def credentials(self):
+        return TwitterCredentials.from_env(self.env_prefix)
+
+    @classmethod
+    def from_dict(cls, data, base_dir='.'):
+        """Account from one entry of the accounts file
+
+        Slots are `[name, "HH:MM", tweet_type]` lists and topics are either
+        a query string or a `[query, weight]` pair.
+        """
+        slots = None
+        if data.get('slots'):
+            slots = []
+            for entry in data['slots']:
+                hour, minute = (int(part) for part in entry[1].split(':'))
+                slots.append(Slot(entry[0], hour, minute, entry[2] if len(entry) > 2 else None))
+        topics = None
+        if data.get('topics'):
+            topics = [Topic(entry) if isinstance(entry, str) else Topic(*entry)
+                      for entry in data['topics']]
+        name = data['name']
+        return cls(
+            name,
+            assistant_id=data['assistant_id'],
+            env_prefix=data.get('env_prefix', ''),
+            handle=data.get('handle'),
+            slots=slots,
+            topics=topics,
+            community_query=data.get('community_query', DEFAULT_COMMUNITY_QUERY),
+            state_dir=os.path.join(base_dir, data.get('state_dir', os.path.join('accounts', name))),
+            tracker_file=data.get('tracker_file', 'replied_tweets.db'),
+            token_budget=data.get('token_budget')
+        )
+
+def load_accounts(path=None):
+    """Accounts from `path` or ACCOUNTS_FILE (default accounts.json), [] if there is none
+
+    The file holds `{"accounts": [...]}` with one `Account.from_dict` entry
+    per persona.
+    """
+    path = path or os.getenv('ACCOUNTS_FILE', 'accounts.json')
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return []
+    entries = data['accounts'] if isinstance(data, dict) else data
+    base_dir = os.path.dirname(os.path.abspath(path))
+    return [Account.from_dict(entry, base_dir) for entry in entries]
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+class HashRing:
+    """Consistent-hash ring: adding or removing a node moves about 1/n of the keys"""
+
+    def __init__(self, nodes, replicas=64):
+        self.ring = sorted(
+            (_hash(f"{node}#{replica}"), node) for node in nodes for replica in range(replicas)
+        )
+        self.points = [point for point, _ in self.ring]
+
+    def node_for(self, key):
+        index = bisect.bisect(self.points, _hash(key)) % len(self.points)
+        return self.ring[index][1]
+
+def shard_accounts(accounts, shard=None, shards=None):
+    """The accounts owned by shard `shard` of `shards` (SHARD_INDEX / SHARD_COUNT)"""
+    shard = int(os.getenv('SHARD_INDEX', '0') if shard is None else shard)
+    shards = int(os.getenv('SHARD_COUNT', '1') if shards is None else shards)
+    if shards <= 1:
+        return list(accounts)
+    ring = HashRing([f"shard-{index}" for index in range(shards)])
+    return [account for account in accounts if ring.node_for(account.name) == f"shard-{shard}"]
+
+class Persona:
+    """Runtime of one account: Twitter clients, generation engine and state
+
+    Each persona has its own rate-limit governor, tracker and state files;
+    the HTTP connection pool, OpenAI client and event loop can be shared
+    with other personas in the same process.
+    """
+
+    def __init__(self, account, adapter=None, openai_client=None, loop=None, twitter=None):
+        # Runtime modules load here so reading and sharding accounts stays cheap
+        from generation_engine import GenerationEngine
+        from generation_backends import make_backend, make_fallback_backend
+        from community_pipeline import TokenBucket
+        from search_cursors import SearchCursors
+        from tweet_buffer import TweetBuffer
+        from response_cache import ResponseCache
+        from reply_store import TweetTracker
+        from job_queue import JobQueue
+        from tweet_scoring import TweetScorer, CandidateQueue
+        from token_usage import TokenLedger
+
+        self.account = account
+        self.name = account.name
+        os.makedirs(account.state_dir, exist_ok=True)
+        self.twitter = twitter or TwitterClientProvider(account.credentials(), adapter=adapter)
+        self.engine = GenerationEngine(
+            make_backend(
+                assistant_id=account.assistant_id,
+                api_key=os.getenv('OPENAI_API_KEY'),
+                client=openai_client,
+                state_dir=account.state_dir
+            ),
+            loop=loop,
+            fallback=make_fallback_backend(
+                assistant_id=account.assistant_id,
+                api_key=os.getenv('OPENAI_API_KEY'),
+                client=openai_client
+            )
+        )
+        # Replied tweets, shared by every polling pass and the stream
+        self.tracker = TweetTracker(self.tracker_file, account.path('replied_tweets.json'))
+        # since_id high-water marks so repeated searches only return new tweets
+        self.search_cursors = SearchCursors(account.path('search_cursors.json'))
+        # Pre-generated tweets for upcoming schedule slots
+        self.tweet_buffer = TweetBuffer(account.path('tweet_buffer.json'))
+        # Replies to near-identical tweets (copies, spam storms) are generated once
+        self.response_cache = ResponseCache(disk_path=account.path('response_cache.db'))
+        # Shared across monitoring passes so the reply cooldown carries over
+        self.reply_bucket = TokenBucket(rate=1 / 60, capacity=1)
+        # Durable generate/post jobs so a restart never posts the same thing twice
+        self.jobs = JobQueue(account.path('jobs.db'))
+        # Scored reply candidates carried across community polling cycles
+        self.candidates = CandidateQueue(TweetScorer(account.topics))
+        # Tokens spent per day and kind; replies stop before the posts' share of the budget
+        self.token_ledger = TokenLedger(
+            account.path('token_usage.json'),
+            daily_limit=account.token_budget,
+            post_reserve=float(os.getenv('TOKEN_BUDGET_POST_RESERVE', '0.25'))
+        )
+
+    def __repr__(self):
+        return f"Persona({self.name!r})"
+
+    @property
+    def tracker_file(self):
+        return self.account.path(self.account.tracker_file)
+
+def build_personas(accounts, pool_size=10):
+    """Personas sharing one Twitter connection pool, OpenAI client and event loop"""
+    from generation_engine import start_loop
+
+    if not accounts:
+        return []
+    loop = start_loop()
+    adapter = TwitterClientProvider(accounts[0].credentials(), pool_size=pool_size).make_adapter()
+    openai_client = None
+    if os.getenv('GENERATION_BACKEND', 'assistants').lower() != 'stub':
+        from openai import AsyncOpenAI
+
+        openai_client = AsyncOpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            base_url=os.getenv('GENERATION_BASE_URL')
+        )
+    return [Persona(account, adapter, openai_client, loop) for account in accounts]
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import threading
+from collections import Counter
+import clock
+import metrics
+import json_state
+
+log = logging.getLogger(__name__)
+
+IDLE = 'idle'
+BUSY = 'busy'
+RETIRED = 'retired'
+
+class ThreadManager:
+    """Reusable Assistant threads per purpose, with rotation and batched deletion
+
+    A thread serves one run at a time: `checkout` hands out an idle thread
+    of the purpose (e.g. 'post' or 'reply') and `checkin` returns it. Threads
+    that reach `max_messages` or `max_age`, or whose run failed, are retired
+    and deleted server-side by `collect`, which runs in the background every
+    `gc_interval` seconds or as soon as `delete_batch` threads are waiting.
+    Runs on a reused thread only see the last `context_messages` messages.
+
+    Thread ids are persisted so threads left over by a previous process are
+    reused or deleted instead of being orphaned. New and retired threads are
+    saved right away; plain checkouts and checkins only mark the state dirty
+    and are written by `flush`, which the cleanup loop calls. Threads that
+    still look busy on disk are retired on load, so a lost flush never reuses
+    a thread with an active run.
+    """
+
+    def __init__(self, client_factory, filename='assistant_threads.json', max_messages=40,
+                 max_age=24 * 3600, context_messages=6, delete_batch=20,
+                 delete_concurrency=4, gc_interval=600):
+        self.client_factory = client_factory
+        self.filename = filename
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self.context_messages = context_messages
+        self.delete_batch = delete_batch
+        self.delete_concurrency = delete_concurrency
+        self.gc_interval = gc_interval
+        self._lock = threading.Lock()
+        self._gc_task = None
+        self._collecting = False
+        self._dirty = False
+        self.threads = self.load()
+        self.purposes = {entry['purpose'] for entry in self.threads.values()}
+
+    @property
+    def truncation_strategy(self):
+        return {'type': 'last_messages', 'last_messages': self.context_messages}
+
+    def load(self):
+        threads = json_state.load(self.filename)
+        # A run may still be active on threads that were busy when we stopped
+        for entry in threads.values():
+            if entry['state'] == BUSY:
+                entry['state'] = RETIRED
+        return threads
+
+    def save(self):
+        json_state.save(self.filename, self.threads)
+        self._dirty = False
+
+    def flush(self):
+        """Save state changed by checkouts and checkins since the last save"""
+        with self._lock:
+            if self._dirty:
+                self.save()
+
+    def _expired(self, entry, now):
+        return entry['messages'] >= self.max_messages or now - entry['created_at'] >= self.max_age
+
+    def _retire(self, thread_id, entry, now):
+        entry['state'] = RETIRED
+        metrics.observe('assistant_thread_age_seconds', now - entry['created_at'],
+                        buckets=(60, 600, 3600, 6 * 3600, 24 * 3600, 7 * 24 * 3600))
+        log.debug("Retired thread %s after %d messages", thread_id, entry['messages'])
+
+    def checkout(self, purpose, now=None):
+        """An idle thread id for `purpose` marked busy, or None if a new thread is needed"""
+        now = clock.time() if now is None else now
+        with self._lock:
+            chosen = None
+            retired = False
+            for thread_id, entry in self.threads.items():
+                if entry['purpose'] != purpose or entry['state'] != IDLE:
+                    continue
+                if self._expired(entry, now):
+                    self._retire(thread_id, entry, now)
+                    retired = True
+                elif chosen is None:
+                    chosen = thread_id
+            if chosen is not None:
+                self.threads[chosen]['state'] = BUSY
+                metrics.inc('assistant_thread_checkouts_total', purpose=purpose, reused='yes')
+            else:
+                metrics.inc('assistant_thread_checkouts_total', purpose=purpose, reused='no')
+            if retired:
+                self.save()
+            elif chosen is not None:
+                self._dirty = True
+            self._update_metrics(now)
+            return chosen
+
+    def adopt(self, purpose, thread_id, now=None):
+        """Track a thread created by `create_and_run` as busy for `purpose`"""
+        now = clock.time() if now is None else now
+        with self._lock:
+            self.threads[thread_id] = {
+                'purpose': purpose, 'created_at': now, 'messages': 0, 'state': BUSY
+            }
+            self.purposes.add(purpose)
+            self.save()
+            self._update_metrics(now)
+
+    def checkin(self, thread_id, ok=True, messages=2, now=None):
+        """Return a thread after its run; failed runs and full or old threads are retired"""
+        now = clock.time() if now is None else now
+        with self._lock:
+            entry = self.threads.get(thread_id)
+            if entry is None:
+                return
+            entry['messages'] += messages
+            if ok and not self._expired(entry, now):
+                entry['state'] = IDLE
+                self._dirty = True
+            else:
+                self._retire(thread_id, entry, now)
+                self.save()
+            self._update_metrics(now)
+            retired = sum(1 for entry in self.threads.values() if entry['state'] == RETIRED)
+        self._ensure_gc()
+        if retired >= self.delete_batch and not self._collecting:
+            asyncio.get_running_loop().create_task(self.collect())
+
+    def _update_metrics(self, now):
+        counts = Counter((entry['purpose'], entry['state']) for entry in self.threads.values())
+        oldest = {}
+        for entry in self.threads.values():
+            if entry['state'] != RETIRED:
+                age = now - entry['created_at']
+                oldest[entry['purpose']] = max(oldest.get(entry['purpose'], 0), age)
+        for purpose in self.purposes:
+            for state in (IDLE, BUSY, RETIRED):
+                metrics.set_gauge('assistant_threads', counts[(purpose, state)],
+                                  purpose=purpose, state=state)
+            metrics.set_gauge('assistant_thread_oldest_seconds', round(oldest.get(purpose, 0), 1),
+                              purpose=purpose)
+
+    def _ensure_gc(self):
+        if self._gc_task is None or self._gc_task.done():
+            self._gc_task = asyncio.get_running_loop().create_task(self._gc_loop())
+
+    async def _gc_loop(self):
+        while True:
+            await asyncio.sleep(self.gc_interval)
+            try:
+                self.flush()
+                await self.collect()
+            except Exception as e:
+                log.warning("Thread cleanup failed: %s", e)
+
+    async def collect(self, now=None):
+        """Retire expired idle threads and delete all retired ones; returns the number deleted"""
+        now = clock.time() if now is None else now
+        with self._lock:
+            for thread_id, entry in self.threads.items():
+                if entry['state'] == IDLE and self._expired(entry, now):
+                    self._retire(thread_id, entry, now)
+            retired = [thread_id for thread_id, entry in self.threads.items()
+                       if entry['state'] == RETIRED]
+        if not retired:
+            return 0
+
+        from openai import NotFoundError
+
+        self._collecting = True
+        client = self.client_factory()
+        semaphore = asyncio.Semaphore(self.delete_concurrency)
+
+        async def delete(thread_id):
+            async with semaphore:
+                try:
+                    await client.beta.threads.delete(thread_id)
+                except NotFoundError:
+                    pass
+                except Exception as e:
+                    log.warning("Could not delete thread %s: %s", thread_id, e)
+                    return None
+                return thread_id
+
+        try:
+            deleted = [thread_id for thread_id in await asyncio.gather(*map(delete, retired))
+                       if thread_id]
+        finally:
+            self._collecting = False
+        with self._lock:
+            for thread_id in deleted:
+                self.threads.pop(thread_id, None)
+            self.save()
+            self._update_metrics(now)
+        metrics.inc('assistant_threads_deleted_total', len(deleted))
+        log.info("Deleted %d of %d retired Assistant threads", len(deleted), len(retired))
+        return len(deleted)
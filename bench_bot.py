@@ -0,0 +1,238 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from fake_apis import FakeServer, FakeTwitter, FakeOpenAI
+from generation_backends import BACKENDS
+from token_usage import format_report, utc_day
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+def report(name, latencies, replies, elapsed, twitter, openai):
+    """Print latency percentiles, throughput and API calls per reply"""
+    calls = sum(twitter.calls.values()) + sum(openai.calls.values())
+    print(f"\n== {name} ==")
+    print(f"  runs: {len(latencies)}, replies/posts: {replies}, wall time: {elapsed:.2f}s")
+    print(f"  latency p50 {percentile(latencies, 50) * 1000:.0f} ms, "
+          f"p95 {percentile(latencies, 95) * 1000:.0f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.0f} ms")
+    if replies:
+        print(f"  replies per minute: {replies / elapsed * 60:.1f}")
+        print(f"  API calls per reply: {calls / replies:.1f}")
+    print(f"  twitter calls: {dict(twitter.calls)}")
+    print(f"  openai calls: {dict(openai.calls)}")
+
+def reset_counters(*apis):
+    for api in apis:
+        api.calls.clear()
+
+def run_benchmarks(args):
+    twitter = FakeTwitter(
+        latency=args.twitter_latency, new_per_search=args.new_per_search,
+        duplicate_rate=args.duplicate_rate, rate_limit=args.rate_limit,
+        failure_rate=args.failure_rate, stream_rate=args.stream_rate,
+        stream_disconnect_after=args.stream_disconnect_after
+    )
+    openai = FakeOpenAI(
+        latency=args.openai_latency, run_latency=args.run_latency,
+        run_failure_rate=args.run_failure_rate, slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency
+    )
+    twitter_server = FakeServer(twitter).start()
+    openai_server = FakeServer(openai).start()
+
+    # Point both SDKs at the fakes before the bot module creates its clients
+    os.environ['TWITTER_API_BASE_URL'] = twitter_server.url
+    os.environ['OPENAI_BASE_URL'] = openai_server.url + '/v1'
+    os.environ.setdefault('OPENAI_API_KEY', 'bench')
+    os.environ['GENERATION_BACKEND'] = args.backend
+    for name in ('BEARER_TOKEN', 'API_KEY', 'API_KEY_SECRET', 'ACCESS_TOKEN', 'ACCESS_TOKEN_SECRET'):
+        os.environ.setdefault(name, 'bench')
+
+    # State files (tracker, cursors, caches) go to a scratch directory
+    workdir = tempfile.mkdtemp(prefix='morpheus-bench-')
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import morpheus_ai_twitter_bot as bot
+    import metrics
+    from community_pipeline import TokenBucket
+
+    metrics.setup_logging(args.log_level)
+
+    client = bot.twitter.get_client()
+
+    if 'post' in args.scenarios:
+        reset_counters(twitter, openai)
+        latencies = []
+        posted = 0
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            t0 = time.perf_counter()
+            if bot.generate_and_post_tweet(client, "morning", hedge=args.hedge):
+                posted += 1
+            latencies.append(time.perf_counter() - t0)
+        report("generate_and_post_tweet", latencies, posted,
+               time.perf_counter() - start, twitter, openai)
+
+    if 'community' in args.scenarios:
+        reset_counters(twitter, openai)
+        tracker = bot.TweetTracker()
+        bucket = TokenBucket(rate=args.post_rate, capacity=1)
+        latencies = []
+        replies = 0
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            t0 = time.perf_counter()
+            replies += bot.monitor_cardano_community(
+                client, tracker, post_bucket=bucket, min_likes=0,
+                generate_workers=args.concurrency
+            ) or 0
+            latencies.append(time.perf_counter() - t0)
+        report("monitor_cardano_community", latencies, replies,
+               time.perf_counter() - start, twitter, openai)
+        print(f"  response cache: {bot.response_cache.metrics()}")
+        print(f"  reply candidates still pending: {len(bot.default_persona.candidates)}")
+
+    if 'duplicates' in args.scenarios:
+        # Near-identical tweets of answered ones are skipped rather than sent
+        # the cached reply Twitter would reject; nothing rejected may count
+        # as posted anywhere
+        reset_counters(twitter, openai)
+        twitter.reject_duplicates, twitter.duplicate_rate = True, 0.9
+        openai.unique_replies = True
+        tracker = bot.TweetTracker('duplicates_replied.db', 'duplicates_replied.json')
+        bucket = TokenBucket(rate=args.post_rate, capacity=1)
+        ledger = bot.default_persona.token_ledger
+
+        def counts():
+            return (sum(bool(p.get('reply')) for p in twitter.posted), len(tracker.store),
+                    ledger.days.get(utc_day(), {}).get('posted', {}).get('reply', 0),
+                    metrics.registry.counters.get(
+                        ('replies_skipped_total', (('reason', 'already_answered'),)), 0),
+                    metrics.registry.counters.get(('jobs_duplicate_rejected_total', ()), 0))
+
+        before = counts()
+        latencies = []
+        replies = 0
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            t0 = time.perf_counter()
+            replies += bot.monitor_cardano_community(
+                client, tracker, post_bucket=bucket, min_likes=0,
+                generate_workers=args.concurrency
+            ) or 0
+            latencies.append(time.perf_counter() - t0)
+        report("monitor_cardano_community (near-duplicate tweets)", latencies, replies,
+               time.perf_counter() - start, twitter, openai)
+        posted, marked, charged, skipped, rejected = (
+            after - b for after, b in zip(counts(), before)
+        )
+        print(f"  replies posted: {posted}, pipeline: {replies}, ledger: {charged}, "
+              f"skipped as already answered: {skipped}, rejected as duplicates: {rejected}")
+        assert posted == replies == charged, "rejected replies were counted as posted"
+        assert marked == posted + skipped, "tracker marks do not match posted and skipped tweets"
+        assert not rejected, "cached replies were posted again"
+        twitter.reject_duplicates, twitter.duplicate_rate = False, args.duplicate_rate
+        openai.unique_replies = False
+
+    if 'stream' in args.scenarios:
+        reset_counters(twitter, openai)
+        stop = threading.Event()
+        start = time.perf_counter()
+        runner = threading.Thread(target=lambda: results.append(bot.stream_community(
+            tracker=bot.TweetTracker(), stop=stop, post_bucket=TokenBucket(args.post_rate),
+            generate_workers=args.concurrency, batch_wait=0.5
+        )))
+        results = []
+        runner.start()
+        time.sleep(args.stream_seconds)
+        stop.set()
+        runner.join()
+        elapsed = time.perf_counter() - start
+        counters = {(name, labels): value for (name, labels), value
+                    in metrics.registry.counters.items() if name.startswith('stream_')}
+        discovery = metrics.registry.histograms.get(('stream_discovery_seconds', ()))
+        print(f"\n== stream_community ==")
+        print(f"  wall time: {elapsed:.2f}s, replies: {results[0] if results else 0}")
+        for (name, labels), value in sorted(counters.items()):
+            print(f"  {name}{dict(labels) or ''}: {value}")
+        if discovery is not None and discovery.count:
+            print(f"  discovery latency mean {discovery.sum / discovery.count * 1000:.1f} ms "
+                  f"(polling every N seconds averages N/2)")
+        print(f"  twitter calls: {dict(twitter.calls)}")
+
+    if 'trending' in args.scenarios:
+        reset_counters(twitter, openai)
+        latencies = []
+        found = 0
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            t0 = time.perf_counter()
+            found += len(bot.monitor_trending_topics() or [])
+            latencies.append(time.perf_counter() - t0)
+        report("monitor_trending_topics", latencies, 0,
+               time.perf_counter() - start, twitter, openai)
+        print(f"  tweets returned: {found}")
+
+    for (name, labels), histogram in metrics.registry.histograms.items():
+        if name == 'generation_seconds' and histogram.count:
+            print(f"\nGeneration latency ({dict(labels)['backend']}): "
+                  f"{histogram.count} requests, mean {histogram.sum / histogram.count * 1000:.0f} ms")
+    threads = getattr(bot.engine.backend, 'threads', None)
+    if threads is not None:
+        states = Counter((entry['purpose'], entry['state']) for entry in threads.threads.values())
+        print(f"Assistant threads: {dict(states)}, live on server: {len(openai.threads)}")
+    print(f"\nTwitter connections: {bot.twitter.connection_stats()}")
+    print(f"Rate-limit budgets: {bot.twitter.rate_limit_metrics()}")
+    print("\nToken spend (from run usage):\n" + format_report(bot.default_persona.token_ledger.summary()))
+    if args.metrics:
+        print("\n" + metrics.registry.render_prometheus())
+    twitter_server.stop()
+    openai_server.stop()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline throughput/latency benchmark for the bot")
+    parser.add_argument('--scenarios', nargs='+', default=['post', 'community', 'trending'],
+                        choices=['post', 'community', 'duplicates', 'stream', 'trending'])
+    parser.add_argument('--backend', default='assistants', choices=BACKENDS,
+                        help="generation backend to exercise")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=3)
+    parser.add_argument('--twitter-latency', type=float, default=0.05)
+    parser.add_argument('--openai-latency', type=float, default=0.05)
+    parser.add_argument('--run-latency', type=float, default=1.0,
+                        help="seconds before a fake Assistant run may finish")
+    parser.add_argument('--new-per-search', type=int, default=10)
+    parser.add_argument('--duplicate-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=int, default=None,
+                        help="fake per-endpoint Twitter limit per 15-minute window")
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--run-failure-rate', type=float, default=0.0)
+    parser.add_argument('--slow-rate', type=float, default=0.0,
+                        help="fraction of fake runs that take --slow-latency seconds")
+    parser.add_argument('--slow-latency', type=float, default=10.0)
+    parser.add_argument('--hedge', action='store_true',
+                        help="hedge post generations like scheduled slots do")
+    parser.add_argument('--post-rate', type=float, default=50.0,
+                        help="reply token-bucket rate (per second) during the benchmark")
+    parser.add_argument('--stream-seconds', type=float, default=5.0,
+                        help="how long the stream scenario runs")
+    parser.add_argument('--stream-rate', type=float, default=10.0,
+                        help="tweets per second on the fake filtered stream")
+    parser.add_argument('--stream-disconnect-after', type=int, default=20,
+                        help="tweets before the fake stream drops the connection")
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--metrics', action='store_true',
+                        help="print the instrumentation registry after the run")
+    run_benchmarks(parser.parse_args(argv))
+
+if __name__ == "__main__":
+    main()
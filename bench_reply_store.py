@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+import random
+import tempfile
+from reply_store import ReplyStore
+
+def bench_reply_store(count=1_000_000, batch_size=10_000):
+    """Insert and look up `count` tweet IDs in a fresh ReplyStore"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ReplyStore(os.path.join(tmp, 'bench.db'))
+        base = 1_800_000_000_000_000_000
+        ids = [base + i for i in range(count)]
+
+        print(f"Inserting {count:,} IDs (batches of {batch_size:,})...")
+        start = time.perf_counter()
+        now = time.time()
+        for i in range(0, count, batch_size):
+            store.add_many((tweet_id, now) for tweet_id in ids[i:i + batch_size])
+        elapsed = time.perf_counter() - start
+        print(f"  {elapsed:.2f}s total, {count / elapsed:,.0f} inserts/s")
+
+        single = min(count, 10_000)
+        print(f"Single mark_as_replied-style inserts ({single:,})...")
+        start = time.perf_counter()
+        for i in range(single):
+            store.add(base + count + i)
+        elapsed = time.perf_counter() - start
+        print(f"  {elapsed * 1e6 / single:.1f} us/insert")
+
+        lookups = min(count, 100_000)
+        print(f"Looking up {lookups:,} random IDs (half misses)...")
+        sample = random.sample(ids, lookups // 2) + [base - i - 1 for i in range(lookups // 2)]
+        random.shuffle(sample)
+        start = time.perf_counter()
+        hits = sum(store.contains(tweet_id) for tweet_id in sample)
+        elapsed = time.perf_counter() - start
+        print(f"  {elapsed * 1e6 / lookups:.1f} us/lookup, {hits:,} hits")
+
+        start = time.perf_counter()
+        store.close()
+        reopened = ReplyStore(os.path.join(tmp, 'bench.db'))
+        elapsed = time.perf_counter() - start
+        print(f"Reopen (startup) with {len(reopened):,} IDs: {elapsed * 1000:.1f} ms")
+        reopened.close()
+
+if __name__ == "__main__":
+    bench_reply_store(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,105 @@
+import os
+import re
+import sys
+import time
+import random
+from tweet_text import normalize, normalize_many, weighted_length
+
+BODIES = [
+    "Cardano's eUTXO model keeps DeFi transactions deterministic",
+    "DRMZ stake pool just minted another block! 🎉",
+    "Governance on Cardano is moving on-chain, one vote at a time",
+    "We are #1 in decentralization thanks to the community",
+    "Read more at https://cardano.org/stake-pool-operation/ before delegating",
+    "ブロックチェーンの未来はここにある",
+    "Hydra heads bring fast, cheap payments to Cardano 🚀🇯🇵",
+]
+TAGS = ["#Cardano", "#ADA", "#DRMZ", "#Web3", "#Staking", "#DeFi"]
+
+def sample(rng):
+    """Assistant-style output: metadata tags, quotes, lead-ins and hashtags"""
+    text = rng.choice(BODIES)
+    if rng.random() < 0.3:
+        text += " 【4:0†source】"
+    if rng.random() < 0.3:
+        text += " #" + rng.choice(["Cardano", "ADA"]) + " is the way."
+    tags = " ".join(rng.sample(TAGS, rng.randint(0, 3)))
+    if rng.random() < 0.4:
+        text = f'"{text}"'
+        if rng.random() < 0.5:
+            text = "Here's a tweet: " + text
+    return f"{text} {tags}".strip()
+
+def plain_sample(rng):
+    """The common reply: ASCII sentence, hashtags on their own line, nothing to strip"""
+    text = rng.choice([body for body in BODIES if body.isascii() and '://' not in body])
+    tags = " ".join(rng.sample(TAGS, rng.randint(0, 3)))
+    return f"{text}\n\n{tags}" if tags else text
+
+def legacy_clean(text):
+    """The cleanup steps the bot used before tweet_text.normalize"""
+    text = re.sub(r'【.*?】', '', text).strip()
+    if text.startswith('"') and text.endswith('"'):
+        text = text[1:-1].strip()
+    if '#' in text:
+        parts = text.split('#')
+        main_text = parts[0].strip()
+        hashtags = ['#' + tag.strip() for tag in parts[1:] if tag.strip()]
+        text = f"{main_text}\n\n{' '.join(hashtags)}"
+    if '"' in text:
+        text = text.split('"')[1]
+    return text, weighted_length(text)
+
+def bench_tweet_text(count=100_000, processes=os.cpu_count() or 1):
+    """Normalize `count` generated samples with the legacy steps, one by one and in batch"""
+    rng = random.Random(0)
+    texts = [sample(rng) for _ in range(count)]
+    print(f"Normalizing {count:,} samples...")
+
+    start = time.perf_counter()
+    for text in texts:
+        legacy_clean(text)
+    elapsed = time.perf_counter() - start
+    print(f"  legacy cleanup + length:  {elapsed * 1e6 / count:.1f} us/tweet")
+
+    start = time.perf_counter()
+    for text in texts:
+        normalize(text)
+    elapsed = time.perf_counter() - start
+    print(f"  normalize:                {elapsed * 1e6 / count:.1f} us/tweet")
+
+    plain = [plain_sample(rng) for _ in range(count)]
+    start = time.perf_counter()
+    for text in plain:
+        legacy_clean(text)
+    elapsed = time.perf_counter() - start
+    print(f"  legacy, plain replies:    {elapsed * 1e6 / count:.1f} us/tweet")
+
+    start = time.perf_counter()
+    for text in plain:
+        normalize(text)
+    elapsed = time.perf_counter() - start
+    print(f"  normalize, plain replies: {elapsed * 1e6 / count:.1f} us/tweet")
+
+    start = time.perf_counter()
+    tweets = normalize_many(texts)
+    elapsed = time.perf_counter() - start
+    print(f"  normalize_many:           {elapsed * 1e6 / count:.1f} us/tweet")
+
+    if processes > 1:
+        start = time.perf_counter()
+        normalize_many(texts, processes=processes)
+        elapsed = time.perf_counter() - start
+        print(f"  normalize_many x{processes:<2}:       {elapsed * 1e6 / count:.1f} us/tweet")
+
+    mismatches = sum(tweet.length != weighted_length(tweet.text) for tweet in tweets)
+    # Legacy output whose first paragraph differs from our body lost text,
+    # kept a lead-in or moved part of a sentence into the hashtags
+    damaged = sum(
+        tweet.body != legacy_clean(text)[0].split('\n\n')[0]
+        for text, tweet in zip(texts, tweets)
+    )
+    print(f"  length mismatches: {mismatches}, tweets the legacy steps mangled: {damaged:,}")
+
+if __name__ == "__main__":
+    bench_tweet_text(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
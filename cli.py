@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+
+log = logging.getLogger('morpheus')
+
+DEFAULT_CONFIG_FILE = 'morpheus.json'
+
+# Credentials the default account needs before it can post
+REQUIRED_ENV = ('API_KEY', 'API_KEY_SECRET', 'ACCESS_TOKEN', 'ACCESS_TOKEN_SECRET')
+
+def load_config(path=None):
+    """Apply a JSON config file of environment settings; returns the keys it set
+
+    The file is a flat object such as {"GENERATION_BACKEND": "chat",
+    "METRICS_PORT": 9100}. Variables already set in the environment or in
+    .env win, so the file holds defaults and the supervisor's environment
+    overrides them.
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    explicit = path or os.getenv('MORPHEUS_CONFIG')
+    path = explicit or DEFAULT_CONFIG_FILE
+    try:
+        with open(path, 'r') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        if explicit:
+            raise SystemExit(f"Config file not found: {path}")
+        return []
+    applied = []
+    for key, value in config.items():
+        if key not in os.environ:
+            os.environ[key] = value if isinstance(value, str) else json.dumps(value)
+            applied.append(key)
+    return applied
+
+def missing_credentials():
+    return [name for name in REQUIRED_ENV if not os.getenv(name)]
+
+def register_checks():
+    import metrics
+
+    metrics.register_check('credentials', lambda: not missing_credentials())
+
+def start_service(port=None):
+    """Logging, metrics exporters and the /healthz and /readyz endpoints"""
+    import metrics
+
+    if port is not None:
+        os.environ['METRICS_PORT'] = str(port)
+    metrics.start_exporters()
+    register_checks()
+
+def cmd_run(args):
+    """Run the posting schedule until stopped (the supervisor entry point)"""
+    import metrics
+
+    start_service(args.port)
+    # Not ready until the scheduler has queued its deadlines and replaces this
+    metrics.register_check('scheduler', lambda: False)
+    import morpheus_ai_twitter_bot as bot
+    from accounts import load_accounts
+
+    accounts = load_accounts(args.accounts)
+    if accounts:
+        bot.run_accounts(accounts, args.shard, args.shards, stream=args.stream)
+        return 1
+    missing = missing_credentials()
+    if args.stream and not os.getenv('BEARER_TOKEN'):
+        missing.append('BEARER_TOKEN')
+    if missing:
+        log.error("Missing credentials: %s", ', '.join(missing))
+        return 1
+    log.info("Starting Morpheus AI Twitter Bot")
+    bot.run_morpheus_bot(stream=args.stream)
+    return 1
+
+def cmd_post_now(args):
+    """Generate and post one tweet right away"""
+    import morpheus_ai_twitter_bot as bot
+
+    client = bot.verify_credentials()
+    if client is None:
+        return 1
+    return 0 if bot.generate_and_post_tweet(client, args.type) else 1
+
+def cmd_dry_run(args):
+    """Generate tweet candidates and print them without calling Twitter"""
+    import morpheus_ai_twitter_bot as bot
+    from tweet_text import normalize
+
+    candidates = bot.generate_tweet_candidates(args.type, count=args.count)
+    for text in candidates:
+        print(f"[{normalize(text).length:3d}] {text}\n")
+    if not candidates:
+        log.error("No usable %s tweet generated", args.type)
+    return 0 if candidates else 1
+
+def cmd_check(args):
+    """Validate the configuration and print readiness as JSON"""
+    import metrics
+    from accounts import load_accounts
+
+    register_checks()
+    accounts = load_accounts(args.accounts)
+    metrics.register_check('accounts', lambda: all(account.assistant_id for account in accounts))
+    ready, checks = metrics.readiness()
+    print(json.dumps({'ready': ready, 'checks': checks,
+                      'accounts': [account.name for account in accounts] or ['default'],
+                      'backend': os.getenv('GENERATION_BACKEND', 'assistants')}))
+    return 0 if ready else 1
+
+def cmd_usage(args):
+    """Print daily token spend and cost per posted tweet of each account"""
+    from accounts import Account, load_accounts
+    from token_usage import TokenLedger, format_report
+
+    for account in load_accounts(args.accounts) or [Account('default', None)]:
+        print(f"== {account.name} ==")
+        print(format_report(TokenLedger(account.path('token_usage.json')).summary(args.days)))
+    return 0
+
+def measure_startup(runs, command=('check',)):
+    """Wall-clock milliseconds of fresh `cli.py <command>` processes"""
+    script = os.path.abspath(__file__)
+    import subprocess
+
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, script, *command], stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings)
+
+def cmd_benchmark(args):
+    """Offline benchmark against local fake APIs (see bench_bot.py), or cold start"""
+    if args.startup:
+        baseline = measure_startup(args.startup, ('--version',))
+        timings = measure_startup(args.startup, ('check',))
+        print(f"interpreter + cli.py --version: min {baseline[0]:.0f} ms, "
+              f"median {baseline[len(baseline) // 2]:.0f} ms")
+        print(f"cold start (cli.py check):      min {timings[0]:.0f} ms, "
+              f"median {timings[len(timings) // 2]:.0f} ms")
+        return 0
+    import bench_bot
+
+    bench_bot.main(args.bench_args)
+    return 0
+
+def cmd_simulate(args):
+    """Replay days of the schedule on a simulated clock against fake APIs"""
+    import replay
+
+    replay.main(args.bench_args)
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='morpheus', description="Morpheus AI Twitter bot")
+    parser.add_argument('--version', action='version', version='morpheus 1.0')
+    parser.add_argument('--config', help=f"JSON file of settings (default {DEFAULT_CONFIG_FILE} "
+                                         "or MORPHEUS_CONFIG); the environment overrides it")
+    parser.add_argument('--log-level', help="overrides LOG_LEVEL")
+    parser.add_argument('--backend', choices=['assistants', 'chat', 'stub'],
+                        help="overrides GENERATION_BACKEND")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help=cmd_run.__doc__)
+    run.add_argument('--accounts', help="accounts file (default ACCOUNTS_FILE or accounts.json)")
+    run.add_argument('--shard', type=int, help="shard index (default SHARD_INDEX)")
+    run.add_argument('--shards', type=int, help="shard count (default SHARD_COUNT)")
+    run.add_argument('--port', type=int, help="port for /metrics, /healthz and /readyz "
+                                              "(default METRICS_PORT)")
+    run.add_argument('--stream', action='store_true',
+                     help="also reply to community tweets from the filtered stream")
+    run.set_defaults(handler=cmd_run)
+
+    post_now = commands.add_parser('post-now', help=cmd_post_now.__doc__)
+    post_now.add_argument('--type', default='test', help="tweet type (morning, community, ...)")
+    post_now.set_defaults(handler=cmd_post_now)
+
+    dry_run = commands.add_parser('dry-run', help=cmd_dry_run.__doc__)
+    dry_run.add_argument('--type', default='test', help="tweet type (morning, community, ...)")
+    dry_run.add_argument('--count', type=int, default=3, help="candidates to generate")
+    dry_run.set_defaults(handler=cmd_dry_run)
+
+    check = commands.add_parser('check', help=cmd_check.__doc__)
+    check.add_argument('--accounts', help="accounts file (default ACCOUNTS_FILE or accounts.json)")
+    check.set_defaults(handler=cmd_check)
+
+    usage = commands.add_parser('usage', help=cmd_usage.__doc__)
+    usage.add_argument('--accounts', help="accounts file (default ACCOUNTS_FILE or accounts.json)")
+    usage.add_argument('--days', type=int, default=7, help="most recent days to show")
+    usage.set_defaults(handler=cmd_usage)
+
+    benchmark = commands.add_parser('benchmark', help=cmd_benchmark.__doc__)
+    benchmark.add_argument('--startup', type=int, metavar='RUNS',
+                           help="measure cold start over RUNS fresh processes instead; "
+                                "other options are passed to bench_bot.py")
+    benchmark.set_defaults(handler=cmd_benchmark)
+
+    simulate = commands.add_parser('simulate', help=cmd_simulate.__doc__,
+                                   description="Options (--days, --start, ...) are passed to replay.py")
+    simulate.set_defaults(handler=cmd_simulate)
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if extra and args.command not in ('benchmark', 'simulate'):
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    args.bench_args = extra
+    load_config(args.config)
+    if args.log_level:
+        os.environ['LOG_LEVEL'] = args.log_level
+    if args.backend:
+        os.environ['GENERATION_BACKEND'] = args.backend
+    import metrics
+
+    metrics.setup_logging()
+    try:
+        return args.handler(args)
+    except KeyboardInterrupt:
+        log.info("Stopped")
+        return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import time as _time
+import threading
+from contextlib import contextmanager
+
+class SystemClock:
+    """Wall-clock time and real sleeps"""
+
+    simulated = False
+
+    def time(self):
+        return _time.time()
+
+    def sleep(self, seconds):
+        _time.sleep(seconds)
+
+class SimulatedClock:
+    """Virtual time that only moves when slept through or advanced
+
+    `sleep` returns at once after moving the time forward, so a week of
+    schedule runs as fast as the work done in between.
+    """
+
+    simulated = True
+
+    def __init__(self, start):
+        self.now = float(start)
+        self.sleeps = 0
+        self._lock = threading.Lock()
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        with self._lock:
+            self.now += max(seconds, 0)
+            self.sleeps += 1
+
+    def advance(self, seconds):
+        with self._lock:
+            self.now += max(seconds, 0)
+
+_clock = SystemClock()
+
+def get_clock():
+    return _clock
+
+def set_clock(new_clock):
+    """Replace the process-wide clock; returns the previous one"""
+    global _clock
+    previous, _clock = _clock, new_clock
+    return previous
+
+@contextmanager
+def using(new_clock):
+    """Run the enclosed code on `new_clock`, e.g. a SimulatedClock for replays"""
+    previous = set_clock(new_clock)
+    try:
+        yield new_clock
+    finally:
+        set_clock(previous)
+
+# Epoch seconds and sleeps for code whose timing a replay should control,
+# including rate-limit windows (their resets are epoch times); durations of
+# real work (deadlines, latencies) stay on the time module
+def time():
+    return _clock.time()
+
+def sleep(seconds):
+    _clock.sleep(seconds)
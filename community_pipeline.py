@@ -0,0 +1,245 @@
+import time
+import asyncio
+import logging
+from types import SimpleNamespace
+import metrics
+from rate_limits import request_priority, PRIORITY_REPLY
+from search_cursors import fetch_new_tweets
+from job_queue import post_once, is_duplicate
+from response_cache import AlreadyAnswered
+
+log = logging.getLogger(__name__)
+
+# Marks the end of a queue for the workers reading it
+_DONE = object()
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens without waiting, returns False if not enough are available"""
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens=1):
+        """Wait until `tokens` are available and take them"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+class CommunityPipeline:
+    """Staged reply pipeline for community tweets
+
+    search -> filter/dedupe -> generate (bounded concurrency) -> post (token bucket)
+
+    Stages are connected by bounded queues, so generation of the next
+    replies overlaps with the posting cooldown of the current one.
+    `respond` is a coroutine function taking a tweet and returning the
+    reply text (or None).
+
+    With a `candidates` queue (tweet_scoring.CandidateQueue) accepted
+    tweets are scored and kept across runs, and each run replies only to
+    the `max_replies` highest-value pending tweets instead of everything
+    the search returned.
+
+    With a `jobs` queue every accepted tweet becomes a durable reply job
+    keyed by tweet id: generated text is stored before posting, posting
+    is deduplicated, and jobs interrupted by a crash are resumed by the
+    next `run_once`.
+
+    Tweets for which `respond` raises AlreadyAnswered (a near-identical
+    tweet got the same reply) are marked as handled without posting. A
+    reply Twitter still rejects as duplicate content is not counted as
+    posted; `forget(tweet)` is called so the retry generates a new one.
+    """
+
+    def __init__(self, client, tracker, respond, post_bucket=None, cursors=None,
+                 query="(Cardano OR ADA OR Web3) -is:retweet lang:en", max_results=10,
+                 min_likes=5, generate_workers=3, post_workers=1,
+                 generate_queue_depth=10, post_queue_depth=5, jobs=None,
+                 candidates=None, max_replies=3, forget=None):
+        self.client = client
+        self.tracker = tracker
+        self.respond = respond
+        self.forget = forget
+        self.jobs = jobs
+        self.candidates = candidates
+        self.max_replies = max_replies
+        self.post_bucket = post_bucket or TokenBucket(rate=1 / 60, capacity=1)
+        self.cursors = cursors
+        self.query = query
+        self.max_results = max_results
+        self.min_likes = min_likes
+        self.generate_workers = generate_workers
+        self.post_workers = post_workers
+        self.generate_queue_depth = generate_queue_depth
+        self.post_queue_depth = post_queue_depth
+        self.in_flight = set()
+        self.posted = 0
+
+    async def search(self):
+        """Fetch tweets newer than the query cursor (the tweepy client is blocking, so use a thread)"""
+        return await asyncio.to_thread(
+            fetch_new_tweets,
+            self.client,
+            self.query,
+            self.cursors,
+            max_results=self.max_results,
+            tweet_fields=['public_metrics', 'created_at', 'author_id']
+        )
+
+    def accept(self, tweet):
+        """Filter for engaged tweets we have not replied to and are not handling"""
+        if tweet.public_metrics['like_count'] < self.min_likes:
+            return False
+        return self.available(tweet)
+
+    def available(self, tweet):
+        return tweet.id not in self.in_flight and not self.tracker.already_replied(tweet.id)
+
+    def select(self, tweets):
+        """Accepted tweets to reply to this run, best first when candidates are queued"""
+        accepted = [tweet for tweet in tweets if self.accept(tweet)]
+        if self.candidates is None:
+            return accepted
+        self.candidates.push_many(accepted)
+        return self.candidates.take(self.max_replies, accept=self.available)
+
+    @staticmethod
+    def job_key(tweet_id):
+        return f"reply:{tweet_id}"
+
+    def resume(self, limit=100):
+        """Unfinished reply jobs from earlier runs as (tweet, stored reply or None)"""
+        if self.jobs is None:
+            return []
+        resumed = []
+        for job in self.jobs.claim('reply', limit):
+            tweet = SimpleNamespace(id=job['payload']['tweet_id'], text=job['payload']['text'])
+            if tweet.id not in self.in_flight:
+                resumed.append((tweet, job['result']))
+        if resumed:
+            log.info("Resuming %d unfinished reply jobs", len(resumed))
+        return resumed
+
+    async def _filter(self, tweets, generate_queue, post_queue, resumed=()):
+        for tweet, response in resumed:
+            self.in_flight.add(tweet.id)
+            if response:
+                await post_queue.put((tweet, response))
+            else:
+                await generate_queue.put(tweet)
+        for tweet in self.select(tweets):
+            if self.jobs is not None:
+                key = self.job_key(tweet.id)
+                if not self.jobs.enqueue(key, 'reply', {'tweet_id': tweet.id, 'text': tweet.text}):
+                    # Known job: finished ones are skipped, unfinished ones are resumed
+                    continue
+            self.in_flight.add(tweet.id)
+            await generate_queue.put(tweet)
+        for _ in range(self.generate_workers):
+            await generate_queue.put(_DONE)
+
+    async def _generate(self, generate_queue, post_queue):
+        while True:
+            tweet = await generate_queue.get()
+            if tweet is _DONE:
+                break
+            try:
+                response = await self.respond(tweet)
+            except AlreadyAnswered:
+                # A near-identical tweet already got this reply; Twitter would reject it again
+                log.info("Skipping tweet %s, a near-identical tweet was answered", tweet.id)
+                metrics.inc('replies_skipped_total', reason='already_answered')
+                self.tracker.mark_as_replied(tweet.id)
+                if self.jobs is not None:
+                    self.jobs.cancel(self.job_key(tweet.id), "near-identical tweet already answered")
+                self.in_flight.discard(tweet.id)
+                continue
+            except Exception as e:
+                log.error("Error generating reply to %s: %s", tweet.id, e)
+                response = None
+            if response:
+                if self.jobs is not None:
+                    self.jobs.mark_generated(self.job_key(tweet.id), response)
+                await post_queue.put((tweet, response))
+            else:
+                if self.jobs is not None:
+                    self.jobs.fail(self.job_key(tweet.id), "no reply generated")
+                self.in_flight.discard(tweet.id)
+
+    async def _post(self, post_queue):
+        while True:
+            item = await post_queue.get()
+            if item is _DONE:
+                break
+            tweet, response = item
+            try:
+                await self.post_bucket.acquire()
+                log.info("Responding to tweet %s: %s...", tweet.id, tweet.text[:100])
+                # Replies queue behind scheduled posts for the create_tweet budget
+                with request_priority(PRIORITY_REPLY):
+                    if self.jobs is not None:
+                        await asyncio.to_thread(
+                            post_once, self.jobs, self.client, self.job_key(tweet.id),
+                            response, tweet.id
+                        )
+                    else:
+                        await asyncio.to_thread(
+                            self.client.create_tweet,
+                            text=response,
+                            in_reply_to_tweet_id=tweet.id
+                        )
+                self.tracker.mark_as_replied(tweet.id)
+                self.posted += 1
+            except Exception as e:
+                log.error("Error posting reply to %s: %s", tweet.id, e)
+                if self.forget is not None and is_duplicate(e):
+                    self.forget(tweet)
+            finally:
+                self.in_flight.discard(tweet.id)
+
+    async def process(self, tweets, resumed=()):
+        """Run already-fetched tweets (and resumed jobs) through filter, generate and post stages"""
+        generate_queue = asyncio.Queue(self.generate_queue_depth)
+        post_queue = asyncio.Queue(self.post_queue_depth)
+        posted_before = self.posted
+
+        generators = [
+            asyncio.create_task(self._generate(generate_queue, post_queue))
+            for _ in range(self.generate_workers)
+        ]
+        posters = [
+            asyncio.create_task(self._post(post_queue))
+            for _ in range(self.post_workers)
+        ]
+
+        await self._filter(tweets, generate_queue, post_queue, resumed)
+        await asyncio.gather(*generators)
+        for _ in range(self.post_workers):
+            await post_queue.put(_DONE)
+        await asyncio.gather(*posters)
+        return self.posted - posted_before
+
+    async def run_once(self):
+        """Search once and drain the results through the pipeline"""
+        log.info("Monitoring Cardano community tweets...")
+        resumed = self.resume()
+        return await self.process(await self.search(), resumed)
@@ -0,0 +1,43 @@
+import time
+import contextvars
+from contextlib import contextmanager
+
+# Monotonic time by which the current unit of work (e.g. one slot post) must finish
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+class DeadlineExceeded(TimeoutError):
+    """The enclosing deadline passed before the call could finish"""
+
+@contextmanager
+def within(seconds=None, reserve=0.0):
+    """Run the enclosed calls under a deadline `seconds` from now
+
+    Never extends the current deadline. `reserve` keeps that many seconds
+    of it for work after the block, e.g. posting after generation. Like
+    rate_limits.request_priority, the deadline follows the calls into
+    asyncio.to_thread and the generation engine's loop.
+    """
+    current = _deadline.get()
+    at = None if seconds is None else time.monotonic() + seconds
+    if current is not None:
+        current -= reserve
+        at = current if at is None else min(at, current)
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining():
+    """Seconds left before the current deadline (may be negative), None without one"""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+def bound(timeout, what='call'):
+    """`timeout` capped by the time left; raises DeadlineExceeded once none is left"""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded(f"No time left for {what}")
+    return left if timeout is None else min(timeout, left)
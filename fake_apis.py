@@ -0,0 +1,690 @@
+import re
+import json
+import time
+import random
+import threading
+import itertools
+from collections import Counter
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import clock
+from prompts import estimate_tokens
+
+class Stream:
+    """Chunked response body; `chunks` is an iterable of bytes written as produced"""
+
+    def __init__(self, chunks, content_type='text/event-stream'):
+        self.chunks = chunks
+        self.content_type = content_type
+
+def timestamp(seconds):
+    """ISO 8601 UTC time with milliseconds, as in Twitter's created_at"""
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds)) + f".{int(seconds % 1 * 1000):03d}Z"
+
+def sse(payload, event=None):
+    data = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+    prefix = b'event: ' + event.encode('ascii') + b'\n' if event else b''
+    return prefix + b'data: ' + data + b'\n\n'
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """Routes requests to `server.api.handle(method, path, query, body)`"""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without this every response
+    # on a kept-alive connection waits out the client's delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            payload = {}
+        status, data, headers = self.server.api.handle(
+            method, url.path, parse_qs(url.query), payload
+        )
+        if isinstance(data, Stream):
+            self._stream(status, data, headers)
+            return
+        raw = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _stream(self, status, stream, headers):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.send_header('Content-Type', stream.content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for chunk in stream.chunks:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeServer:
+    """Runs a fake API on a local port in a background thread"""
+
+    def __init__(self, api, host='127.0.0.1', port=0):
+        self.api = api
+        self.httpd = ThreadingHTTPServer((host, port), FakeHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.api = api
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class FakeAPI:
+    """Shared knobs of the fake APIs: latency, failures, 429s and call counters"""
+
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, rate_limit=None,
+                 rate_window=900, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.windows = {}
+        self.lock = threading.RLock()
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(self.latency + self.random.uniform(-self.jitter, self.jitter), 0))
+
+    def limit_headers(self, endpoint):
+        """Count a call against `endpoint`; returns (over limit, x-rate-limit headers)"""
+        if self.rate_limit is None:
+            return False, {}
+        now = clock.time()
+        with self.lock:
+            reset, used = self.windows.get(endpoint, (0, 0))
+            if now >= reset:
+                reset, used = int(now) + self.rate_window, 0
+            used += 1
+            self.windows[endpoint] = (reset, used)
+        headers = {
+            'x-rate-limit-limit': self.rate_limit,
+            'x-rate-limit-remaining': max(self.rate_limit - used, 0),
+            'x-rate-limit-reset': reset,
+        }
+        return used > self.rate_limit, headers
+
+    def handle(self, method, path, query, body):
+        self.delay()
+        for route_method, pattern, name in self.routes:
+            match = pattern.match(path)
+            if route_method == method and match:
+                with self.lock:
+                    self.calls[name] += 1
+                limited, headers = self.limit_headers(name)
+                if limited:
+                    return 429, {'title': 'Too Many Requests'}, headers
+                if self.failure_rate and self.random.random() < self.failure_rate:
+                    return 503, {'title': 'Service Unavailable'}, headers
+                status, data = getattr(self, name)(match, query, body)
+                return status, data, headers
+        return 404, {'title': 'Not Found', 'path': path}, {}
+
+TOPIC_WORDS = ['Cardano', 'ADA', 'Web3', 'DeFi', 'DRMZ']
+
+class FakeTwitter(FakeAPI):
+    """Twitter API v2 stand-in for search, posting and user timelines
+
+    Also answers the /search_tweets and /post_reply operations described
+    in openapi.json. Each search produces `new_per_search` new tweets, so
+    since_id cursors behave like on a live stream. With `reject_duplicates`
+    posting the same text twice fails with 403 like on Twitter.
+
+    The filtered stream is a chunked response of newline-delimited tweets,
+    `stream_rate` per second, each matching every rule. Without tweets it
+    sends keep-alive newlines; after `stream_disconnect_after` tweets the
+    server ends the response so clients have to reconnect.
+
+    Tweet and post times come from the clock module, so under a replay's
+    simulated clock they are in virtual time.
+    """
+
+    def __init__(self, new_per_search=10, duplicate_rate=0.0, reject_duplicates=False,
+                 stream_rate=10.0, stream_disconnect_after=None, keep_alive=1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.new_per_search = new_per_search
+        self.duplicate_rate = duplicate_rate
+        self.reject_duplicates = reject_duplicates
+        self.stream_rate = stream_rate
+        self.stream_disconnect_after = stream_disconnect_after
+        self.keep_alive = keep_alive
+        self.ids = itertools.count(1_800_000_000_000_000_000)
+        self.rule_ids = itertools.count(1_600_000_000_000_000_000)
+        self.tweets = []
+        self.posted = []
+        self.rules = {}
+        self.routes = [
+            ('GET', re.compile(r'^/2/tweets/search/stream/rules$'), 'get_stream_rules'),
+            ('POST', re.compile(r'^/2/tweets/search/stream/rules$'), 'change_stream_rules'),
+            ('GET', re.compile(r'^/2/tweets/search/stream$'), 'filtered_stream'),
+            ('GET', re.compile(r'^/2/tweets/search/recent$'), 'search_recent_tweets'),
+            ('POST', re.compile(r'^/2/tweets$'), 'create_tweet'),
+            ('GET', re.compile(r'^/2/users/me$'), 'get_me'),
+            ('GET', re.compile(r'^/2/users/([^/]+)/tweets$'), 'get_users_tweets'),
+            ('GET', re.compile(r'^/search_tweets$'), 'search_tweets'),
+            ('POST', re.compile(r'^/post_reply$'), 'post_reply'),
+        ]
+
+    def make_tweet(self, age=None):
+        """A new tweet, `age` seconds old (default: anywhere in the last 4 hours)"""
+        with self.lock:
+            tweet_id = next(self.ids)
+            if self.tweets and self.random.random() < self.duplicate_rate:
+                text = self.random.choice(self.tweets)['text']
+            else:
+                words = self.random.sample(TOPIC_WORDS, 2)
+                text = f"{words[0]} and {words[1]} update #{tweet_id % 1000} " \
+                       f"https://t.co/{tweet_id % 99991}"
+            tweet = {
+                'id': str(tweet_id),
+                'text': text,
+                'edit_history_tweet_ids': [str(tweet_id)],
+                'author_id': str(self.random.randrange(1, 500)),
+                # Search results span the last few hours, as on the real API
+                'created_at': timestamp(
+                    clock.time() - (self.random.randrange(0, 4 * 3600) if age is None else age)
+                ),
+                'public_metrics': {
+                    'like_count': self.random.randrange(0, 200),
+                    'retweet_count': self.random.randrange(0, 50),
+                    'reply_count': self.random.randrange(0, 20),
+                    'quote_count': self.random.randrange(0, 10),
+                },
+            }
+            self.tweets.append(tweet)
+        return tweet
+
+    def get_stream_rules(self, match, query, body):
+        with self.lock:
+            rules = list(self.rules.values())
+        meta = {'sent': timestamp(time.time()), 'result_count': len(rules)}
+        return 200, ({'data': rules, 'meta': meta} if rules else {'meta': meta})
+
+    def change_stream_rules(self, match, query, body):
+        summary = {}
+        with self.lock:
+            if 'delete' in body:
+                ids = body['delete'].get('ids', [])
+                deleted = [self.rules.pop(rule_id) for rule_id in ids if rule_id in self.rules]
+                summary = {'deleted': len(deleted), 'not_deleted': len(ids) - len(deleted)}
+                data = None
+            else:
+                data = []
+                for rule in body.get('add', []):
+                    rule = dict(rule, id=str(next(self.rule_ids)))
+                    self.rules[rule['id']] = rule
+                    data.append(rule)
+                summary = {'created': len(data), 'not_created': 0,
+                           'valid': len(data), 'invalid': 0}
+        meta = {'sent': timestamp(time.time()), 'summary': summary}
+        return (201 if data else 200), ({'data': data, 'meta': meta} if data else {'meta': meta})
+
+    def filtered_stream(self, match, query, body):
+        def chunks():
+            sent = 0
+            while self.stream_disconnect_after is None or sent < self.stream_disconnect_after:
+                if not self.stream_rate:
+                    time.sleep(self.keep_alive)
+                    yield b'\r\n'
+                    continue
+                time.sleep(1 / self.stream_rate)
+                tweet = self.make_tweet(age=0)
+                with self.lock:
+                    rules = [{'id': rule['id'], 'tag': rule.get('tag')}
+                             for rule in self.rules.values()]
+                yield json.dumps({'data': tweet, 'matching_rules': rules}).encode('utf-8') + b'\r\n'
+                sent += 1
+
+        return 200, Stream(chunks(), content_type='application/json')
+
+    def search_recent_tweets(self, match, query, body):
+        for _ in range(self.new_per_search):
+            self.make_tweet()
+        since_id = int(query.get('since_id', ['0'])[0])
+        max_results = int(query.get('max_results', ['10'])[0])
+        with self.lock:
+            fresh = [t for t in reversed(self.tweets) if int(t['id']) > since_id]
+        page = fresh[:max_results]
+        meta = {'result_count': len(page)}
+        if page:
+            meta['newest_id'] = page[0]['id']
+            meta['oldest_id'] = page[-1]['id']
+        return 200, ({'data': page, 'meta': meta} if page else {'meta': meta})
+
+    def create_tweet(self, match, query, body):
+        with self.lock:
+            if self.reject_duplicates and any(p.get('text') == body.get('text') for p in self.posted):
+                return 403, {
+                    'title': 'Forbidden',
+                    'detail': 'You are not allowed to create a Tweet with duplicate content.',
+                    'type': 'about:blank',
+                    'status': 403,
+                }
+            tweet_id = str(next(self.ids))
+            self.posted.append(dict(body, id=tweet_id, posted_at=clock.time()))
+        tweet = {'id': tweet_id, 'text': body.get('text', ''), 'edit_history_tweet_ids': [tweet_id]}
+        return 201, {'data': tweet}
+
+    def get_me(self, match, query, body):
+        return 200, {'data': {'id': '1', 'name': 'Morpheus AI', 'username': 'DRMZ_Agent'}}
+
+    def get_users_tweets(self, match, query, body):
+        max_results = int(query.get('max_results', ['10'])[0])
+        data = []
+        with self.lock:
+            for p in reversed(self.posted[-max_results:]):
+                tweet = {'id': p['id'], 'text': p.get('text', ''), 'edit_history_tweet_ids': [p['id']]}
+                reply_to = (p.get('reply') or {}).get('in_reply_to_tweet_id')
+                if reply_to:
+                    tweet['referenced_tweets'] = [{'type': 'replied_to', 'id': str(reply_to)}]
+                data.append(tweet)
+        return 200, {'data': data, 'meta': {'result_count': len(data)}}
+
+    def search_tweets(self, match, query, body):
+        status, data = self.search_recent_tweets(match, {}, body)
+        return status, data.get('data', [])
+
+    def post_reply(self, match, query, body):
+        status, data = self.create_tweet(
+            match, query, {'text': body.get('reply_text'),
+                           'reply': {'in_reply_to_tweet_id': body.get('tweet_id')}}
+        )
+        return 200, data['data']
+
+class FakeOpenAI(FakeAPI):
+    """OpenAI Assistants (threads, runs, messages) and Chat Completions stand-in
+
+    Every run walks through `status_sequence`, one status per retrieve,
+    and is not allowed to leave non-terminal states before `run_latency`
+    seconds have passed. Set `run_failure_rate` for runs that end in
+    'failed'. Runs requested with `stream=True` emit Assistant stream
+    events instead. Chat completions take `run_latency` too, spread over
+    the chunks when streamed. A `slow_rate` fraction of runs and
+    completions take `slow_latency` instead, the tail that hedging cuts.
+    """
+
+    def __init__(self, run_latency=1.0, status_sequence=('queued', 'in_progress', 'completed'),
+                 run_failure_rate=0.0, reply_text=None, slow_rate=0.0, slow_latency=10.0,
+                 unique_replies=False, **kwargs):
+        super().__init__(**kwargs)
+        self.run_latency = run_latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.status_sequence = list(status_sequence)
+        self.run_failure_rate = run_failure_rate
+        self.reply_text = reply_text or (
+            "The eUTXO model brings deterministic precision to Cardano DeFi.\n\n#Cardano #DeFi"
+        )
+        self.unique_replies = unique_replies
+        self.reply_numbers = itertools.count(1)
+        self.ids = itertools.count(1)
+        self.runs = {}
+        self.threads = {}
+        self.routes = [
+            ('POST', re.compile(r'^/v1/threads$'), 'create_thread'),
+            ('POST', re.compile(r'^/v1/threads/runs$'), 'create_and_run'),
+            ('DELETE', re.compile(r'^/v1/threads/([^/]+)$'), 'delete_thread'),
+            ('POST', re.compile(r'^/v1/threads/([^/]+)/messages$'), 'create_message'),
+            ('GET', re.compile(r'^/v1/threads/([^/]+)/messages$'), 'list_messages'),
+            ('POST', re.compile(r'^/v1/threads/([^/]+)/runs$'), 'create_run'),
+            ('GET', re.compile(r'^/v1/threads/([^/]+)/runs/([^/]+)$'), 'retrieve_run'),
+            ('POST', re.compile(r'^/v1/threads/([^/]+)/runs/([^/]+)/submit_tool_outputs$'),
+             'submit_tool_outputs'),
+            ('POST', re.compile(r'^/v1/threads/([^/]+)/runs/([^/]+)/cancel$'), 'cancel_run'),
+            ('GET', re.compile(r'^/v1/assistants/([^/]+)$'), 'retrieve_assistant'),
+            ('POST', re.compile(r'^/v1/chat/completions$'), 'chat_completion'),
+        ]
+
+    def completion_text(self):
+        """`reply_text`, numbered with `unique_replies` so no two completions are identical"""
+        if not self.unique_replies:
+            return self.reply_text
+        return f"{self.reply_text} {next(self.reply_numbers)}"
+
+    def request_latency(self):
+        with self.lock:
+            slow = self.slow_rate and self.random.random() < self.slow_rate
+        return self.slow_latency if slow else self.run_latency
+
+    def new_id(self, prefix):
+        with self.lock:
+            return f"{prefix}_{next(self.ids)}"
+
+    def run_object(self, run):
+        return {
+            'id': run['id'],
+            'object': 'thread.run',
+            'thread_id': run['thread_id'],
+            'assistant_id': run['assistant_id'],
+            'status': run['status'],
+            'created_at': int(run['created']),
+            'model': 'fake-model',
+            'instructions': '',
+            'tools': [],
+            'parallel_tool_calls': True,
+            'required_action': run.get('required_action'),
+            'usage': run.get('usage'),
+        }
+
+    def step_object(self, run, step_id, message_id, status):
+        return {
+            'id': step_id,
+            'object': 'thread.run.step',
+            'run_id': run['id'],
+            'thread_id': run['thread_id'],
+            'assistant_id': run['assistant_id'],
+            'type': 'message_creation',
+            'status': status,
+            'step_details': {'type': 'message_creation',
+                             'message_creation': {'message_id': message_id}},
+            'created_at': int(run['created']),
+            'usage': run.get('usage') if status == 'completed' else None,
+        }
+
+    def message_object(self, thread_id, message_id, role, text):
+        return {
+            'id': message_id,
+            'object': 'thread.message',
+            'created_at': int(time.time()),
+            'thread_id': thread_id,
+            'role': role,
+            'status': 'completed',
+            'content': [{'type': 'text', 'text': {'value': text, 'annotations': []}}],
+            'attachments': [],
+            'metadata': {},
+        }
+
+    def thread_object(self, thread_id):
+        return {'id': thread_id, 'object': 'thread', 'created_at': int(time.time()), 'metadata': {}}
+
+    def start_run(self, thread_id, assistant_id):
+        run = {
+            'id': self.new_id('run'),
+            'thread_id': thread_id,
+            'assistant_id': assistant_id,
+            'created': time.time(),
+            'latency': self.request_latency(),
+            'step': 0,
+            'status': self.status_sequence[0],
+            'fails': self.random.random() < self.run_failure_rate,
+        }
+        with self.lock:
+            self.runs[run['id']] = run
+            self.threads.setdefault(thread_id, [])
+        return run
+
+    def advance(self, run):
+        if run['status'] in ('completed', 'failed', 'cancelled', 'expired'):
+            return
+        next_step = min(run['step'] + 1, len(self.status_sequence) - 1)
+        status = self.status_sequence[next_step]
+        terminal = status in ('completed', 'failed', 'cancelled', 'expired')
+        if terminal and time.time() - run['created'] < run['latency']:
+            return
+        run['step'] = next_step
+        if status == 'requires_action':
+            run['required_action'] = {
+                'type': 'submit_tool_outputs',
+                'submit_tool_outputs': {'tool_calls': [{
+                    'id': self.new_id('call'),
+                    'type': 'function',
+                    'function': {'name': 'lookup', 'arguments': '{}'},
+                }]},
+            }
+        if status == 'completed' and run['fails']:
+            status = 'failed'
+        run['status'] = status
+        if status == 'completed':
+            with self.lock:
+                # The thread (or its last messages when truncated) is the run's context
+                context = self.threads.get(run['thread_id'], [])[-run.get('last_messages', 0):]
+                prompt_tokens = sum(estimate_tokens(message['content'][0]['text']['value'])
+                                    for message in context)
+                text = self.completion_text()
+                completion_tokens = estimate_tokens(text)
+                run['usage'] = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                                'total_tokens': prompt_tokens + completion_tokens}
+                self.threads.setdefault(run['thread_id'], []).append(self.message_object(
+                    run['thread_id'], self.new_id('msg'), 'assistant', text
+                ))
+
+    def create_thread(self, match, query, body):
+        thread_id = self.new_id('thread')
+        with self.lock:
+            self.threads[thread_id] = []
+        return 200, self.thread_object(thread_id)
+
+    def delete_thread(self, match, query, body):
+        with self.lock:
+            self.threads.pop(match.group(1), None)
+        return 200, {'id': match.group(1), 'object': 'thread.deleted', 'deleted': True}
+
+    def create_and_run(self, match, query, body):
+        thread_id = self.new_id('thread')
+        with self.lock:
+            self.threads[thread_id] = [
+                self.message_object(thread_id, self.new_id('msg'), 'user', str(message.get('content', '')))
+                for message in (body.get('thread') or {}).get('messages') or []
+            ]
+        run = self.start_run(thread_id, body.get('assistant_id'))
+        if body.get('stream'):
+            return 200, Stream(self.run_events(run, new_thread=True))
+        return 200, self.run_object(run)
+
+    def run_events(self, run, new_thread=False, new_run=True):
+        """Assistant stream events for `run` until it completes, fails or needs tool outputs"""
+        if new_thread:
+            yield sse(self.thread_object(run['thread_id']), 'thread.created')
+        if new_run:
+            yield sse(self.run_object(run), 'thread.run.created')
+        # The run's message-creation step reports before the run does, as on the real API
+        step_id, step_message_id = self.new_id('step'), self.new_id('msg')
+        step_started = False
+        status = None
+        while True:
+            with self.lock:
+                self.advance(run)
+                changed = run['status'] != status
+                status = run['status']
+                snapshot = self.run_object(run)
+                message = self.threads.get(run['thread_id'], [None])[-1]
+            if not changed:
+                time.sleep(0.02)
+                continue
+            if status != 'queued' and not step_started:
+                step_started = True
+                step = self.step_object(run, step_id, step_message_id, 'in_progress')
+                yield sse(step, 'thread.run.step.created')
+                yield sse(step, 'thread.run.step.in_progress')
+            if status in ('failed', 'cancelled', 'expired'):
+                yield sse(self.step_object(run, step_id, step_message_id, status),
+                          f'thread.run.step.{status}')
+            if status == 'completed':
+                text = message['content'][0]['text']['value']
+                yield sse(dict(message, status='in_progress', content=[]), 'thread.message.created')
+                for index, piece in enumerate(text.split(' ')):
+                    yield sse({
+                        'id': message['id'],
+                        'object': 'thread.message.delta',
+                        'delta': {'content': [{
+                            'index': 0, 'type': 'text',
+                            'text': {'value': piece if index == 0 else ' ' + piece, 'annotations': []},
+                        }]},
+                    }, 'thread.message.delta')
+                yield sse(message, 'thread.message.completed')
+                yield sse(self.step_object(run, step_id, message['id'], 'completed'),
+                          'thread.run.step.completed')
+            yield sse(snapshot, f'thread.run.{status}')
+            if status in ('completed', 'failed', 'cancelled', 'expired', 'requires_action'):
+                break
+        yield sse(b'[DONE]', 'done')
+
+    def create_message(self, match, query, body):
+        message = self.message_object(
+            match.group(1), self.new_id('msg'), 'user', str(body.get('content', ''))
+        )
+        with self.lock:
+            self.threads.setdefault(match.group(1), []).append(message)
+        return 200, message
+
+    def list_messages(self, match, query, body):
+        with self.lock:
+            messages = list(reversed(self.threads.get(match.group(1), [])))
+        limit = int(query.get('limit', ['20'])[0])
+        data = messages[:limit]
+        return 200, {
+            'object': 'list',
+            'data': data,
+            'first_id': data[0]['id'] if data else None,
+            'last_id': data[-1]['id'] if data else None,
+            'has_more': len(messages) > limit,
+        }
+
+    def create_run(self, match, query, body):
+        thread_id = match.group(1)
+        with self.lock:
+            if thread_id not in self.threads:
+                return 404, {'error': {'message': f"No thread found with id '{thread_id}'."}}
+            active = [run for run in self.runs.values() if run['thread_id'] == thread_id
+                      and run['status'] not in ('completed', 'failed', 'cancelled', 'expired')]
+            if active:
+                return 400, {'error': {'message': f"Thread {thread_id} already has an active run."}}
+            for message in body.get('additional_messages') or []:
+                self.threads[thread_id].append(self.message_object(
+                    thread_id, self.new_id('msg'), 'user', str(message.get('content', ''))
+                ))
+        run = self.start_run(thread_id, body.get('assistant_id'))
+        truncation = body.get('truncation_strategy') or {}
+        if truncation.get('type') == 'last_messages':
+            run['last_messages'] = truncation['last_messages']
+        if body.get('stream'):
+            return 200, Stream(self.run_events(run))
+        return 200, self.run_object(run)
+
+    def retrieve_run(self, match, query, body):
+        run = self.runs.get(match.group(2))
+        if run is None:
+            return 404, {'error': {'message': 'run not found'}}
+        with self.lock:
+            self.advance(run)
+        return 200, self.run_object(run)
+
+    def submit_tool_outputs(self, match, query, body):
+        run = self.runs[match.group(2)]
+        with self.lock:
+            run.pop('required_action', None)
+            run['status'] = 'in_progress'
+        if body.get('stream'):
+            return 200, Stream(self.run_events(run, new_run=False))
+        return 200, self.run_object(run)
+
+    def cancel_run(self, match, query, body):
+        run = self.runs[match.group(2)]
+        run['status'] = 'cancelled'
+        return 200, self.run_object(run)
+
+    def retrieve_assistant(self, match, query, body):
+        return 200, {
+            'id': match.group(1),
+            'object': 'assistant',
+            'created_at': int(time.time()),
+            'name': 'Morpheus AI',
+            'description': None,
+            'model': 'fake-model',
+            'instructions': 'You are Morpheus AI.',
+            'tools': [],
+            'metadata': {},
+        }
+
+    def chat_completion(self, match, query, body):
+        n = int(body.get('n') or 1)
+        completion_id = self.new_id('chatcmpl')
+        created = int(time.time())
+        model = body.get('model', 'fake-model')
+        text = self.completion_text()
+        prompt_tokens = sum(estimate_tokens(str(message.get('content', '')))
+                            for message in body.get('messages') or [])
+        completion_tokens = estimate_tokens(text) * n
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                 'total_tokens': prompt_tokens + completion_tokens}
+        latency = self.request_latency()
+        if not body.get('stream'):
+            time.sleep(latency)
+            return 200, {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': created,
+                'model': model,
+                'choices': [{
+                    'index': index,
+                    'message': {'role': 'assistant', 'content': text},
+                    'finish_reason': 'stop',
+                } for index in range(n)],
+                'usage': usage,
+            }
+
+        words = text.split(' ')
+        pieces = [word + ' ' for word in words[:-1]] + words[-1:]
+
+        def chunk(choices, usage=None):
+            return sse({
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': choices,
+                'usage': usage,
+            })
+
+        def chunks():
+            for piece in pieces:
+                time.sleep(latency / len(pieces))
+                yield chunk([{'index': index, 'delta': {'content': piece}, 'finish_reason': None}
+                             for index in range(n)])
+            yield chunk([{'index': index, 'delta': {}, 'finish_reason': 'stop'}
+                         for index in range(n)])
+            if (body.get('stream_options') or {}).get('include_usage'):
+                yield chunk([], usage)
+            yield sse(b'[DONE]')
+
+        return 200, Stream(chunks())
@@ -0,0 +1,480 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import metrics
+import token_usage
+from assistant_threads import ThreadManager
+from prompts import estimate_tokens
+
+log = logging.getLogger(__name__)
+
+# Run states that will never reach 'completed'
+TERMINAL_FAILURES = ('failed', 'cancelled', 'expired', 'incomplete')
+
+# Stream events of a run ending in one of those states (not of its steps)
+TERMINAL_FAILURE_EVENTS = frozenset(f'thread.run.{status}' for status in TERMINAL_FAILURES)
+
+DEFAULT_CHAT_MODEL = 'gpt-4o-mini'
+DEFAULT_INSTRUCTIONS = (
+    "You are Morpheus AI, a concise and insightful voice of the Cardano and Web3 "
+    "community. Write tweets in plain text without surrounding quotes."
+)
+
+class OpenAIBackend:
+    """Shared lazy AsyncOpenAI client for the OpenAI-backed backends"""
+
+    name = 'openai'
+    supports_n = False
+
+    def __init__(self, api_key=None, base_url=None, client=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            # The SDK takes most of a second to import, so it is loaded on first use
+            from openai import AsyncOpenAI
+
+            self._client = AsyncOpenAI(
+                api_key=self.api_key or os.getenv('OPENAI_API_KEY'),
+                base_url=self.base_url
+            )
+        return self._client
+
+class ActiveRun:
+    """Thread and run ids of an Assistant run as they become known"""
+
+    def __init__(self, thread_id=None):
+        self.thread_id = thread_id
+        self.run_id = None
+        self.started = time.perf_counter()
+
+class AssistantsBackend(OpenAIBackend):
+    """Assistant runs on reused per-purpose threads, streamed or polled
+
+    A reused thread gets the prompt and the run in one `runs.create` call;
+    when no idle thread is available `threads.create_and_run` starts a new
+    one, which is then kept by the thread manager.
+
+    With `stream` on, run events arrive over one response: the reply text
+    comes from the message events as soon as the run completes and
+    `requires_action` is answered inline. Servers that refuse streaming, or
+    streams that end early, fall back to polling the run with exponential
+    backoff and reading only the newest message. Reused threads that were
+    deleted server-side are retired rather than taken for a missing
+    streaming endpoint.
+    """
+
+    name = 'assistants'
+
+    def __init__(self, assistant_id, api_key=None, base_url=None, client=None, threads=None,
+                 threads_file='assistant_threads.json', stream=True,
+                 poll_initial=0.25, poll_max=2.0, poll_factor=1.5):
+        super().__init__(api_key, base_url, client)
+        self.assistant_id = assistant_id
+        self.threads = threads or ThreadManager(lambda: self.client, filename=threads_file)
+        self.stream = stream
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.poll_factor = poll_factor
+
+    async def complete(self, prompt, timeout, tool_output=None, purpose='default'):
+        active = ActiveRun(self.threads.checkout(purpose))
+        text = None
+        try:
+            text = await asyncio.wait_for(
+                self._complete({"role": "user", "content": prompt}, active, purpose, tool_output),
+                timeout
+            )
+            return text
+        except asyncio.TimeoutError:
+            log.warning("Timeout: Assistant run %s took longer than %ss", active.run_id, timeout)
+            metrics.inc('assistant_timeouts_total')
+            await self._cancel(active)
+            return None
+        except asyncio.CancelledError:
+            # A hedged run that lost, or a caller past its deadline: stop the run on the server
+            await asyncio.shield(self._cancel(active))
+            raise
+        finally:
+            if active.thread_id:
+                self.threads.checkin(active.thread_id, ok=text is not None,
+                                     messages=2 if active.run_id else 0)
+
+    async def _complete(self, message, active, purpose, tool_output):
+        from openai import APIStatusError
+
+        if self.stream:
+            try:
+                stream = await self._start(message, active, purpose, stream=True)
+            except APIStatusError as e:
+                # Only a refusal that names streaming turns it off for the process
+                if 'stream' not in str(e).lower():
+                    raise
+                log.warning("Run streaming unavailable (%s), falling back to polling", e)
+                self.stream = False
+            else:
+                text, finished = await self._consume(stream, active, purpose, tool_output)
+                if finished or active.run_id is None:
+                    return text
+                log.warning("Run %s stream ended early, polling for the result", active.run_id)
+                metrics.inc('assistant_stream_fallbacks_total')
+                run = await self.client.beta.threads.runs.retrieve(
+                    thread_id=active.thread_id, run_id=active.run_id
+                )
+                return await self._poll(run, active, purpose, tool_output)
+
+        run = await self._start(message, active, purpose, stream=False)
+        return await self._poll(run, active, purpose, tool_output)
+
+    async def _start(self, message, active, purpose, stream):
+        """Start a run on the checked-out thread, or on a new one; returns the run or event stream
+
+        A checked-out thread that no longer exists on the server (deleted
+        by another process, or expired) is retired and a new one started.
+        """
+        from openai import NotFoundError
+
+        client = self.client
+        result = None
+        if active.thread_id:
+            try:
+                result = await client.beta.threads.runs.create(
+                    thread_id=active.thread_id,
+                    assistant_id=self.assistant_id,
+                    additional_messages=[message],
+                    truncation_strategy=self.threads.truncation_strategy,
+                    stream=stream
+                )
+            except NotFoundError as e:
+                log.warning("Assistant thread %s is gone (%s), starting a new one",
+                            active.thread_id, e)
+                metrics.inc('assistant_threads_missing_total')
+                self.threads.checkin(active.thread_id, ok=False, messages=0)
+                active.thread_id = None
+        if result is None:
+            result = await client.beta.threads.create_and_run(
+                assistant_id=self.assistant_id,
+                thread={"messages": [message]},
+                stream=stream
+            )
+        if not stream:
+            self._track(result, active, purpose)
+        return result
+
+    def _track(self, run, active, purpose):
+        active.run_id = run.id
+        if active.thread_id is None:
+            active.thread_id = run.thread_id
+            self.threads.adopt(purpose, run.thread_id)
+
+    def _finish(self, status, active, polls=0):
+        metrics.inc('assistant_runs_total', status=status)
+        if status == 'completed':
+            metrics.observe('assistant_run_seconds', time.perf_counter() - active.started)
+            metrics.observe('assistant_run_polls', polls, buckets=metrics.COUNT_BUCKETS)
+        elif status != 'requires_action':
+            log.warning("Assistant run %s ended with status %s", active.run_id, status)
+
+    async def _consume(self, stream, active, purpose, tool_output):
+        """Read run events until a terminal one; returns (text, finished)"""
+        parts = []
+        final = None
+        while stream is not None:
+            tool_calls = None
+            async with stream:
+                async for event in stream:
+                    kind = event.event
+                    if kind == 'thread.run.created':
+                        self._track(event.data, active, purpose)
+                    elif kind == 'thread.message.delta':
+                        for content in event.data.delta.content or []:
+                            if content.type == 'text' and content.text and content.text.value:
+                                if not parts:
+                                    metrics.observe('generation_first_token_seconds',
+                                                    time.perf_counter() - active.started,
+                                                    backend=self.name)
+                                parts.append(content.text.value)
+                    elif kind == 'thread.message.completed':
+                        final = ''.join(
+                            content.text.value for content in event.data.content
+                            if content.type == 'text'
+                        )
+                    elif kind == 'thread.run.requires_action':
+                        tool_calls = event.data.required_action.submit_tool_outputs.tool_calls
+                    elif kind == 'thread.run.completed':
+                        self._finish('completed', active)
+                        token_usage.record_usage(event.data.model, event.data.usage, purpose)
+                        return (final if final is not None else ''.join(parts)).strip(), True
+                    elif kind in TERMINAL_FAILURE_EVENTS:
+                        self._finish(event.data.status, active)
+                        token_usage.record_usage(event.data.model, event.data.usage, purpose)
+                        return None, True
+
+            if tool_calls is None:
+                return None, False
+            if tool_output is None:
+                log.warning("Assistant run %s requested tool outputs, none configured", active.run_id)
+                self._finish('requires_action', active)
+                await self._cancel(active)
+                return None, True
+            stream = await self.client.beta.threads.runs.submit_tool_outputs(
+                thread_id=active.thread_id,
+                run_id=active.run_id,
+                tool_outputs=[
+                    {"tool_call_id": tool_call.id, "output": tool_output}
+                    for tool_call in tool_calls
+                ],
+                stream=True
+            )
+        return None, False
+
+    async def _poll(self, run, active, purpose, tool_output):
+        """Poll `run` with exponential backoff, then read only the newest message"""
+        client = self.client
+        delay = self.poll_initial
+        polls = 0
+        while run.status != 'completed':
+            if run.status in TERMINAL_FAILURES:
+                self._finish(run.status, active, polls)
+                token_usage.record_usage(run.model, run.usage, purpose)
+                return None
+
+            if run.status == 'requires_action':
+                if tool_output is None:
+                    log.warning("Assistant run %s requested tool outputs, none configured", run.id)
+                    self._finish('requires_action', active, polls)
+                    await self._cancel(active)
+                    return None
+                tool_calls = run.required_action.submit_tool_outputs.tool_calls
+                run = await client.beta.threads.runs.submit_tool_outputs(
+                    thread_id=run.thread_id,
+                    run_id=run.id,
+                    tool_outputs=[
+                        {"tool_call_id": tool_call.id, "output": tool_output}
+                        for tool_call in tool_calls
+                    ]
+                )
+                delay = self.poll_initial
+                continue
+
+            await asyncio.sleep(delay)
+            delay = min(delay * self.poll_factor, self.poll_max)
+            polls += 1
+            run = await client.beta.threads.runs.retrieve(
+                thread_id=run.thread_id,
+                run_id=run.id
+            )
+            log.debug("Assistant run %s status: %s", run.id, run.status)
+
+        self._finish('completed', active, polls)
+        token_usage.record_usage(run.model, run.usage, purpose)
+        messages = await client.beta.threads.messages.list(
+            thread_id=run.thread_id,
+            limit=1,
+            order='desc'
+        )
+        return messages.data[0].content[0].text.value.strip()
+
+    async def _cancel(self, active):
+        if active.run_id is None:
+            return
+        try:
+            await self.client.beta.threads.runs.cancel(thread_id=active.thread_id, run_id=active.run_id)
+        except Exception:
+            pass
+
+class ChatCompletionsBackend(OpenAIBackend):
+    """One Chat Completions request per generation, streamed by default
+
+    Model and instructions default to those of `assistant_id` (fetched once),
+    so the persona matches the Assistants backend. Point `base_url` at any
+    OpenAI-compatible server to run against a local model.
+    """
+
+    name = 'chat'
+    supports_n = True
+
+    def __init__(self, model=None, instructions=None, assistant_id=None, api_key=None,
+                 base_url=None, client=None, stream=True, temperature=None):
+        super().__init__(api_key, base_url, client)
+        self.model = model
+        self.instructions = instructions
+        self.assistant_id = assistant_id
+        self.stream = stream
+        self.temperature = temperature
+        self._persona_lock = None
+
+    async def persona(self):
+        """Model and system prompt, borrowed from the assistant on first use"""
+        if self.model and self.instructions:
+            return self.model, self.instructions
+        if self._persona_lock is None:
+            self._persona_lock = asyncio.Lock()
+        async with self._persona_lock:
+            if self.assistant_id and not (self.model and self.instructions):
+                try:
+                    assistant = await self.client.beta.assistants.retrieve(self.assistant_id)
+                    self.model = self.model or assistant.model
+                    self.instructions = self.instructions or assistant.instructions
+                except Exception as e:
+                    log.warning("Could not load assistant %s persona: %s", self.assistant_id, e)
+            self.model = self.model or DEFAULT_CHAT_MODEL
+            self.instructions = self.instructions or DEFAULT_INSTRUCTIONS
+        return self.model, self.instructions
+
+    async def complete(self, prompt, timeout, tool_output=None, purpose=None):
+        texts = await self.complete_n(prompt, 1, timeout, purpose=purpose)
+        return texts[0] if texts else None
+
+    async def complete_n(self, prompt, n, timeout, tool_output=None, purpose=None):
+        """`n` independent completions of one prompt in a single request
+
+        Token usage comes from the response (the final chunk when
+        streamed); servers that report none are charged an estimate.
+        """
+        model, instructions = await self.persona()
+        params = dict(
+            model=model,
+            messages=[
+                {"role": "system", "content": instructions},
+                {"role": "user", "content": prompt},
+            ],
+            n=n,
+            timeout=timeout,
+        )
+        if self.temperature is not None:
+            params['temperature'] = self.temperature
+        try:
+            texts, usage = await asyncio.wait_for(self._request(params), timeout)
+        except asyncio.TimeoutError:
+            log.warning("Timeout: chat completion took longer than %ss", timeout)
+            metrics.inc('generation_timeouts_total', backend=self.name)
+            return []
+        if not token_usage.record_usage(model, usage, purpose):
+            token_usage.record(model, estimate_tokens(instructions) + estimate_tokens(prompt),
+                               sum(estimate_tokens(text) for text in texts), purpose)
+        return texts
+
+    async def _request(self, params):
+        """Reply texts and the usage reported for them (None if the server sent none)"""
+        if not self.stream:
+            response = await self.client.chat.completions.create(**params)
+            return [choice.message.content.strip() for choice in response.choices
+                    if choice.message.content], response.usage
+
+        started = time.perf_counter()
+        first = True
+        parts = {}
+        usage = None
+        stream = await self.client.chat.completions.create(
+            stream=True, stream_options={'include_usage': True}, **params
+        )
+        async for chunk in stream:
+            usage = chunk.usage or usage
+            for choice in chunk.choices:
+                if choice.delta.content:
+                    if first:
+                        metrics.observe('generation_first_token_seconds',
+                                        time.perf_counter() - started, backend=self.name)
+                        first = False
+                    parts.setdefault(choice.index, []).append(choice.delta.content)
+        texts = (''.join(parts[index]).strip() for index in sorted(parts))
+        return [text for text in texts if text], usage
+
+STUB_REPLIES = (
+    "The eUTXO model brings deterministic precision to Cardano DeFi.",
+    "Peer review before deployment is how Cardano earns trust one upgrade at a time.",
+    "Governance on-chain means the community, not a company, steers what comes next.",
+    "Native tokens on Cardano move without smart contracts, cheaper and safer by design.",
+    "Every stake pool is a vote for decentralization. Choose yours with care.",
+)
+STUB_HASHTAGS = ("#Cardano", "#Web3", "#DeFi", "#ADA")
+
+class StubBackend:
+    """Deterministic offline replies derived from the prompt, for tests and dry runs"""
+
+    name = 'stub'
+    supports_n = True
+
+    def __init__(self, latency=0.0, replies=STUB_REPLIES):
+        self.latency = latency
+        self.replies = replies
+
+    def reply(self, prompt, index=0):
+        digest = hashlib.blake2b(f"{index}:{prompt}".encode('utf-8'), digest_size=8).digest()
+        value = int.from_bytes(digest, 'big')
+        text = self.replies[value % len(self.replies)]
+        return f"{text}\n\n{STUB_HASHTAGS[value % len(STUB_HASHTAGS)]}"
+
+    async def complete(self, prompt, timeout, tool_output=None, purpose=None):
+        texts = await self.complete_n(prompt, 1, timeout, purpose=purpose)
+        return texts[0]
+
+    async def complete_n(self, prompt, n, timeout, tool_output=None, purpose=None):
+        if self.latency:
+            await asyncio.sleep(min(self.latency, timeout))
+        texts = [self.reply(prompt, index) for index in range(n)]
+        # Estimated like a real model would count them, so budgets and reports work offline
+        token_usage.record(self.name, estimate_tokens(prompt),
+                           sum(estimate_tokens(text) for text in texts), purpose)
+        return texts
+
+BACKENDS = ('assistants', 'chat', 'stub')
+
+# Used while the primary backend's circuit is open; cheaper and independent of Assistant runs
+DEFAULT_FALLBACK_MODEL = 'gpt-4o-mini'
+
+def make_backend(name=None, assistant_id=None, api_key=None, client=None, state_dir='.'):
+    """Build the backend named by `name` or GENERATION_BACKEND (default 'assistants')
+
+    GENERATION_STREAM=0 turns off streaming for both OpenAI backends. Chat
+    settings come from OPENAI_MODEL and GENERATION_BASE_URL; the stub's
+    latency from STUB_LATENCY. Accounts sharing one AsyncOpenAI `client`
+    keep their Assistant thread state under their own `state_dir`.
+    """
+    name = (name or os.getenv('GENERATION_BACKEND', 'assistants')).lower()
+    stream = os.getenv('GENERATION_STREAM', '1') != '0'
+    if name == 'assistants':
+        return AssistantsBackend(
+            assistant_id, api_key=api_key, client=client, stream=stream,
+            threads_file=os.path.join(state_dir, 'assistant_threads.json')
+        )
+    if name == 'chat':
+        return ChatCompletionsBackend(
+            model=os.getenv('OPENAI_MODEL'),
+            assistant_id=assistant_id,
+            api_key=api_key,
+            base_url=os.getenv('GENERATION_BASE_URL'),
+            client=client,
+            stream=stream
+        )
+    if name == 'stub':
+        return StubBackend(latency=float(os.getenv('STUB_LATENCY', '0')))
+    raise ValueError(f"Unknown generation backend {name!r}, expected one of {', '.join(BACKENDS)}")
+
+def make_fallback_backend(assistant_id=None, api_key=None, client=None, name=None):
+    """Backend named by `name` or GENERATION_FALLBACK ('chat' or 'stub'), None if unset
+
+    The chat fallback uses FALLBACK_MODEL (default gpt-4o-mini) with the
+    assistant's instructions, without streaming.
+    """
+    name = (name or os.getenv('GENERATION_FALLBACK', '')).lower()
+    if not name:
+        return None
+    if name == 'chat':
+        return ChatCompletionsBackend(
+            model=os.getenv('FALLBACK_MODEL', DEFAULT_FALLBACK_MODEL),
+            assistant_id=assistant_id,
+            api_key=api_key,
+            base_url=os.getenv('GENERATION_BASE_URL'),
+            client=client,
+            stream=False
+        )
+    if name == 'stub':
+        return StubBackend()
+    raise ValueError(f"Unknown fallback backend {name!r}, expected chat or stub")
@@ -0,0 +1,284 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+import metrics
+import deadlines
+
+log = logging.getLogger(__name__)
+
+class CircuitOpenError(RuntimeError):
+    """The backend is failing and no fallback is configured"""
+
+class CircuitBreaker:
+    """Stops calling a failing backend for a while
+
+    After `threshold` failed calls in a row the breaker opens and calls
+    are refused for `reset_timeout` seconds. Then a single trial call goes
+    through: success closes the breaker, failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, threshold=5, reset_timeout=60):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial = False
+        self._lock = threading.Lock()
+
+    def retry_in(self):
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def allow(self):
+        """True if a call may go to the backend now"""
+        with self._lock:
+            if self.state == self.OPEN and not self.retry_in():
+                self.state = self.HALF_OPEN
+                self.trial = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                if self.state != self.CLOSED:
+                    log.info("%s backend recovered, closing circuit", self.name)
+                self.state = self.CLOSED
+                self.failures = 0
+            else:
+                self.failures += 1
+                if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                    if self.state != self.OPEN:
+                        log.warning("%s backend failed %d times, opening circuit for %ss",
+                                    self.name, self.failures, self.reset_timeout)
+                        metrics.inc('circuit_opened_total', backend=self.name)
+                    self.state = self.OPEN
+                    self.opened_at = time.monotonic()
+            self.trial = False
+            metrics.set_gauge('circuit_open', int(self.state != self.CLOSED), backend=self.name)
+
+    def abandon(self):
+        """A call ended without a verdict (cancelled); let another trial through"""
+        with self._lock:
+            self.trial = False
+
+class LatencyWindow:
+    """Latencies of the last `size` successful generations"""
+
+    def __init__(self, size=200, min_samples=20):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def quantile(self, q):
+        """Observed `q` quantile, None until `min_samples` were recorded"""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+def start_loop(name='generation-engine'):
+    """A new event loop running forever in a daemon thread"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name=name, daemon=True).start()
+    return loop
+
+class GenerationEngine:
+    """Concurrent generations on a pluggable backend
+
+    The backend (see generation_backends) turns one prompt into reply text:
+    an Assistant run, a streamed Chat Completion or an offline stub. At most
+    `max_concurrency` generations are in flight at once, and identical
+    prompts in a batch become one `n`-completion request where the backend
+    supports it.
+
+    The engine runs on a background event loop so synchronous callers can
+    use `run_sync` from any thread while sharing one pooled HTTP client.
+    Engines of several accounts can share one `loop`.
+
+    Timeouts are capped by the caller's deadline (see deadlines.within).
+    With `hedge`, a generation still running after the observed
+    `hedge_quantile` latency gets a backup request and the first usable
+    reply wins. A circuit breaker stops calling a failing backend; while
+    it is open, generations go to `fallback` (e.g. a cheaper model) or
+    fail at once with CircuitOpenError.
+    """
+
+    def __init__(self, backend, max_concurrency=4, timeout=30, loop=None, fallback=None,
+                 breaker=None, hedge_quantile=0.95):
+        self.backend = backend
+        self.fallback = fallback
+        self.breaker = breaker or CircuitBreaker(backend.name)
+        self.latencies = LatencyWindow()
+        self.hedge_quantile = hedge_quantile
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._semaphore = None
+        self._loop = loop
+        self._loop_lock = threading.Lock()
+
+    @property
+    def supports_n(self):
+        return self.backend.supports_n
+
+    @property
+    def semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _ensure_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = start_loop()
+            return self._loop
+
+    def run_sync(self, coro):
+        """Run a coroutine on the engine loop and block until it finishes"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    async def generate(self, prompt, timeout=None, tool_output=None, purpose='default',
+                       hedge=False):
+        """Generate reply text for `prompt`, or None
+
+        `purpose` groups generations that may share server-side state,
+        such as a reused Assistant thread per 'post' or 'reply'.
+        """
+        return await self._call(
+            lambda backend, timeout: backend.complete(prompt, timeout, tool_output, purpose),
+            1, timeout, hedge
+        )
+
+    async def generate_n(self, prompt, n, timeout=None, tool_output=None, purpose='default',
+                         hedge=False):
+        """Up to `n` independent replies to one prompt, in one request when supported"""
+        if not self.supports_n:
+            texts = await self.generate_many([prompt] * n, timeout, tool_output, purpose)
+            return [text for text in texts if text]
+        return await self._call(
+            lambda backend, timeout: backend.complete_n(prompt, n, timeout, tool_output, purpose),
+            n, timeout, hedge
+        )
+
+    async def _call(self, request, n, timeout, hedge):
+        """Run `request(backend, timeout)` on the backend, hedged or on the fallback"""
+        timeout = deadlines.bound(timeout or self.timeout, 'generation')
+        if not self.breaker.allow():
+            if self.fallback is None:
+                metrics.inc('generations_total', backend=self.backend.name, outcome='rejected')
+                raise CircuitOpenError(f"{self.backend.name} backend is failing, "
+                                       f"next try in {self.breaker.retry_in():.0f}s")
+            metrics.inc('generation_fallbacks_total', backend=self.fallback.name)
+            return await self._timed(self.fallback, request(self.fallback, timeout), n)
+        if hedge:
+            return await self._hedged(request, n, timeout)
+        return await self._timed(self.backend, request(self.backend, timeout), n)
+
+    def hedge_delay(self, timeout):
+        """Seconds before a backup request: observed latency quantile, half the timeout until known"""
+        observed = self.latencies.quantile(self.hedge_quantile)
+        return timeout / 2 if observed is None else min(observed, timeout)
+
+    async def _hedged(self, request, n, timeout):
+        """Backup request once the first runs past the hedge delay; first usable result wins"""
+        started = time.monotonic()
+        primary = asyncio.ensure_future(self._timed(self.backend, request(self.backend, timeout), n))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(timeout))
+            left = timeout - (time.monotonic() - started)
+            if done or left <= 0:
+                return await primary
+            metrics.inc('generation_hedges_total', backend=self.backend.name)
+            tasks.append(asyncio.ensure_future(
+                self._timed(self.backend, request(self.backend, left), n)
+            ))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.exception() and task.result():
+                        metrics.inc('generation_hedge_wins_total', backend=self.backend.name,
+                                    request='primary' if task is primary else 'backup')
+                        return task.result()
+            # Neither was usable: report the primary's outcome
+            return await primary
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _timed(self, backend, call, n):
+        primary = backend is self.backend
+        async with self.semaphore:
+            started = time.perf_counter()
+            try:
+                result = await call
+            except asyncio.CancelledError:
+                if primary:
+                    self.breaker.abandon()
+                raise
+            except Exception:
+                metrics.inc('generations_total', backend=backend.name, outcome='error')
+                if primary:
+                    self.breaker.record(False)
+                raise
+            elapsed = time.perf_counter() - started
+            metrics.observe('generation_seconds', elapsed, backend=backend.name)
+            metrics.inc('generations_total', n, backend=backend.name,
+                        outcome='ok' if result else 'empty')
+            if primary:
+                # Empty results are timeouts or failed runs, so they count against the backend
+                self.breaker.record(bool(result))
+                if result:
+                    self.latencies.add(elapsed)
+            return result
+
+    async def generate_many(self, prompts, timeout=None, tool_output=None, purpose='default'):
+        """Generate replies for all prompts concurrently, failures become None
+
+        Repeated prompts are batched into one `generate_n` call when the
+        backend supports it; results keep the order of `prompts`.
+        """
+        async def one(prompt):
+            try:
+                return await self.generate(prompt, timeout, tool_output, purpose)
+            except Exception as e:
+                log.error("Error generating response: %s", e)
+                return None
+
+        if not self.supports_n:
+            return await asyncio.gather(*(one(prompt) for prompt in prompts))
+
+        positions = {}
+        for index, prompt in enumerate(prompts):
+            positions.setdefault(prompt, []).append(index)
+
+        async def batch(prompt, indexes):
+            if len(indexes) == 1:
+                return [await one(prompt)]
+            try:
+                return await self.generate_n(prompt, len(indexes), timeout, tool_output, purpose)
+            except Exception as e:
+                log.error("Error generating responses: %s", e)
+                return []
+
+        results = [None] * len(prompts)
+        batches = await asyncio.gather(*(batch(prompt, indexes) for prompt, indexes in positions.items()))
+        for indexes, texts in zip(positions.values(), batches):
+            for index, text in zip(indexes, texts):
+                results[index] = text
+        return results
@@ -0,0 +1,268 @@
+import json
+import sqlite3
+import logging
+import threading
+import clock
+import metrics
+
+log = logging.getLogger(__name__)
+
+PENDING = 'pending'
+GENERATED = 'generated'
+POSTING = 'posting'
+POSTED = 'posted'
+FAILED = 'failed'
+
+UNFINISHED = (PENDING, GENERATED, POSTING)
+
+# Finished jobs are kept this long so late duplicates are still recognised
+DEFAULT_RETENTION_SECONDS = 7 * 24 * 3600
+
+# Maximum number of finished rows removed per purge
+PURGE_BATCH = 500
+
+class JobQueue:
+    """Durable generate/post jobs in SQLite (WAL mode), keyed by idempotency key
+
+    A job moves pending -> generated -> posting -> posted, one row update per
+    step, so thousands of queued jobs never cause a full rewrite. Enqueueing
+    an existing key is a no-op, and the generated text is stored before
+    posting so a retry posts the same tweet instead of a new one. Jobs left
+    unfinished by a crash become claimable again once their lease runs out.
+    """
+
+    def __init__(self, path='jobs.db', max_attempts=5, retention=DEFAULT_RETENTION_SECONDS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " key TEXT PRIMARY KEY,"
+            " kind TEXT NOT NULL,"
+            " state TEXT NOT NULL,"
+            " payload TEXT,"
+            " result TEXT,"
+            " tweet_id TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT,"
+            " not_before REAL NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (kind, state, not_before)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_updated ON jobs (state, updated_at)"
+        )
+
+    @staticmethod
+    def _row(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload']) if job['payload'] else {}
+        return job
+
+    def _update(self, key, now, **fields):
+        fields['updated_at'] = clock.time() if now is None else now
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE key = ?", (*fields.values(), key)
+            )
+
+    def enqueue(self, key, kind, payload=None, now=None):
+        """Add a pending job unless `key` already exists; returns True if it was added
+
+        Also purges a small batch of finished jobs past the retention period.
+        """
+        now = clock.time() if now is None else now
+        with self._lock:
+            added = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (key, kind, state, payload, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, PENDING, json.dumps(payload or {}), now, now)
+            ).rowcount == 1
+            if added:
+                self._purge(now - self.retention, PURGE_BATCH)
+        if added:
+            metrics.inc('jobs_enqueued_total', kind=kind)
+        return added
+
+    def get(self, key):
+        with self._lock:
+            return self._row(self._conn.execute(
+                "SELECT * FROM jobs WHERE key = ?", (key,)
+            ).fetchone())
+
+    def claim(self, kind, limit=100, lease=300, now=None):
+        """Lease up to `limit` unfinished jobs of `kind` that are due, oldest first
+
+        Claimed jobs are hidden from other claims for `lease` seconds; a
+        worker that dies holding them simply lets the lease run out.
+        """
+        now = clock.time() if now is None else now
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT * FROM jobs WHERE kind = ? AND state IN (?, ?, ?) AND not_before <= ?"
+                    " ORDER BY created_at LIMIT ?",
+                    (kind, *UNFINISHED, now, limit)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE jobs SET not_before = ? WHERE key = ?",
+                    ((now + lease, row['key']) for row in rows)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [self._row(row) for row in rows]
+
+    def mark_generated(self, key, text, now=None):
+        self._update(key, now, state=GENERATED, result=text, error=None)
+
+    def begin_post(self, key, now=None):
+        """Record the intent to post; a crash after this leaves the job in 'posting'"""
+        self._update(key, now, state=POSTING)
+
+    def mark_posted(self, key, tweet_id=None, now=None):
+        self._update(key, now, state=POSTED, tweet_id=None if tweet_id is None else str(tweet_id),
+                     error=None)
+        metrics.inc('jobs_posted_total')
+
+    def fail(self, key, error, retry_delay=60, keep_result=True, now=None):
+        """Count a failed attempt; retry after `retry_delay` or give up after `max_attempts`
+
+        Without `keep_result` the stored text is dropped, so the retry
+        generates a new one instead of posting the rejected text again.
+        """
+        now = clock.time() if now is None else now
+        job = self.get(key)
+        if job is None:
+            return
+        attempts = job['attempts'] + 1
+        if attempts >= self.max_attempts:
+            state = FAILED
+            log.error("Giving up on job %s after %d attempts: %s", key, attempts, error)
+            metrics.inc('jobs_failed_total', kind=job['kind'])
+        elif keep_result and job['result']:
+            # A post that raised did not go out, so the stored text is retried as is
+            state = GENERATED
+        else:
+            state = PENDING
+        result = job['result'] if keep_result else None
+        self._update(key, now, state=state, result=result, attempts=attempts,
+                     error=str(error)[:500], not_before=now + retry_delay * 2 ** (attempts - 1))
+
+    def cancel(self, key, reason, now=None):
+        """Finish a job without posting it (e.g. its tweet needs no reply after all)"""
+        job = self.get(key)
+        if job is None:
+            return
+        self._update(key, now, state=FAILED, error=str(reason)[:500])
+        metrics.inc('jobs_cancelled_total', kind=job['kind'])
+
+    def counts(self):
+        """Number of jobs per state"""
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT state, COUNT(*) FROM jobs GROUP BY state"
+            ).fetchall())
+
+    def _purge(self, cutoff, limit):
+        return self._conn.execute(
+            "DELETE FROM jobs WHERE key IN ("
+            " SELECT key FROM jobs WHERE state IN (?, ?) AND updated_at < ? LIMIT ?"
+            ")",
+            (POSTED, FAILED, cutoff, limit)
+        ).rowcount
+
+    def purge(self, limit=PURGE_BATCH, now=None):
+        """Remove up to `limit` finished jobs older than the retention period"""
+        cutoff = (clock.time() if now is None else now) - self.retention
+        with self._lock:
+            return self._purge(cutoff, limit)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def is_duplicate(error):
+    """True for Twitter's 403 rejecting a tweet with duplicate content"""
+    import tweepy
+
+    return isinstance(error, tweepy.Forbidden) and 'duplicate' in str(error).lower()
+
+def find_posted(client, text, in_reply_to_tweet_id=None, lookback=20):
+    """Id of our own recent tweet matching `text` (and reply target), or None"""
+    me = client.get_me().data.id
+    response = client.get_users_tweets(
+        id=me, max_results=max(lookback, 5), tweet_fields=['referenced_tweets']
+    )
+    for tweet in response.data or []:
+        if in_reply_to_tweet_id is not None:
+            replied_to = [ref.id for ref in tweet.referenced_tweets or [] if ref.type == 'replied_to']
+            if str(in_reply_to_tweet_id) in map(str, replied_to):
+                return tweet.id
+        elif tweet.text.strip() == text.strip():
+            return tweet.id
+    return None
+
+def post_once(jobs, client, key, text, in_reply_to_tweet_id=None):
+    """Post `text` for job `key` at most once; returns True once the job is posted
+
+    A job found in 'posting' was interrupted between create_tweet and the
+    state update, so our timeline is checked before posting again. Twitter's
+    duplicate-content rejection only counts as already posted for such a
+    job whose timeline could not be checked; otherwise the text duplicates
+    some other tweet, so the job fails with its text dropped and the
+    Forbidden error is raised.
+    """
+    job = jobs.get(key)
+    if job is not None and job['state'] == POSTED:
+        log.info("Job %s was already posted, skipping", key)
+        return True
+    unconfirmed = False
+    if job is not None and job['state'] == POSTING:
+        try:
+            existing = find_posted(client, text, in_reply_to_tweet_id)
+        except Exception as e:
+            log.warning("Could not check timeline for job %s: %s", key, e)
+            existing = None
+            unconfirmed = True
+        if existing is not None:
+            log.info("Job %s was posted before a restart as %s", key, existing)
+            metrics.inc('jobs_deduplicated_total')
+            jobs.mark_posted(key, existing)
+            return True
+
+    jobs.begin_post(key)
+    params = {'text': text}
+    if in_reply_to_tweet_id is not None:
+        params['in_reply_to_tweet_id'] = in_reply_to_tweet_id
+    try:
+        response = client.create_tweet(**params)
+    except Exception as e:
+        if not is_duplicate(e):
+            jobs.fail(key, e)
+            raise
+        if unconfirmed:
+            log.info("Twitter rejected interrupted job %s as a duplicate, treating it as posted", key)
+            metrics.inc('jobs_deduplicated_total')
+            jobs.mark_posted(key)
+            return True
+        log.warning("Twitter rejected job %s as duplicate content, dropping its text", key)
+        metrics.inc('jobs_duplicate_rejected_total')
+        jobs.fail(key, e, keep_result=False)
+        raise
+    jobs.mark_posted(key, response.data['id'])
+    return True
@@ -0,0 +1,17 @@
+import os
+import json
+
+def load(filename):
+    """Contents of a JSON state file, {} if it does not exist yet"""
+    try:
+        with open(filename, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save(filename, data):
+    """Write a JSON state file atomically, so a crash leaves the old or the new version"""
+    tmp = filename + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, filename)
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# Seconds; covers sub-millisecond tracker lookups up to slow Assistant runs
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    inner = ','.join(f'{name}="{value}"' for name, value in pairs)
+    return '{' + inner + '}'
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return {'count': self.count, 'sum': self.sum, 'buckets': cumulative}
+
+class Registry:
+    """In-process counters, gauges and histograms keyed by name and labels
+
+    Recording is a dict lookup and a couple of additions under one lock,
+    cheap enough to leave on in production.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.help = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of the enclosed block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in self.counters.items()
+                ],
+                'gauges': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in self.gauges.items()
+                ],
+                'histograms': [
+                    dict(histogram.snapshot(), name=name, labels=dict(labels))
+                    for (name, labels), histogram in self.histograms.items()
+                ],
+            }
+
+    def render_prometheus(self):
+        """Text exposition format for a /metrics endpoint"""
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+            for (name, labels), value in sorted(self.gauges.items()):
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                snapshot = histogram.snapshot()
+                for bound, total in snapshot['buckets']:
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', le)])} {total}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {snapshot['sum']}")
+                lines.append(f"{name}_count{_format_labels(labels)} {snapshot['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def write_jsonl(self, path):
+        """Append one timestamped snapshot line to a JSON-lines file"""
+        with open(path, 'a') as f:
+            f.write(json.dumps(dict(self.snapshot(), ts=time.time())) + '\n')
+
+registry = Registry()
+inc = registry.inc
+set_gauge = registry.set_gauge
+observe = registry.observe
+timer = registry.timer
+
+# Readiness checks: name -> callable returning True once that part is ready
+_checks = {}
+_started = time.time()
+
+def register_check(name, check):
+    """Add a readiness check reported by /readyz (replaces one of the same name)"""
+    _checks[name] = check
+
+def readiness():
+    """(all checks pass, {name: result}); a check that raises counts as not ready"""
+    results = {}
+    for name, check in list(_checks.items()):
+        try:
+            results[name] = bool(check())
+        except Exception:
+            results[name] = False
+    return all(results.values()), results
+
+def _handler_class():
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?')[0]
+            status = 200
+            content_type = 'application/json'
+            if path == '/metrics':
+                body = registry.render_prometheus()
+                content_type = 'text/plain; version=0.0.4'
+            elif path == '/healthz':
+                body = json.dumps({'status': 'ok', 'uptime': round(time.time() - _started, 1)})
+            elif path == '/readyz':
+                ready, checks = readiness()
+                status = 200 if ready else 503
+                body = json.dumps({'ready': ready, 'checks': checks})
+            else:
+                self.send_error(404)
+                return
+            body = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+def serve_metrics(port, host='0.0.0.0'):
+    """Serve /metrics (Prometheus text), /healthz (liveness) and /readyz on host:port"""
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer((host, port), _handler_class())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    log.info("Serving metrics and health checks on http://%s:%d", host, server.server_address[1])
+    return server
+
+def dump_metrics_periodically(path, interval=60):
+    """Append a JSON-lines snapshot to `path` every `interval` seconds"""
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                registry.write_jsonl(path)
+            except OSError as e:
+                log.warning("Could not write metrics to %s: %s", path, e)
+
+    threading.Thread(target=loop, name='metrics-jsonl', daemon=True).start()
+
+def start_exporters():
+    """Start the exporters configured by METRICS_PORT and METRICS_FILE"""
+    port = os.getenv('METRICS_PORT')
+    if port:
+        serve_metrics(int(port))
+    path = os.getenv('METRICS_FILE')
+    if path:
+        dump_metrics_periodically(path, int(os.getenv('METRICS_INTERVAL', '60')))
+
+def setup_logging(level=None):
+    """Levelled logging for the bot; LOG_LEVEL overrides the default INFO"""
+    logging.basicConfig(
+        level=(level or os.getenv('LOG_LEVEL', 'INFO')).upper(),
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+    )
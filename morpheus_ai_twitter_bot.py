@@ -1,341 +1,232 @@
-import os
-import time
 import re
-from openai import OpenAI
-import tweepy
+import asyncio
+import logging
+import threading
 from dotenv import load_dotenv
-import schedule
-from datetime import datetime, timedelta
-import pytz
-import json
+from datetime import timedelta
+from reply_store import TweetTracker
+from scheduler import SlotScheduler, Slot, DEFAULT_SLOTS
+from community_pipeline import CommunityPipeline
+from twitter_clients import get_provider
+from rate_limits import request_priority, PRIORITY_SCHEDULED
+from topic_search import search_topics
+from tweet_stream import StreamIngestor, account_rules
+from accounts import Account, Persona, load_accounts, shard_accounts, build_personas
+from tweet_text import normalize, normalize_many
+from job_queue import post_once, POSTED
+from generation_engine import CircuitOpenError
+from token_usage import charged_to
+import clock
+import deadlines
+import metrics
+import prompts
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+log = logging.getLogger(__name__)
 
-class TweetTracker:
-    def __init__(self, filename='replied_tweets.json'):
-        self.filename = filename
-        self.replied_tweets = self.load_tweets()
-        
-    def load_tweets(self):
-        """Load previously replied tweets from file"""
-        try:
-            with open(self.filename, 'r') as f:
-                data = json.load(f)
-                # Clean up old tweets (older than 7 days)
-                current_time = datetime.now()
-                data = {
-                    tweet_id: timestamp 
-                    for tweet_id, timestamp in data.items()
-                    if current_time - datetime.fromisoformat(timestamp) < timedelta(days=7)
-                }
-                return data
-        except FileNotFoundError:
-            return {}
-            
-    def save_tweets(self):
-        """Save replied tweets to file"""
-        with open(self.filename, 'w') as f:
-            json.dump(self.replied_tweets, f)
-            
-    def already_replied(self, tweet_id):
-        """Check if we've already replied to this tweet"""
-        return str(tweet_id) in self.replied_tweets
-        
-    def mark_as_replied(self, tweet_id):
-        """Mark a tweet as replied to"""
-        self.replied_tweets[str(tweet_id)] = datetime.now().isoformat()
-        self.save_tweets()
+ASSISTANT_ID = "asst_5AyAw1WHxg7eOL847byMYcpr"  # Make sure this is your correct assistant ID
+
+# Seconds of a slot attempt's deadline kept for posting after generation
+POST_RESERVE = 15
+
+_default_persona = None
+_default_persona_lock = threading.Lock()
+
+def get_default_persona():
+    """The account configured by the plain environment variables, created on first use
+
+    Its state files live in the working directory. Functions that take a
+    `persona` use this one unless a multi-account run passes its own.
+    Building it opens the state databases, so importing this module alone
+    stays cheap.
+    """
+    global _default_persona
+    with _default_persona_lock:
+        if _default_persona is None:
+            _default_persona = Persona(
+                Account('default', ASSISTANT_ID, handle='DRMZ_Agent'),
+                twitter=get_provider()
+            )
+        return _default_persona
+
+# Attributes of the default persona that used to be module globals:
+# `twitter` (shared, pooled clients), `engine` (generation backend picked by
+# GENERATION_BACKEND), cursors, buffer, cache and the reply bucket
+_PERSONA_ALIASES = {
+    'default_persona': None,
+    'twitter': 'twitter',
+    'engine': 'engine',
+    'search_cursors': 'search_cursors',
+    'tweet_buffer': 'tweet_buffer',
+    'response_cache': 'response_cache',
+    'reply_bucket': 'reply_bucket',
+}
+
+def __getattr__(name):
+    if name not in _PERSONA_ALIASES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    persona = get_default_persona()
+    attribute = _PERSONA_ALIASES[name]
+    return persona if attribute is None else getattr(persona, attribute)
 
 def is_first_tweet():
     """Check if this is the first tweet"""
     try:
-        client = tweepy.Client(
-            consumer_key=os.getenv('API_KEY'),
-            consumer_secret=os.getenv('API_KEY_SECRET'),
-            access_token=os.getenv('ACCESS_TOKEN'),
-            access_token_secret=os.getenv('ACCESS_TOKEN_SECRET')
-        )
+        client = get_default_persona().twitter.get_client()
         tweets = client.get_users_tweets(id=client.get_me().data.id)
         return tweets.data is None or len(tweets.data) == 0
     except Exception as e:
-        print(f"Error checking tweet history: {e}")
+        log.error("Error checking tweet history: %s", e)
         return False
 
 def clean_tweet_text(text):
     """Clean the tweet text by removing metadata and ensuring proper formatting"""
-    # Remove metadata tags
-    text = re.sub(r'【.*?】', '', text)
-    
-    # Check if there are hashtags
-    if '#' in text:
-        # Split into main text and hashtags
-        parts = text.split('#')
-        main_text = parts[0].strip()
-        hashtags = ['#' + tag.strip() for tag in parts[1:] if tag.strip()]
-        
-        # Combine with double line break before hashtags
-        return f"{main_text}\n\n{' '.join(hashtags)}"
-    
-    return text.strip()
+    return normalize(text).text
 
 def generate_tweet_with_morpheus():
     """Let Morpheus AI generate tweets from its knowledge and personality"""
     try:
-        print("Analyzing community tweet...")
-        thread = openai_client.beta.threads.create()
-        
-        message = openai_client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content="""Share a brief, mystical response (max 200 characters for main message).
-
-            STRICT RULES:
-            1. Keep the main message under 200 characters
-            2. Add a line break before hashtags
-            3. Use 2-3 relevant hashtags
-            4. Do not include any metadata or source tags
-            5. Total tweet must be under 280 characters
-
-            Example:
-            The dreams of Web3 manifest through Cardano's innovation
-
-            #DRMZ #Cardano #Web3"""
-        )
-        
-        print("1. Initializing assistant...")
-        assistant_id = "asst_5AyAw1WHxg7eOL847byMYcpr"
-        
-        print("2. Creating thread...")
-        thread = openai_client.beta.threads.create()
-        
-        print("3. Adding message to thread...")
-        content = """Share ONE brief technical insight about Cardano or DRMZ.
-        STRICT REQUIREMENTS:
-        - Maximum 280 characters
-        - Focus on a single point
-        - Include 1-2 relevant hashtags
-        - Be concise but informative"""
-            
-        message = openai_client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=content
-        )
-        
-        print("4. Running assistant...")
-        run = openai_client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=assistant_id
-        )
-        
-        print("5. Waiting for response...")
-        timeout = 30
-        start_time = time.time()
-        
-        while True:
-            if time.time() - start_time > timeout:
-                print("\nTimeout: Assistant took too long to respond")
-                return None
-                
-            run_status = openai_client.beta.threads.runs.retrieve(
-                thread_id=thread.id,
-                run_id=run.id
-            )
-            print(f"Status: {run_status.status}")
-            
-            if run_status.status == 'completed':
-                break
-            elif run_status.status == 'requires_action':
-                print("\nHandling required actions...")
-                tool_calls = run_status.required_action.submit_tool_outputs.tool_calls
-                tool_outputs = []
-                
-                for tool_call in tool_calls:
-                    tool_outputs.append({
-                        "tool_call_id": tool_call.id,
-                        "output": "Proceed with generating the tweet."
-                    })
-                
-                run = openai_client.beta.threads.runs.submit_tool_outputs(
-                    thread_id=thread.id,
-                    run_id=run.id,
-                    tool_outputs=tool_outputs
-                )
-            elif run_status.status == 'failed':
-                print("\nAssistant run failed")
-                return None
-                
-            time.sleep(1)
-        
-        print("\n6. Getting response...")
-        messages = openai_client.beta.threads.messages.list(thread_id=thread.id)
-        tweet_text = messages.data[0].content[0].text.value.strip()
-        
-        # Clean up the tweet text
-        tweet_text = re.sub(r'【.*?】', '', tweet_text).strip()
-        if tweet_text.startswith('"') and tweet_text.endswith('"'):
-            tweet_text = tweet_text[1:-1].strip()
-            
-        print(f"\nGenerated tweet: {tweet_text}")
-        return clean_tweet_text(tweet_text)
+        log.info("Running assistant...")
+        persona = get_default_persona()
+        with charged_to(persona.token_ledger, 'post'):
+            tweet_text = persona.engine.run_sync(persona.engine.generate(
+                prompts.render('insight'),
+                tool_output="Proceed with generating the tweet.",
+                purpose='post'
+            ))
+        if not tweet_text:
+            return None
+        
+        tweet = normalize(tweet_text)
+        log.info("Generated tweet (%d weighted characters): %s", tweet.length, tweet.text)
+        return tweet.text
         
     except Exception as e:
-        print(f"Error generating tweet: {e}")
+        log.error("Error generating tweet: %s", e)
         return None
 
 def post_tweet(tweet_text):
     """Post a tweet using Twitter API"""
     try:
-        # Twitter API authentication
-        client = tweepy.Client(
-            consumer_key=os.getenv('API_KEY'),
-            consumer_secret=os.getenv('API_KEY_SECRET'),
-            access_token=os.getenv('ACCESS_TOKEN'),
-            access_token_secret=os.getenv('ACCESS_TOKEN_SECRET')
-        )
+        # Shared, pooled Twitter API client
+        persona = get_default_persona()
+        client = persona.twitter.get_client()
         
-        # Clean up the tweet text to remove any meta text
-        if '"' in tweet_text:
-            tweet_text = tweet_text.split('"')[1]
+        # Strip meta text and wrapping quotes without losing text around them
+        tweet = normalize(tweet_text)
+        if not tweet.fits():
+            log.error("Not posting tweet of %d weighted characters", tweet.length)
+            return False
+        tweet_text = tweet.text
         
         # Post tweet
-        print("\nPosting tweet...")
+        log.info("Posting tweet...")
         response = client.create_tweet(text=tweet_text)
+        persona.token_ledger.posted('post')
         
-        print("\nSuccess!")
-        print(f"Check https://twitter.com/DRMZ_Agent/status/{response.data['id']}")
+        log.info("Success! Check https://twitter.com/DRMZ_Agent/status/%s", response.data['id'])
         
         return True
     except Exception as e:
-        print(f"\nError posting tweet: {e}")
+        log.error("Error posting tweet: %s", e)
         return False
 
-def test_schedule():
-    """Print scheduled times without actually tweeting"""
-    pst = pytz.timezone('America/Los_Angeles')
-    current_time = datetime.now(pst)
-    
+def test_schedule(slots=None, days=2):
+    """Print the upcoming slot deadlines without tweeting
+
+    replay.py runs the schedule itself on a simulated clock.
+    """
+    scheduler = SlotScheduler(slots or DEFAULT_SLOTS)
+    now = scheduler.now()
+    upcoming = []
+    for slot in scheduler.slots.values():
+        first = scheduler.next_occurrence(slot, now).date()
+        for day in range(days):
+            upcoming.append((scheduler.occurrence(slot, first + timedelta(days=day)), slot))
+
     print("\nMorpheus AI Scheduler Test Mode")
     print("-------------------------------")
-    print(f"Current time (PST): {current_time.strftime('%I:%M %p')}")
-    print("\nScheduled tweet times (PST):")
-    print("1. 7:00 AM  - GM + Daily insight")
-    print("2. 12:00 PM - Community engagement")
-    print("3. 6:00 PM  - Trending topics")
+    print(f"Current time: {now.strftime('%a %I:%M %p %Z')}")
+    print("\nUpcoming scheduled tweets:")
+    for due, slot in sorted(upcoming, key=lambda entry: entry[0]):
+        print(f"  {due.strftime('%a %b %d %I:%M %p %Z')}  {slot.name} ({slot.tweet_type})")
     print("\nTest Mode: No tweets will be sent")
-    print("\nPress Ctrl+C to exit test mode")
-    
-    # Simulate schedule checks
-    while True:
-        next_run = schedule.next_run()
-        if next_run:
-            print(f"\nNext scheduled tweet would be at: {next_run} PST")
-        time.sleep(10)  # Check every 10 seconds in test mode
-
-def monitor_trending_topics():
+
+def monitor_trending_topics(topics=None, k=5, persona=None):
     """Monitor trending Cardano and Web3 topics"""
+    persona = persona or get_default_persona()
     try:
-        client = tweepy.Client(
-            consumer_key=os.getenv('API_KEY'),
-            consumer_secret=os.getenv('API_KEY_SECRET'),
-            access_token=os.getenv('ACCESS_TOKEN'),
-            access_token_secret=os.getenv('ACCESS_TOKEN_SECRET')
-        )
-        
-        # Search terms for relevant topics
-        search_queries = [
-            "Cardano",
-            "DRMZ",
-            "Web3",
-            "ADA",
-            "DeFi"
-        ]
-        
-        # Get recent popular tweets for each topic
-        trending_tweets = []
-        for query in search_queries:
-            tweets = client.search_recent_tweets(
-                query=f"{query} -is:retweet min_faves:50",
-                max_results=10,
-                tweet_fields=['public_metrics', 'created_at']
-            )
-            if tweets.data:
-                trending_tweets.extend(tweets.data)
-        
-        # Sort by engagement (likes + retweets)
-        trending_tweets.sort(
-            key=lambda x: x.public_metrics['like_count'] + x.public_metrics['retweet_count'],
-            reverse=True
+        client = persona.twitter.get_client()
+        
+        # Topics are OR-combined into as few queries as fit the length
+        # limit and searched concurrently, so latency stays flat as the
+        # topic list grows. No since_id cursors: a tweet usually passes
+        # min_faves:50 well after newer tweets moved the cursor past it,
+        # and each call returns the current top k, not only new tweets.
+        return search_topics(
+            client,
+            topics or persona.account.topics,
+            k=k,
+            suffix="-is:retweet min_faves:50"
         )
         
-        return trending_tweets[:5]  # Return top 5 trending tweets
-        
     except Exception as e:
-        print(f"Error monitoring trends: {e}")
+        log.error("Error monitoring trends: %s", e)
         return None
 
+def engagement_prompt(tweet_text):
+    """Build the reply prompt for a community tweet"""
+    return prompts.render('reply', tweet_text=tweet_text)
+
+def clean_response(response_text):
+    """Strip metadata and wrapping quotes from an assistant reply"""
+    if not response_text:
+        return response_text
+    return normalize(response_text).text
+
+async def engagement_response(tweet_text, persona=None, reuse=True):
+    """Reply text for a tweet, reusing replies to identical or near-identical tweets
+
+    With `reuse` off such tweets raise AlreadyAnswered instead (see
+    ResponseCache.get_or_generate), since the reply cannot be posted twice.
+    """
+    persona = persona or get_default_persona()
+    return await persona.response_cache.get_or_generate(
+        tweet_text,
+        lambda: persona.engine.generate(engagement_prompt(tweet_text), purpose='reply'),
+        reuse=reuse
+    )
+
+async def engagement_responses(tweet_texts, persona=None):
+    """Replies for several tweets concurrently, failures become None"""
+    responses = await asyncio.gather(
+        *(engagement_response(tweet_text, persona) for tweet_text in tweet_texts),
+        return_exceptions=True
+    )
+    return [None if isinstance(response, Exception) else response for response in responses]
+
 def generate_engagement_response(tweet_text):
     """Let Morpheus AI respond based on its own training and personality"""
     try:
-        print("Analyzing community tweet...")
-        thread = openai_client.beta.threads.create()
-        
-        message = openai_client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=f"""Respond to this tweet with a brief, insightful comment:
-            "{tweet_text}"
-
-            GUIDELINES:
-            1. Keep your response concise and meaningful
-            2. Focus on one key point
-            3. Use hashtags only when they add value
-            4. If using hashtags, add them on a new line
-            5. Stay under 280 characters total
-
-            You can respond either with or without hashtags, depending on what feels most natural for your message."""
-        )
-        
-        # Run the assistant
-        run = openai_client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id="asst_5AyAw1WHxg7eOL847byMYcpr"
-        )
-        
-        # Wait for response
-        while True:
-            run_status = openai_client.beta.threads.runs.retrieve(
-                thread_id=thread.id,
-                run_id=run.id
-            )
-            
-            if run_status.status == 'completed':
-                # Get the response
-                messages = openai_client.beta.threads.messages.list(
-                    thread_id=thread.id
-                )
-                response_text = messages.data[0].content[0].text.value.strip()
-                
-                # Clean up response
-                if response_text.startswith('"') and response_text.endswith('"'):
-                    response_text = response_text[1:-1].strip()
-                
-                return response_text
-                
-            elif run_status.status == 'failed':
-                print("Failed to generate response")
-                return None
-                
-            time.sleep(1)
+        log.info("Analyzing community tweet...")
+        response_text = get_default_persona().engine.run_sync(engagement_response(tweet_text))
+        if not response_text:
+            log.warning("Failed to generate response")
+            return None
+        return clean_response(response_text)
         
     except Exception as e:
-        print(f"Error: {e}")
+        log.error("Error generating response: %s", e)
         return None
 
+def generate_engagement_responses(tweet_texts):
+    """Generate replies for several tweets concurrently"""
+    responses = get_default_persona().engine.run_sync(engagement_responses(tweet_texts))
+    cleaned = iter(normalize_many(response for response in responses if response))
+    return [next(cleaned).text if response else response for response in responses]
+
 def test_multiple_responses():
     """Test Morpheus AI's responses to different scenarios"""
     print("\nTesting Multiple Response Types")
@@ -349,261 +240,355 @@ def test_multiple_responses():
         "Community-driven development is key to success"
     ]
     
-    for i, test_case in enumerate(test_cases, 1):
+    print("Generating responses...")
+    responses = generate_engagement_responses(test_cases)
+    
+    for i, (test_case, response) in enumerate(zip(test_cases, responses), 1):
         print(f"\nTest Case {i}:")
         print(f"Input: '{test_case}'")
-        print("Generating response...")
-        
-        response = generate_engagement_response(test_case)
         if response:
-            cleaned_response = clean_tweet_text(response)
-            print(f"Response: '{cleaned_response}'")
+            print(f"Response: '{response}'")
             print("\n" + "-"*50)
-        
-        # Pause between tests to avoid rate limits
-        time.sleep(3)
 
-def monitor_cardano_community(client):
+async def respond_to_tweet(tweet, persona=None):
+    """Pipeline generation stage: reply text for a community tweet"""
+    return clean_response(await engagement_response(tweet.text, persona, reuse=False))
+
+def monitor_cardano_community(client, tracker=None, persona=None, **pipeline_options):
     """Monitor and engage with relevant Cardano community tweets"""
+    persona = persona or get_default_persona()
+    ledger = persona.token_ledger
+    if not ledger.allows_replies():
+        # The rest of today's token budget is kept for scheduled posts
+        log.info("Daily token budget reached, not replying (%d tokens spent)", ledger.spent())
+        metrics.inc('token_budget_throttled_total', kind='reply')
+        return 0
     try:
-        print("Monitoring Cardano community tweets...")
-        # Updated search query without min_faves
-        tweets = client.search_recent_tweets(
-            query="(Cardano OR ADA OR Web3) -is:retweet lang:en",
-            max_results=10,
-            tweet_fields=['public_metrics', 'created_at', 'author_id']
+        pipeline_options.setdefault('post_bucket', persona.reply_bucket)
+        pipeline_options.setdefault('cursors', persona.search_cursors)
+        pipeline_options.setdefault('query', persona.account.community_query)
+        pipeline_options.setdefault('jobs', persona.jobs)
+        pipeline_options.setdefault('candidates', persona.candidates)
+        pipeline = CommunityPipeline(
+            client,
+            tracker or persona.tracker,
+            lambda tweet: respond_to_tweet(tweet, persona),
+            forget=lambda tweet: persona.response_cache.discard(tweet.text),
+            **pipeline_options
         )
-        
-        if tweets.data:
-            for tweet in tweets.data:
-                # Filter for tweets with some engagement
-                if tweet.public_metrics['like_count'] >= 5:
-                    # Skip if we've already replied
-                    if tracker.already_replied(tweet.id):
-                        continue
-                        
-                    # Generate and post response
-                    response = generate_engagement_response(tweet.text)
-                    if response:
-                        print(f"\nResponding to tweet: {tweet.text[:100]}...")
-                        client.create_tweet(
-                            text=response,
-                            in_reply_to_tweet_id=tweet.id
-                        )
-                        
-                        # Mark as replied
-                        tracker.mark_as_replied(tweet.id)
-                        
-                        # Wait between responses
-                        time.sleep(60)
-                        
+        with charged_to(ledger, 'reply'):
+            replies = persona.engine.run_sync(pipeline.run_once())
+        ledger.posted('reply', replies)
+        return replies
+
     except Exception as e:
-        print(f"Error monitoring community: {e}")
-
-def run_morpheus_bot(client, test_mode=False):
-    """Main bot function for continuous operation"""
-    tracker = TweetTracker()
-    last_tweets = {
-        'morning': None,
-        'afternoon': None,
-        'evening': None,
-        'night': None  # Add night tweet tracking
-    }
-    
+        log.error("Error monitoring community: %s", e)
+        return 0
+
+def persona_ingestor(persona, **options):
+    """Filtered-stream ingestor over the persona's rules and search cursors"""
+    return StreamIngestor(
+        persona.twitter,
+        account_rules(persona.account),
+        prefix=f"{persona.name}:",
+        cursors=persona.search_cursors,
+        **options
+    )
+
+def stream_community(persona=None, tracker=None, stop=None, ingestor=None,
+                     batch_size=50, batch_wait=5.0, **pipeline_options):
+    """Reply to community tweets from the filtered stream until `stop` is set
+
+    The push-based alternative to polling with monitor_cardano_community:
+    tweets arrive seconds after they are posted and searches are only
+    spent on backfilling after a reconnect. Batches go through the same
+    pipeline (tracker dedupe, candidate scoring, reply bucket), which
+    drains the bounded stream buffer only as fast as it posts. As with
+    polling, only the community query is streamed and replied to.
+    """
+    persona = persona or get_default_persona()
+    stop = stop or threading.Event()
+    ingestor = ingestor or persona_ingestor(persona)
+    pipeline_options.setdefault('post_bucket', persona.reply_bucket)
+    pipeline_options.setdefault('jobs', persona.jobs)
+    pipeline_options.setdefault('candidates', persona.candidates)
+    # Streamed tweets are seconds old, so they have no likes yet
+    pipeline_options.setdefault('min_likes', 0)
+    pipeline = CommunityPipeline(
+        persona.twitter.get_client(),
+        tracker or persona.tracker,
+        lambda tweet: respond_to_tweet(tweet, persona),
+        forget=lambda tweet: persona.response_cache.discard(tweet.text),
+        **pipeline_options
+    )
+    ledger = persona.token_ledger
+    ingestor.start()
+    replies = 0
+    try:
+        while not stop.is_set():
+            if not ledger.allows_replies():
+                # Over today's reply budget: leave tweets buffered (oldest are dropped)
+                metrics.inc('token_budget_throttled_total', kind='reply')
+                stop.wait(batch_wait)
+                continue
+            tweets = ingestor.drain(batch_size, batch_wait)
+            try:
+                resumed = pipeline.resume()
+                if tweets or resumed:
+                    with charged_to(ledger, 'reply'):
+                        posted = persona.engine.run_sync(pipeline.process(tweets, resumed))
+                    ledger.posted('reply', posted)
+                    replies += posted
+            except Exception as e:
+                log.error("Error replying to streamed tweets: %s", e)
+    finally:
+        ingestor.stop()
+    return replies
+
+def start_community_stream(persona=None, **options):
+    """Run stream_community in a daemon thread; returns the event that stops it
+
+    /readyz reports the stream as not ready while it is disconnected.
+    """
+    persona = persona or get_default_persona()
+    stop = threading.Event()
+    ingestor = persona_ingestor(persona)
+    metrics.register_check(f"stream:{persona.name}", ingestor.alive)
+    threading.Thread(
+        target=stream_community,
+        kwargs=dict(options, persona=persona, stop=stop, ingestor=ingestor),
+        name=f"stream-{persona.name}",
+        daemon=True
+    ).start()
+    return stop
+
+def run_morpheus_bot(client=None, test_mode=False, slots=None, stream=False):
+    """Main bot function for continuous operation
+
+    Without `client` the default account's client is created when the
+    first slot fires, so the scheduler is up before tweepy is loaded.
+    With `stream` community tweets from the filtered stream are answered
+    alongside the schedule.
+    """
     if test_mode:
-        print("\nRunning in TEST MODE - Generating immediate tweet...")
-        generate_and_post_tweet(client, "test")
+        log.info("Running in TEST MODE - Generating immediate tweet...")
+        generate_and_post_tweet(client or get_default_persona().twitter.get_client(), "test")
         return
 
-    while True:
-        try:
-            current_time = datetime.now(pytz.timezone('America/Los_Angeles'))
-            current_date = current_time.date()
-            
-            # Clear daily tracking at midnight
-            if current_time.hour == 0 and current_time.minute == 0:
-                last_tweets = {
-                    'morning': None,
-                    'afternoon': None,
-                    'evening': None,
-                    'night': None
-                }
-            
-            # Debug logging
-            print(f"\nChecking schedule at: {current_time.strftime('%I:%M:%S %p PST')}")
-            
-            # Morning Tweet (7:00 AM PST)
-            if (current_time.hour == 7 and 
-                current_time.minute < 5 and 
-                last_tweets['morning'] != current_date):
-                print("\nTime for morning tweet!")
-                if generate_and_post_tweet(client, "morning"):
-                    last_tweets['morning'] = current_date
-                    print("Morning tweet posted successfully!")
-            
-            # Afternoon Tweet (1:30 PM PST)
-            elif (current_time.hour == 13 and 
-                  current_time.minute >= 30 and 
-                  current_time.minute < 35 and 
-                  last_tweets['afternoon'] != current_date):
-                print("\nTime for afternoon tweet!")
-                if generate_and_post_tweet(client, "community"):
-                    last_tweets['afternoon'] = current_date
-                    print("Afternoon tweet posted successfully!")
-            
-            # Evening Tweet (6:00 PM PST)
-            elif (current_time.hour == 18 and 
-                  current_time.minute < 5 and 
-                  last_tweets['evening'] != current_date):
-                print("\nTime for evening tweet!")
-                if generate_and_post_tweet(client, "trending"):
-                    last_tweets['evening'] = current_date
-                    print("Evening tweet posted successfully!")
-            
-            # Night Tweet (9:00 PM PST)
-            elif (current_time.hour == 21 and 
-                  current_time.minute < 5 and 
-                  last_tweets['night'] != current_date):
-                print("\nTime for night tweet!")
-                if generate_and_post_tweet(client, "night"):
-                    last_tweets['night'] = current_date
-                    print("Night tweet posted successfully!")
-            
-            # Update next tweet time logic with more precise conditions
-            next_tweet_time = None
-            current_hour = current_time.hour
-            current_minute = current_time.minute
-
-            if current_hour < 7 or (current_hour == 7 and current_minute < 5):
-                next_tweet_time = "7:00 AM PST"
-            elif current_hour < 13 or (current_hour == 13 and current_minute < 30):
-                next_tweet_time = "1:30 PM PST"
-            elif current_hour < 18 or (current_hour == 18 and current_minute < 5):
-                next_tweet_time = "6:00 PM PST"
-            elif current_hour < 21 or (current_hour == 21 and current_minute < 5):
-                next_tweet_time = "9:00 PM PST"
-            else:
-                next_tweet_time = "7:00 AM PST tomorrow"
-
-            # Debug print to help verify the logic
-            print(f"Checking schedule at: {current_time.strftime('%I:%M:%S %p PST')}")
-            print(f"Current hour: {current_hour}, Current minute: {current_minute}")
-            print(f"Next scheduled tweet: {next_tweet_time}")
-            
-            # More frequent checks near scheduled times
-            if ((current_hour == 6 and current_minute >= 55) or
-                (current_hour == 13 and current_minute >= 25 and current_minute < 35) or
-                (current_hour == 17 and current_minute >= 55)):
-                time.sleep(15)  # Check every 15 seconds near scheduled times
-            else:
-                time.sleep(30)  # Regular 30-second checks
-            
-        except Exception as e:
-            print(f"Error in main loop: {e}")
-            print(f"Full error details: {str(e)}")
-            time.sleep(300)
+    if stream:
+        start_community_stream()
+
+    # Sleeps until the next slot deadline; fired slots are persisted so a
+    # restart neither reposts nor silently skips a slot
+    scheduler = SlotScheduler(slots or DEFAULT_SLOTS)
+    # Content is generated ahead of each slot so posting at the deadline
+    # is a single create_tweet call
+    scheduler.run_forever(
+        lambda slot, due: post_slot_tweet(
+            client or get_default_persona().twitter.get_client(), slot, due
+        ),
+        prepare=prepare_slot_tweet
+    )
+
+def run_accounts(accounts=None, shard=None, shards=None, stream=False):
+    """Run the schedules of every persona owned by this shard in one process
+
+    Accounts come from accounts.json (see accounts.load_accounts) and are
+    split across processes by consistent hashing on SHARD_INDEX of
+    SHARD_COUNT. All personas share one scheduler thread, event loop,
+    OpenAI client and Twitter connection pool; rate-limit budgets,
+    trackers and state files stay per account. With `stream` every
+    persona also answers its filtered stream (its own app bearer token).
+    """
+    accounts = shard_accounts(load_accounts() if accounts is None else accounts, shard, shards)
+    if not accounts:
+        log.error("No accounts to run on this shard")
+        return
+    owners = {}
+    slots = []
+    for persona in build_personas(accounts):
+        if stream:
+            start_community_stream(persona)
+        for slot in persona.account.slots:
+            scoped = Slot(f"{persona.name}:{slot.name}", slot.hour, slot.minute, slot.tweet_type)
+            owners[scoped.name] = persona
+            slots.append(scoped)
+    log.info("Running %d accounts: %s", len(accounts), ', '.join(account.name for account in accounts))
+
+    scheduler = SlotScheduler(slots)
+    scheduler.run_forever(
+        lambda slot, due: post_slot_tweet(
+            owners[slot.name].twitter.get_client(), slot, due, owners[slot.name]
+        ),
+        prepare=lambda slot, due: prepare_slot_tweet(slot, due, owners[slot.name])
+    )
 
 def verify_credentials():
     """Verify Twitter API credentials before starting"""
     try:
-        print("Verifying Twitter credentials...")
-        client = tweepy.Client(
-            bearer_token=os.getenv('BEARER_TOKEN'),
-            consumer_key=os.getenv('API_KEY'),
-            consumer_secret=os.getenv('API_KEY_SECRET'),
-            access_token=os.getenv('ACCESS_TOKEN'),
-            access_token_secret=os.getenv('ACCESS_TOKEN_SECRET'),
-            wait_on_rate_limit=False  # Changed to False to avoid infinite wait
-        )
+        log.info("Verifying Twitter credentials...")
+        client = get_default_persona().twitter.get_client()
         
         # Test the credentials without getting user data
-        print("Authentication successful!")
+        log.info("Authentication successful!")
         return client
         
     except Exception as e:
-        print(f"Authentication Error: {e}")
-        print("Please check your Twitter API credentials in .env file")
+        log.error("Authentication Error: %s", e)
+        log.error("Please check your Twitter API credentials in .env file")
         return None
 
-def generate_and_post_tweet(client, tweet_type="test"):
-    """Generate and post a tweet based on the type"""
+# One run returns several versions so a too-long tweet rarely costs another round-trip
+CANDIDATE_SEPARATOR = '---'
+TARGET_TWEET_LENGTH = 200
+
+def candidates_prompt(prompt, count):
+    """Ask for `count` alternative versions of a tweet in a single reply"""
+    if count <= 1:
+        return prompt
+    return prompts.render('candidates', prompt=prompt, count=count, separator=CANDIDATE_SEPARATOR)
+
+CANDIDATE_SPLIT_PATTERN = re.compile(r'^\s*-{3,}\s*$', re.MULTILINE)
+# "1." / "Version 2:" labels, keeping an opening quote that precedes them
+CANDIDATE_LABEL_PATTERN = re.compile(r'^\s*(["\u201c]?)\s*(?:\d+[.):]|version \d+:?)\s*', re.IGNORECASE)
+
+def split_candidates(text):
+    """Split a multi-version reply into normalized tweets"""
+    parts = (CANDIDATE_LABEL_PATTERN.sub(r'\1', part).strip()
+             for part in CANDIDATE_SPLIT_PATTERN.split(text))
+    return [tweet for tweet in normalize_many(part for part in parts if part) if tweet.text]
+
+def rank_candidates(candidates, target=TARGET_TWEET_LENGTH):
+    """Distinct tweets that fit Twitter's weighted limit, closest to the target length first"""
+    fitting = {candidate.text: candidate for candidate in candidates if candidate.fits()}
+    return [candidate.text for candidate in
+            sorted(fitting.values(), key=lambda candidate: abs(candidate.length - target))]
+
+def generate_tweet_candidates(tweet_type="test", count=3, persona=None, hedge=False):
+    """Generate up to `count` tweet versions in one request, best-fitting first"""
+    engine = (persona or get_default_persona()).engine
+    prompt = prompts.tweet_prompt(tweet_type)
+    if engine.supports_n:
+        texts = engine.run_sync(engine.generate_n(prompt, count, purpose='post', hedge=hedge))
+        candidates = [candidate for text in texts for candidate in split_candidates(text)]
+    else:
+        text = engine.run_sync(engine.generate(candidates_prompt(prompt, count), purpose='post',
+                                               hedge=hedge))
+        candidates = split_candidates(text) if text else []
+    ranked = rank_candidates(candidates)
+    if len(ranked) < len(candidates):
+        log.info("Dropped %d of %d candidates over 280 weighted characters",
+                 len(candidates) - len(ranked), len(candidates))
+    return ranked
+
+def post_scheduled_tweet(client, tweet_text, job_key=None, persona=None):
+    """Post a scheduled tweet ahead of queued community replies
+
+    With `job_key` the post goes through the persona's job queue and is
+    skipped if that job was already posted (e.g. before a restart).
+    """
+    log.info("Posting tweet: %s", tweet_text)
+    with request_priority(PRIORITY_SCHEDULED):
+        if job_key:
+            post_once((persona or get_default_persona()).jobs, client, job_key, tweet_text)
+        else:
+            client.create_tweet(text=tweet_text)
+    log.info("Tweet posted successfully!")
+    return True
+
+def prepare_slot_tweet(slot, due, persona=None):
+    """Look-ahead hook: buffer a tweet plus one spare before the slot opens"""
+    persona = persona or get_default_persona()
+    tweet_buffer = persona.tweet_buffer
+    key = tweet_buffer.key(slot, due)
+    if tweet_buffer.has(key):
+        return
+    log.info("Pre-generating %s tweet for %s slot...", slot.tweet_type, slot.name)
+    with charged_to(persona.token_ledger, f"slot:{slot.name}"):
+        candidates = generate_tweet_candidates(slot.tweet_type, count=2, persona=persona)
+    if candidates:
+        tweet_buffer.put(key, candidates, due.timestamp())
+
+def post_slot_tweet(client, slot, due, persona=None):
+    """Post the tweet for a slot exactly once: stored, buffered or generated live
+
+    Each slot occurrence is a job keyed by slot and date. Its text is stored
+    before posting, so a retry or restart reposts nothing that went out and
+    retries the same text if it did not. Tokens are charged to the slot.
+    """
+    persona = persona or get_default_persona()
+    key = persona.tweet_buffer.key(slot, due)
+    job_key = f"post:{key}"
+    persona.jobs.enqueue(job_key, 'post', {'slot': slot.name, 'tweet_type': slot.tweet_type,
+                                           'due': due.timestamp()})
+    job = persona.jobs.get(job_key)
+    if job['state'] == POSTED:
+        log.info("%s tweet for %s was already posted", slot.name, due.date())
+        return True
+
+    tweet_text = job['result'] or persona.tweet_buffer.take(key)
+    if tweet_text is None:
+        # Live generation is hedged and leaves part of the deadline for posting
+        with deadlines.within(reserve=POST_RESERVE), \
+                charged_to(persona.token_ledger, f"slot:{slot.name}"):
+            tweet_text = generate_tweet(slot.tweet_type, persona=persona, hedge=True)
+        if tweet_text is None:
+            return False
+    if not job['result']:
+        persona.jobs.mark_generated(job_key, tweet_text)
     try:
-        print(f"Generating {tweet_type} tweet...")
-        
-        # Create a new thread
-        thread = openai_client.beta.threads.create()
-        
-        # Updated prompts with character limit emphasis
-        prompts = {
-            "morning": "Create a brief good morning tweet about Cardano or Web3. Keep it under 200 characters.",
-            "community": "Share a brief thought about the Cardano community. Keep it under 200 characters.",
-            "trending": "Comment briefly on Cardano or Web3 trends. Keep it under 200 characters.",
-            "test": """As Morpheus AI, share ONE brief insight about Cardano (max 200 characters).
-
-            IMPORTANT:
-            - Keep it very concise
-            - One key point only
-            - Optional hashtags at the end
-            - Total must be under 280 characters
-            
-            Example: 'The eUTXO model brings unprecedented precision to DeFi transactions, making Cardano a fortress of financial reliability. #Cardano #DeFi'"""
-        }
-        
-        # Create message in thread
-        message = openai_client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=prompts.get(tweet_type, prompts["test"])
-        )
-        
-        # Run the assistant
-        run = openai_client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id="asst_5AyAw1WHxg7eOL847byMYcpr"  # Make sure this is your correct assistant ID
-        )
-        
-        print("Waiting for response...")
-        
-        # Wait for response with timeout
-        timeout = 30  # 30 seconds timeout
-        start_time = time.time()
-        
-        while time.time() - start_time < timeout:
-            run_status = openai_client.beta.threads.runs.retrieve(
-                thread_id=thread.id,
-                run_id=run.id
-            )
-            
-            if run_status.status == 'completed':
-                messages = openai_client.beta.threads.messages.list(
-                    thread_id=thread.id
-                )
-                tweet_text = messages.data[0].content[0].text.value
-                
-                # Clean and format the tweet
-                cleaned_tweet = clean_tweet_text(tweet_text)
-                
-                if len(cleaned_tweet) > 280:
-                    print(f"Tweet too long ({len(cleaned_tweet)} chars). Regenerating...")
-                    return generate_and_post_tweet(client, tweet_type)
-                
-                print(f"\nPosting tweet: {cleaned_tweet}")
-                response = client.create_tweet(text=cleaned_tweet)
-                print("Tweet posted successfully!")
-                return True
-                
-            elif run_status.status == 'failed':
-                print("Failed to generate tweet - Assistant error")
-                return False
-                
-            time.sleep(1)
-            
-        print("Tweet generation timed out")
+        posted = post_scheduled_tweet(client, tweet_text, job_key, persona)
+        persona.token_ledger.posted(f"slot:{slot.name}")
+        return posted
+    except Exception as e:
+        # The job keeps its text (unless Twitter rejected it as a duplicate);
+        # the scheduler's retry posts it again
+        log.error("Error posting %s tweet: %s", slot.name, e)
         return False
-            
+
+def generate_tweet(tweet_type="test", max_attempts=3, backoff=2.0, persona=None, hedge=False):
+    """Best-fitting tweet of the type, retrying a bounded number of times; None if none fit
+
+    Gives up early when the generation backend's circuit is open or the
+    current deadline (see deadlines.within) leaves no time for a retry.
+    """
+    for attempt in range(max_attempts):
+        log.info("Generating %s tweet...", tweet_type)
+        try:
+            candidates = generate_tweet_candidates(tweet_type, persona=persona, hedge=hedge)
+        except (CircuitOpenError, deadlines.DeadlineExceeded) as e:
+            log.error("Not generating %s tweet: %s", tweet_type, e)
+            return None
+        if candidates:
+            return candidates[0]
+
+        metrics.inc('tweet_regenerations_total', tweet_type=tweet_type)
+        if attempt + 1 < max_attempts:
+            delay = backoff * 2 ** attempt
+            left = deadlines.remaining()
+            if left is not None and left <= delay:
+                break
+            log.warning("No usable tweet generated. Retrying in %.0fs...", delay)
+            clock.sleep(delay)
+
+    log.error("Giving up on %s tweet after %d attempts", tweet_type, attempt + 1)
+    return None
+
+def generate_and_post_tweet(client, tweet_type="test", max_attempts=3, backoff=2.0, persona=None,
+                            hedge=False):
+    """Generate and post a tweet based on the type, retrying a bounded number of times"""
+    persona = persona or get_default_persona()
+    try:
+        with charged_to(persona.token_ledger, 'post'):
+            tweet_text = generate_tweet(tweet_type, max_attempts, backoff, persona, hedge)
+        if tweet_text is None:
+            return False
+        posted = post_scheduled_tweet(client, tweet_text)
+        persona.token_ledger.posted('post')
+        return posted
+
     except Exception as e:
-        print(f"Error generating/posting tweet: {e}")
-        print("Full error details:", str(e))
+        log.exception("Error generating/posting tweet: %s", e)
         return False
 
 def main():
@@ -619,24 +604,8 @@ def main():
     print("\nTest complete!")
 
 if __name__ == "__main__":
-    client = verify_credentials()
-    if client:
-        print("\nStarting Morpheus AI Twitter Bot...")
-        print("1. Run in production mode (scheduled tweets)")
-        print("2. Run in test mode (immediate tweet)")
-        choice = input("Choose mode (1/2): ")
-        
-        if choice == "2":
-            run_morpheus_bot(client, test_mode=True)
-        else:
-            current_time = datetime.now(pytz.timezone('America/Los_Angeles'))
-            print(f"\nBot Started at: {current_time.strftime('%I:%M:%S %p PST')}")
-            print("\nScheduled Times (PST):")
-            print("- 7:00 AM  : Morning tweet (GM + insight)")
-            print("- 1:30 PM  : Community engagement")
-            print("- 6:00 PM  : Trending topics")
-            print("- 9:00 PM  : Evening reflection")
-            print("\nPress Ctrl+C to stop")
-            run_morpheus_bot(client)
-    else:
-        print("\nBot startup cancelled due to authentication failure")
\ No newline at end of file
+    # The interactive menu is gone so the bot can run under a supervisor:
+    # no arguments runs the schedule, see cli.py for the other commands
+    import sys
+    from cli import main as cli_main
+    sys.exit(cli_main(sys.argv[1:] or ['run']))
@@ -0,0 +1,99 @@
+import re
+import string
+
+# English text averages about four characters per token with the GPT tokenizers
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text):
+    """Approximate token count of `text`, for backends that report no usage"""
+    return max(1, round(len(text) / CHARS_PER_TOKEN)) if text else 0
+
+_SPACES = re.compile(r'[ \t]+')
+
+def minify(template):
+    """Template text without indentation, repeated spaces or blank lines
+
+    Line breaks are kept, since the guideline lists rely on them.
+    """
+    lines = (_SPACES.sub(' ', line).strip() for line in template.strip().splitlines())
+    return '\n'.join(line for line in lines if line)
+
+class Prompt:
+    """A generation prompt, minified once; `render` fills its {placeholders}
+
+    Only the template is minified, never the values, so quoted tweets are
+    sent as written.
+    """
+
+    def __init__(self, name, template):
+        self.name = name
+        self.source_length = len(template)
+        self.text = minify(template)
+        self.fields = {field for _, field, _, _ in string.Formatter().parse(self.text) if field}
+
+    def __repr__(self):
+        return f"Prompt({self.name!r}, {len(self.text)} chars)"
+
+    def render(self, **values):
+        return self.text.format(**values) if self.fields else self.text
+
+PROMPTS = {}
+
+def register(name, template):
+    PROMPTS[name] = Prompt(name, template)
+    return PROMPTS[name]
+
+def render(name, **values):
+    return PROMPTS[name].render(**values)
+
+def tweet_prompt(tweet_type):
+    """Prompt text for a scheduled tweet type; unknown types use the test prompt"""
+    return (PROMPTS.get(f"tweet:{tweet_type}") or PROMPTS['tweet:test']).render()
+
+def compaction():
+    """(characters as written, characters sent) over all registered templates"""
+    return (sum(prompt.source_length for prompt in PROMPTS.values()),
+            sum(len(prompt.text) for prompt in PROMPTS.values()))
+
+# Updated prompts with character limit emphasis
+register('tweet:morning',
+         "Create a brief good morning tweet about Cardano or Web3. Keep it under 200 characters.")
+register('tweet:community',
+         "Share a brief thought about the Cardano community. Keep it under 200 characters.")
+register('tweet:trending',
+         "Comment briefly on Cardano or Web3 trends. Keep it under 200 characters.")
+register('tweet:test', """As Morpheus AI, share ONE brief insight about Cardano (max 200 characters).
+
+            IMPORTANT:
+            - Keep it very concise
+            - One key point only
+            - Optional hashtags at the end
+            - Total must be under 280 characters
+
+            Example: 'The eUTXO model brings unprecedented precision to DeFi transactions, making Cardano a fortress of financial reliability. #Cardano #DeFi'""")
+
+# One run returns several versions so a too-long tweet rarely costs another round-trip
+register('candidates', """{prompt}
+
+            Write {count} different versions of this tweet.
+            Put a line containing only {separator} between versions.
+            No numbering, labels or commentary.""")
+
+register('insight', """Share ONE brief technical insight about Cardano or DRMZ.
+        STRICT REQUIREMENTS:
+        - Maximum 280 characters
+        - Focus on a single point
+        - Include 1-2 relevant hashtags
+        - Be concise but informative""")
+
+register('reply', """Respond to this tweet with a brief, insightful comment:
+            "{tweet_text}"
+
+            GUIDELINES:
+            1. Keep your response concise and meaningful
+            2. Focus on one key point
+            3. Use hashtags only when they add value
+            4. If using hashtags, add them on a new line
+            5. Stay under 280 characters total
+
+            You can respond either with or without hashtags, depending on what feels most natural for your message.""")
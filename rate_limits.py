@@ -0,0 +1,196 @@
+import re
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+import clock
+
+# Lower values are served first when calls queue for the same endpoint
+PRIORITY_SCHEDULED = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_REPLY = 2
+
+_priority = contextvars.ContextVar('twitter_request_priority', default=PRIORITY_DEFAULT)
+
+@contextmanager
+def request_priority(priority):
+    """Run the enclosed Twitter calls at `priority` (inherited by asyncio.to_thread)"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+# (method, route pattern, endpoint name)
+ENDPOINTS = [
+    ('GET', re.compile(r'^/2/tweets/search/recent$'), 'search_recent_tweets'),
+    ('POST', re.compile(r'^/2/tweets$'), 'create_tweet'),
+    ('GET', re.compile(r'^/2/users/me$'), 'get_me'),
+    ('GET', re.compile(r'^/2/users/[^/]+/tweets$'), 'get_users_tweets'),
+]
+
+# Per 15-minute window, used until the API reports the real values
+DEFAULT_LIMITS = {
+    'search_recent_tweets': 180,
+    'create_tweet': 100,
+    'get_me': 75,
+    'get_users_tweets': 900,
+}
+DEFAULT_WINDOW = 15 * 60
+
+# Reset times are whole seconds, so wait a little past them
+RESET_SLACK = 1.0
+
+def endpoint_name(method, route):
+    for endpoint_method, pattern, name in ENDPOINTS:
+        if method == endpoint_method and pattern.match(route):
+            return name
+    return f"{method} {route}"
+
+class EndpointBudget:
+    """Remaining calls in the current rate-limit window of one endpoint"""
+
+    def __init__(self, limit, window=DEFAULT_WINDOW):
+        self.limit = limit
+        self.window = window
+        self.remaining = limit
+        self.reset = clock.time() + window
+        # Until the API has reported real limits, send one probe call at a time
+        self.known = False
+        self.in_flight = 0
+        self.calls = 0
+        self.throttled_seconds = 0.0
+        self.waiters = []
+
+    def refresh(self, now):
+        """Start a new window once the reset time has passed"""
+        if now >= self.reset + RESET_SLACK:
+            self.remaining = self.limit
+            self.reset = now + self.window
+
+    def update(self, headers):
+        """Take limit, remaining and reset from the x-rate-limit-* response headers"""
+        try:
+            limit = int(headers['x-rate-limit-limit'])
+            remaining = int(headers['x-rate-limit-remaining'])
+            reset = int(headers['x-rate-limit-reset'])
+        except (KeyError, TypeError, ValueError):
+            return False
+        # Calls reserved locally but not yet answered may not be counted by the
+        # server yet, so never hand out more than the local count allows
+        if reset == self.reset:
+            remaining = min(self.remaining, remaining)
+        else:
+            remaining = max(remaining - self.in_flight, 0)
+        self.limit = limit
+        self.reset = reset
+        self.remaining = remaining
+        self.known = True
+        return True
+
+    def ready(self):
+        return self.remaining > 0 and (self.known or self.in_flight == 0)
+
+    def exhaust(self, reset):
+        """Record a 429: nothing left until `reset`"""
+        self.remaining = 0
+        if reset:
+            self.reset = reset
+
+class RateLimitGovernor:
+    """Per-endpoint call budgets shared by every Twitter request
+
+    Calls reserve a slot before they are sent and wait, in priority order,
+    when the endpoint's window is used up, so the quota is spent fully
+    without running into 429 responses.
+    """
+
+    def __init__(self, limits=None, window=DEFAULT_WINDOW):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.window = window
+        self.budgets = {}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+
+    def budget(self, endpoint):
+        if endpoint not in self.budgets:
+            self.budgets[endpoint] = EndpointBudget(
+                self.limits.get(endpoint, DEFAULT_LIMITS['get_users_tweets']), self.window
+            )
+        return self.budgets[endpoint]
+
+    def acquire(self, endpoint, priority=None, timeout=None):
+        """Block until `endpoint` has budget and this call is first in line
+
+        Returns False if `timeout` seconds pass first.
+        """
+        priority = _priority.get() if priority is None else priority
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            budget = self.budget(endpoint)
+            ticket = (priority, next(self._seq))
+            heapq.heappush(budget.waiters, ticket)
+            waited_from = clock.time()
+            try:
+                while True:
+                    now = clock.time()
+                    budget.refresh(now)
+                    if budget.waiters[0] == ticket and budget.ready():
+                        heapq.heappop(budget.waiters)
+                        budget.remaining -= 1
+                        budget.in_flight += 1
+                        budget.calls += 1
+                        budget.throttled_seconds += now - waited_from
+                        self._cond.notify_all()
+                        return True
+                    wait = None
+                    if budget.remaining <= 0:
+                        wait = max(budget.reset + RESET_SLACK - now, 0.01)
+                    if deadline is not None:
+                        left = deadline - time.monotonic()
+                        if left <= 0:
+                            return False
+                        wait = left if wait is None else min(wait, left)
+                    self._cond.wait(wait)
+            finally:
+                if ticket in budget.waiters:
+                    budget.waiters.remove(ticket)
+                    heapq.heapify(budget.waiters)
+                    self._cond.notify_all()
+
+    def release(self, endpoint, headers=None):
+        """Finish a call acquired earlier, taking the budget from its response headers"""
+        with self._cond:
+            budget = self.budget(endpoint)
+            budget.in_flight = max(budget.in_flight - 1, 0)
+            if headers is not None:
+                budget.update(headers)
+            self._cond.notify_all()
+
+    def exhaust(self, endpoint, reset):
+        """Finish a call that got a 429: nothing left until `reset`"""
+        with self._cond:
+            budget = self.budget(endpoint)
+            budget.in_flight = max(budget.in_flight - 1, 0)
+            budget.exhaust(reset)
+            budget.known = True
+            self._cond.notify_all()
+
+    def metrics(self):
+        """Current budget of every endpoint seen so far"""
+        now = clock.time()
+        with self._cond:
+            return {
+                endpoint: {
+                    'limit': budget.limit,
+                    'remaining': budget.remaining,
+                    'reset_in': max(budget.reset - now, 0),
+                    'in_flight': budget.in_flight,
+                    'waiting': len(budget.waiters),
+                    'calls': budget.calls,
+                    'throttled_seconds': round(budget.throttled_seconds, 3),
+                }
+                for endpoint, budget in self.budgets.items()
+            }
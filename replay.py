@@ -0,0 +1,216 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+import pytz
+import clock
+from fake_apis import FakeServer, FakeTwitter, FakeOpenAI
+from generation_backends import BACKENDS
+from bench_bot import percentile
+from token_usage import format_report
+import prompts
+from scheduler import SlotScheduler, DEFAULT_SLOTS, TIMEZONE, localize
+
+# Starts the Thursday before the 2025 spring-forward (March 9) in Pacific time
+DEFAULT_START = '2025-03-06'
+
+class SlotLog:
+    """Outcome of every slot attempt: when it finished and how long it took"""
+
+    def __init__(self, tz):
+        self.tz = tz
+        self.attempts = []
+
+    def record(self, slot, due, ok, seconds):
+        self.attempts.append({
+            'slot': slot,
+            'due': due,
+            'at': datetime.fromtimestamp(clock.time(), self.tz),
+            'seconds': seconds,
+            'ok': bool(ok),
+        })
+
+    def on_time(self, tolerance):
+        """{(slot name, local date): delay} of slots posted within `tolerance` seconds
+
+        Checked against the local wall clock at posting time rather than
+        the scheduler's own deadlines, so a DST mistake shows up as a miss.
+        """
+        hits = {}
+        for attempt in self.attempts:
+            at, slot = attempt['at'], attempt['slot']
+            wall = at.replace(tzinfo=None) - datetime(at.year, at.month, at.day, slot.hour, slot.minute)
+            if attempt['ok'] and 0 <= wall.total_seconds() <= tolerance:
+                hits.setdefault((slot.name, at.date()), wall.total_seconds())
+        return hits
+
+def expected_slots(scheduler, start, end):
+    """(slot name, local date, deadline) of every occurrence in [start, end)"""
+    expected = []
+    day = start.date()
+    while day <= end.date():
+        for slot in scheduler.slots.values():
+            due = scheduler.occurrence(slot, day)
+            if start <= due < end:
+                expected.append((slot.name, day, due))
+        day += timedelta(days=1)
+    return expected
+
+def utc_offsets(tz, day):
+    """UTC offsets in hours at the start and end of a local day"""
+    start = localize(tz, datetime(day.year, day.month, day.day))
+    end = localize(tz, datetime(day.year, day.month, day.day) + timedelta(days=1))
+    return start.utcoffset().total_seconds() / 3600, end.utcoffset().total_seconds() / 3600
+
+def simulate(args):
+    """Drive the schedule, community polling and tracker expiry over `args.days` virtual days
+
+    Slots post through post_slot_tweet with look-ahead generation, like
+    run_morpheus_bot; between deadlines the community is polled every
+    `args.poll_minutes`. Returns the slot log, scheduler, number of
+    replies, tracker, (start, end) of the span and the simulated clock.
+    """
+    import morpheus_ai_twitter_bot as bot
+    from accounts import Account, Persona
+    from community_pipeline import TokenBucket
+
+    tz = pytz.timezone(args.timezone)
+    naive = datetime.fromisoformat(args.start)
+    start = localize(tz, naive)
+    end = localize(tz, naive + timedelta(days=args.days))
+    poll = args.poll_minutes * 60 or end.timestamp() - start.timestamp()
+
+    with clock.using(clock.SimulatedClock(start.timestamp())) as sim:
+        persona = Persona(Account('replay', 'asst_replay', state_dir=args.state_dir,
+                                  token_budget=args.token_budget))
+        client = persona.twitter.get_client()
+        tracker = persona.tracker
+        scheduler = SlotScheduler(DEFAULT_SLOTS, state_file=persona.account.path('slot_state.json'),
+                                  timezone=args.timezone)
+        bucket = TokenBucket(rate=args.post_rate, capacity=1)
+        slots = SlotLog(tz)
+
+        def post(slot, due):
+            started = time.perf_counter()
+            ok = bot.post_slot_tweet(client, slot, due, persona)
+            slots.record(slot, due, ok, time.perf_counter() - started)
+            return ok
+
+        replies = 0
+        until = start.timestamp()
+        while until < end.timestamp():
+            until = min(until + poll, end.timestamp())
+            # Returns before the first event past `until`; the next call
+            # rebuilds the heap from the persisted slot state like a restart
+            scheduler.run(post, prepare=lambda slot, due: bot.prepare_slot_tweet(slot, due, persona),
+                          until=until)
+            sim.advance(until - sim.time())
+            if args.poll_minutes:
+                replies += bot.monitor_cardano_community(
+                    client, tracker, persona, post_bucket=bucket, min_likes=0
+                ) or 0
+        return slots, scheduler, replies, tracker, persona.token_ledger, (start, end), sim
+
+def report(args, slots, scheduler, replies, tracker, ledger, span, sim, elapsed, twitter, openai):
+    """Print slot-hit accuracy per local day, posting delay, tracker expiry and API calls"""
+    start, end = span
+    expected = expected_slots(scheduler, start, end)
+    on_time = slots.on_time(args.tolerance)
+    hits = [(name, day) for name, day, _ in expected if (name, day) in on_time]
+
+    print(f"\n== replay: {args.days} days from {start.strftime('%Y-%m-%d %H:%M %Z')} "
+          f"({args.timezone}) ==")
+    print(f"  wall time: {elapsed:.2f}s, {sim.sleeps} simulated sleeps")
+    print(f"\n  {'date':<12}{'UTC offset':<12}{'slots on time':>14}")
+    by_day = Counter(day for _, day, _ in expected)
+    hits_by_day = Counter(day for _, day in hits)
+    dst_days = []
+    for day in sorted(by_day):
+        first, last = utc_offsets(scheduler.tz, day)
+        if first != last:
+            dst_days.append(day)
+        offset = f"{first:+.0f}" if first == last else f"{first:+.0f} -> {last:+.0f}"
+        print(f"  {day.isoformat():<12}{offset:<12}{hits_by_day[day]:>10}/{by_day[day]}")
+
+    posts = [p for p in twitter.posted if not p.get('reply')]
+    delays = [on_time[key] for key in hits]
+    seconds = [attempt['seconds'] for attempt in slots.attempts]
+    print(f"\n  slot hits: {len(hits)}/{len(expected)} within {args.tolerance:.0f}s of the local "
+          f"wall-clock time ({len(hits) / max(len(expected), 1):.1%})")
+    if dst_days:
+        print(f"  DST changes on: {', '.join(day.isoformat() for day in dst_days)}")
+    print(f"  scheduled posts: {len(posts)}, failed attempts: "
+          f"{sum(not attempt['ok'] for attempt in slots.attempts)}")
+    print(f"  posting delay (virtual): p50 {percentile(delays, 50):.1f}s, "
+          f"max {max(delays, default=0):.1f}s")
+    print(f"  slot attempt duration (real): p50 {percentile(seconds, 50) * 1000:.0f} ms, "
+          f"p95 {percentile(seconds, 95) * 1000:.0f} ms")
+
+    ttl = tracker.store.ttl_seconds
+    recent = sum(p['posted_at'] >= end.timestamp() - ttl for p in twitter.posted if p.get('reply'))
+    print(f"\n  community replies: {replies}, replied tweets still tracked: {len(tracker.store)} "
+          f"(replies in the last {ttl / 86400:.0f} days: {recent})")
+    print(f"  twitter calls: {dict(twitter.calls)}")
+    print(f"  openai calls: {dict(openai.calls)}")
+
+    written, sent = prompts.compaction()
+    print(f"\n  prompt templates: {written} characters as written, {sent} sent")
+    print("  " + format_report(ledger.summary()).replace('\n', '\n  '))
+
+def run_replay(args):
+    twitter = FakeTwitter(new_per_search=args.new_per_search)
+    openai = FakeOpenAI(run_latency=args.run_latency)
+    twitter_server = FakeServer(twitter).start()
+    openai_server = FakeServer(openai).start()
+
+    # Point both SDKs at the fakes before the bot module creates its clients
+    os.environ['TWITTER_API_BASE_URL'] = twitter_server.url
+    os.environ['OPENAI_BASE_URL'] = openai_server.url + '/v1'
+    os.environ.setdefault('OPENAI_API_KEY', 'replay')
+    os.environ['GENERATION_BACKEND'] = args.backend
+    for name in ('API_KEY', 'API_KEY_SECRET', 'ACCESS_TOKEN', 'ACCESS_TOKEN_SECRET'):
+        os.environ.setdefault(name, 'replay')
+
+    # State files (slots, jobs, tracker, caches) go to a scratch directory
+    args.state_dir = tempfile.mkdtemp(prefix='morpheus-replay-')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import metrics
+
+    metrics.setup_logging(args.log_level)
+    started = time.perf_counter()
+    try:
+        results = simulate(args)
+        report(args, *results, time.perf_counter() - started, twitter, openai)
+    finally:
+        twitter_server.stop()
+        openai_server.stop()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay days of the posting schedule on a simulated clock against fake APIs"
+    )
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--start', default=DEFAULT_START,
+                        help="local start date or time (ISO format); the default spans a DST change")
+    parser.add_argument('--timezone', default=TIMEZONE)
+    parser.add_argument('--backend', default='chat', choices=BACKENDS,
+                        help="generation backend to exercise")
+    parser.add_argument('--poll-minutes', type=float, default=60,
+                        help="virtual minutes between community polls (0 disables them)")
+    parser.add_argument('--tolerance', type=float, default=60,
+                        help="seconds after a deadline a post still counts as on time")
+    parser.add_argument('--new-per-search', type=int, default=5)
+    parser.add_argument('--run-latency', type=float, default=0.01,
+                        help="real seconds before a fake run or completion finishes")
+    parser.add_argument('--post-rate', type=float, default=1000.0,
+                        help="reply token-bucket rate (per real second) during the replay")
+    parser.add_argument('--token-budget', type=int, default=0,
+                        help="daily token budget; replies stop before the posts' reserve")
+    parser.add_argument('--log-level', default='WARNING')
+    run_replay(parser.parse_args(argv))
+
+if __name__ == "__main__":
+    main()
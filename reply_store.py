@@ -0,0 +1,138 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+import clock
+import metrics
+
+log = logging.getLogger(__name__)
+
+# Replies older than this are forgotten
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+# Maximum number of expired rows removed per write
+EXPIRE_BATCH = 500
+
+class ReplyStore:
+    """SQLite (WAL mode) store of replied tweet IDs with incremental TTL expiry"""
+
+    def __init__(self, path='replied_tweets.db', ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS replied ("
+            " tweet_id TEXT PRIMARY KEY,"
+            " replied_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_replied_at ON replied (replied_at)"
+        )
+
+    def _cutoff(self, now=None):
+        return (clock.time() if now is None else now) - self.ttl_seconds
+
+    def contains(self, tweet_id, now=None):
+        """Check if a tweet ID is stored and not yet expired"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM replied WHERE tweet_id = ? AND replied_at >= ?",
+                (str(tweet_id), self._cutoff(now))
+            ).fetchone()
+        return row is not None
+
+    def add(self, tweet_id, now=None):
+        """Record a single tweet ID and expire a small batch of old rows"""
+        now = clock.time() if now is None else now
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO replied (tweet_id, replied_at) VALUES (?, ?)",
+                (str(tweet_id), now)
+            )
+            self._expire(self._cutoff(now), EXPIRE_BATCH)
+
+    def add_many(self, items):
+        """Record many (tweet_id, timestamp) pairs in a single transaction"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO replied (tweet_id, replied_at) VALUES (?, ?)",
+                    ((str(tweet_id), ts) for tweet_id, ts in items)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _expire(self, cutoff, limit):
+        return self._conn.execute(
+            "DELETE FROM replied WHERE tweet_id IN ("
+            " SELECT tweet_id FROM replied WHERE replied_at < ? LIMIT ?"
+            ")",
+            (cutoff, limit)
+        ).rowcount
+
+    def expire(self, limit=EXPIRE_BATCH, now=None):
+        """Remove up to `limit` expired rows, returns the number removed"""
+        with self._lock:
+            return self._expire(self._cutoff(now), limit)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM replied").fetchone()[0]
+
+    def migrate_json(self, json_path):
+        """One-shot import of a legacy replied_tweets.json file
+
+        The legacy file is renamed to `<name>.migrated` afterwards so the
+        import never runs twice. Returns the number of imported IDs.
+        """
+        try:
+            with open(json_path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+
+        cutoff = self._cutoff()
+        items = []
+        for tweet_id, timestamp in data.items():
+            try:
+                ts = datetime.fromisoformat(timestamp).timestamp()
+            except (TypeError, ValueError):
+                continue
+            if ts >= cutoff:
+                items.append((tweet_id, ts))
+
+        self.add_many(items)
+        os.replace(json_path, json_path + '.migrated')
+        return len(items)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class TweetTracker:
+    def __init__(self, filename='replied_tweets.db', legacy_filename='replied_tweets.json'):
+        self.filename = filename
+        self.store = ReplyStore(filename)
+        # One-shot migration from the old full-rewrite JSON file
+        migrated = self.store.migrate_json(legacy_filename)
+        if migrated:
+            log.info("Migrated %d replied tweets from %s", migrated, legacy_filename)
+            
+    def already_replied(self, tweet_id):
+        """Check if we've already replied to this tweet"""
+        with metrics.timer('tracker_lookup_seconds'):
+            return self.store.contains(tweet_id)
+        
+    def mark_as_replied(self, tweet_id):
+        """Mark a tweet as replied to"""
+        with metrics.timer('tracker_save_seconds'):
+            self.store.add(tweet_id)
@@ -0,0 +1,254 @@
+import re
+import sys
+import random
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+import clock
+
+URL_PATTERN = re.compile(r'https?://\S+')
+MENTION_PATTERN = re.compile(r'(^|\s)@\w+')
+RETWEET_PATTERN = re.compile(r'^rt\s+')
+NON_WORD_PATTERN = re.compile(r'[^\w#$ ]+')
+SPACE_PATTERN = re.compile(r'\s+')
+
+# MinHash signature layout: BANDS * ROWS permutations
+BANDS = 8
+ROWS = 4
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x4D6F7270)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(BANDS * ROWS)
+]
+
+def normalize_text(text):
+    """Lowercase and strip URLs, mentions, RT prefixes and punctuation"""
+    text = text.lower()
+    text = URL_PATTERN.sub(' ', text)
+    text = MENTION_PATTERN.sub(' ', text)
+    text = RETWEET_PATTERN.sub('', text.strip())
+    text = NON_WORD_PATTERN.sub(' ', text)
+    return SPACE_PATTERN.sub(' ', text).strip()
+
+def exact_key(normalized):
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+def shingles(normalized, size=5):
+    """Character shingles of the normalized text"""
+    if len(normalized) <= size:
+        return {normalized}
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+def minhash(normalized):
+    """MinHash signature estimating Jaccard similarity of shingle sets"""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big')
+        for s in shingles(normalized)
+    ]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+def band_keys(signature):
+    return [(band, signature[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+def similarity(a, b):
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+class AlreadyAnswered(Exception):
+    """The text (or a near-duplicate) was answered recently; its reply must not be posted again"""
+
+class CacheEntry:
+    __slots__ = ('response', 'created_at', 'signature', 'size')
+
+    def __init__(self, response, created_at, signature):
+        self.response = response
+        self.created_at = created_at
+        self.signature = signature
+        self.size = sys.getsizeof(response) + 64 * len(signature) + 200
+
+class ResponseCache:
+    """TTL + LRU cache of generated replies keyed on normalized tweet text
+
+    Exact matches use a hash of the normalized text. Near duplicates
+    (retweet-like copies, spam variants) are found through MinHash
+    signatures bucketed with LSH and accepted above `threshold` estimated
+    Jaccard similarity. Memory is bounded by `max_entries` and
+    `max_bytes`; with `disk_path` exact entries are also kept in SQLite.
+    """
+
+    def __init__(self, ttl=6 * 3600, max_entries=5000, max_bytes=8 * 1024 * 1024,
+                 threshold=0.8, disk_path=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.threshold = threshold
+        self.entries = OrderedDict()
+        self.bands = {}
+        self.bytes = 0
+        self.stats = {'hits': 0, 'near_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._disk = None
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " normalized TEXT NOT NULL,"
+                " response TEXT NOT NULL,"
+                " created_at REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.bytes -= entry.size
+        for band in band_keys(entry.signature):
+            bucket = self.bands.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self.bands[band]
+
+    def _insert(self, key, entry):
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = entry
+        self.bytes += entry.size
+        for band in band_keys(entry.signature):
+            self.bands.setdefault(band, set()).add(key)
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+            self._remove(next(iter(self.entries)))
+            self.stats['evictions'] += 1
+
+    def _fresh(self, entry, now):
+        return now - entry.created_at < self.ttl
+
+    def get(self, text, now=None):
+        """Cached reply for `text` or a near-duplicate of it, else None"""
+        now = clock.time() if now is None else now
+        normalized = normalize_text(text)
+        key = exact_key(normalized)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if self._fresh(entry, now):
+                    self.entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return entry.response
+                self._remove(key)
+
+            signature = minhash(normalized)
+            candidates = set()
+            for band in band_keys(signature):
+                candidates |= self.bands.get(band, set())
+            best, best_score = None, self.threshold
+            for candidate in candidates:
+                other = self.entries[candidate]
+                score = similarity(signature, other.signature)
+                if score >= best_score and self._fresh(other, now):
+                    best, best_score = candidate, score
+            if best is not None:
+                self.entries.move_to_end(best)
+                self.stats['near_hits'] += 1
+                return self.entries[best].response
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT response, created_at FROM responses WHERE key = ? AND created_at > ?",
+                    (key, now - self.ttl)
+                ).fetchone()
+                if row is not None:
+                    self._insert(key, CacheEntry(row[0], row[1], signature))
+                    self.stats['disk_hits'] += 1
+                    return row[0]
+
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, text, response, now=None):
+        now = clock.time() if now is None else now
+        normalized = normalize_text(text)
+        key = exact_key(normalized)
+        with self._lock:
+            self._insert(key, CacheEntry(response, now, minhash(normalized)))
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO responses (key, normalized, response, created_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    (key, normalized, response, now)
+                )
+                self._disk.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses WHERE created_at <= ? LIMIT 100"
+                    ")",
+                    (now - self.ttl,)
+                )
+
+    def discard(self, text):
+        """Forget the replies `get(text)` could return (exact and near-duplicate)"""
+        normalized = normalize_text(text)
+        key = exact_key(normalized)
+        with self._lock:
+            signature = minhash(normalized)
+            candidates = set()
+            for band in band_keys(signature):
+                candidates |= self.bands.get(band, set())
+            for candidate in candidates:
+                if similarity(signature, self.entries[candidate].signature) >= self.threshold:
+                    self._remove(candidate)
+            if key in self.entries:
+                self._remove(key)
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    async def get_or_generate(self, text, generate, reuse=True):
+        """Return the cached reply or await `generate()` once per identical text
+
+        Concurrent callers with the same normalized text share one
+        generation; if it fails or is cancelled they all get an error.
+        Falsy replies are not cached.
+
+        Twitter rejects a reply identical to one we already posted, so with
+        `reuse` off a cached or shared reply is never returned: the call
+        raises AlreadyAnswered instead, and the duplicate costs neither a
+        generation nor a post.
+        """
+        cached = self.get(text)
+        if cached is not None:
+            if not reuse:
+                raise AlreadyAnswered(text)
+            return cached
+
+        key = exact_key(normalize_text(text))
+        pending = self._pending.get(key)
+        if pending is not None:
+            response = await asyncio.shield(pending)
+            if response and not reuse:
+                raise AlreadyAnswered(text)
+            return response
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            response = await generate()
+            if response:
+                self.put(text, response)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._pending[key]
+            if not future.done():
+                # Cancelled: fail the waiters rather than leave them awaiting forever
+                future.set_exception(RuntimeError("shared reply generation was cancelled"))
+            # Waiters see the error; mark it retrieved for the owner
+            future.exception()
+
+    def metrics(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self.entries), bytes=self.bytes)
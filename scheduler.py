@@ -0,0 +1,209 @@
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta
+import pytz
+import clock
+import metrics
+import json_state
+import deadlines
+
+log = logging.getLogger(__name__)
+
+TIMEZONE = 'America/Los_Angeles'
+
+# Heap event kinds; at equal times a deadline goes before a look-ahead
+FIRE = 0
+PREPARE = 1
+
+class Slot:
+    """A daily posting slot at a fixed local wall-clock time"""
+
+    def __init__(self, name, hour, minute=0, tweet_type=None):
+        self.name = name
+        self.hour = hour
+        self.minute = minute
+        self.tweet_type = tweet_type or name
+
+    def __repr__(self):
+        return f"Slot({self.name!r}, {self.hour:02d}:{self.minute:02d}, {self.tweet_type!r})"
+
+# Default daily schedule (Pacific time)
+DEFAULT_SLOTS = [
+    Slot('morning', 7, 0, 'morning'),
+    Slot('afternoon', 13, 30, 'community'),
+    Slot('evening', 18, 0, 'trending'),
+    Slot('night', 21, 0, 'night'),
+]
+
+def localize(tz, naive):
+    """Attach `tz` to a naive wall-clock time, resolving DST gaps and overlaps
+
+    Times that fall in the spring-forward gap are moved forward by the gap
+    length; times repeated in the fall-back overlap use the first occurrence.
+    """
+    try:
+        return tz.localize(naive, is_dst=None)
+    except pytz.NonExistentTimeError:
+        return tz.normalize(tz.localize(naive, is_dst=False))
+    except pytz.AmbiguousTimeError:
+        return tz.localize(naive, is_dst=True)
+
+class SlotScheduler:
+    """Min-heap of slot deadlines that sleeps exactly until the next one
+
+    Fired slots are persisted per local date in `state_file`, so a restart
+    neither reposts a slot nor forgets one that was missed within the
+    `catch_up` window. Each attempt runs under a deadline of
+    `attempt_timeout` seconds that bounds every API call it makes.
+    """
+
+    def __init__(self, slots=None, state_file='slot_state.json', timezone=TIMEZONE,
+                 catch_up=timedelta(hours=1), retry_delay=30, max_sleep=3600,
+                 attempt_timeout=90):
+        self.slots = {slot.name: slot for slot in (slots or DEFAULT_SLOTS)}
+        self.state_file = state_file
+        self.tz = pytz.timezone(timezone)
+        self.catch_up = catch_up
+        self.retry_delay = retry_delay
+        self.max_sleep = max_sleep
+        self.attempt_timeout = attempt_timeout
+        self.fired = self.load_state()
+        self.heap = []
+        self.prepare = None
+        self.lead_time = timedelta(0)
+
+    def load_state(self):
+        """Load the last fired date of each slot"""
+        return json_state.load(self.state_file)
+
+    def save_state(self):
+        """Atomically persist the last fired date of each slot"""
+        json_state.save(self.state_file, self.fired)
+
+    def now(self):
+        return datetime.fromtimestamp(clock.time(), self.tz)
+
+    def occurrence(self, slot, day):
+        """Aware datetime of `slot` on the local date `day`"""
+        naive = datetime(day.year, day.month, day.day, slot.hour, slot.minute)
+        return localize(self.tz, naive)
+
+    def next_occurrence(self, slot, now):
+        """First occurrence of `slot` that is still due at or after `now`
+
+        Today's occurrence is returned even if it already passed, as long as
+        it has not fired and is within the catch-up window.
+        """
+        day = now.date()
+        due = self.occurrence(slot, day)
+        if self.fired.get(slot.name) == day.isoformat() or now - due > self.catch_up:
+            due = self.occurrence(slot, day + timedelta(days=1))
+        return due
+
+    def push(self, slot, due, fire_at=None, kind=FIRE):
+        """Queue an event of `slot` for its deadline `due`
+
+        `fire_at` defaults to the deadline; retries and PREPARE events fire
+        at other times.
+        """
+        fire_at = due if fire_at is None else fire_at
+        heapq.heappush(self.heap, (fire_at.timestamp(), kind, slot.name, due))
+
+    def schedule(self, slot, due):
+        """Queue the deadline of `slot` and, if configured, its look-ahead event"""
+        self.push(slot, due)
+        if self.prepare is not None and due > self.now():
+            self.push(slot, due, fire_at=due - self.lead_time, kind=PREPARE)
+
+    def start(self):
+        """Build the deadline heap from the slot table"""
+        now = self.now()
+        self.heap = []
+        for slot in self.slots.values():
+            self.schedule(slot, self.next_occurrence(slot, now))
+
+    def peek(self):
+        """Return (fire timestamp, kind, deadline, slot) of the next event"""
+        fire_ts, kind, name, due = self.heap[0]
+        return fire_ts, kind, due, self.slots[name]
+
+    def mark_fired(self, slot, due):
+        self.fired[slot.name] = due.date().isoformat()
+        self.save_state()
+
+    def run_prepare(self, slot, due):
+        """Run the look-ahead hook in the background so deadlines are never delayed
+
+        On a simulated clock it runs inline, since virtual time does not
+        wait for other threads.
+        """
+        def target():
+            try:
+                self.prepare(slot, due)
+            except Exception as e:
+                log.error("Error preparing %s slot: %s", slot.name, e)
+
+        if clock.get_clock().simulated:
+            target()
+            return
+        threading.Thread(target=target, name=f"prepare-{slot.name}", daemon=True).start()
+
+    def run_forever(self, handler, prepare=None, lead_time=timedelta(minutes=10)):
+        """Sleep until each deadline and call `handler(slot, due)`
+
+        A falsy return value or an exception is retried every `retry_delay`
+        seconds until the catch-up window closes, then the slot moves to the
+        next day. With `prepare`, `prepare(slot, due)` runs `lead_time`
+        before each deadline (or right away if that time already passed).
+        """
+        self.run(handler, prepare, lead_time)
+
+    def run(self, handler, prepare=None, lead_time=timedelta(minutes=10), until=None):
+        """run_forever, returning once the next event is after the epoch time `until`"""
+        self.prepare = prepare
+        self.lead_time = lead_time
+        self.start()
+        # /readyz reports ready once deadlines are queued and the loop runs
+        metrics.register_check('scheduler', lambda: bool(self.heap))
+        while True:
+            fire_ts, kind, due, slot = self.peek()
+            if until is not None and fire_ts > until:
+                return
+            wait = fire_ts - clock.time()
+            if wait > 0:
+                if kind == FIRE:
+                    log.info("Next scheduled tweet: %s at %s (%.0f min)",
+                             slot.name, due.strftime('%I:%M %p %Z'), wait / 60)
+                # Sleep in bounded chunks so clock jumps and suspends are noticed
+                clock.sleep(min(wait, self.max_sleep))
+                continue
+
+            heapq.heappop(self.heap)
+            if kind == PREPARE:
+                self.run_prepare(slot, due)
+                continue
+
+            log.info("Time for %s tweet! (%.1fs after deadline)",
+                     slot.name, clock.time() - due.timestamp())
+            try:
+                with deadlines.within(self.attempt_timeout):
+                    ok = handler(slot, due)
+            except Exception as e:
+                log.error("Error running %s slot: %s", slot.name, e)
+                ok = False
+
+            retry_at = self.now() + timedelta(seconds=self.retry_delay)
+            if ok:
+                self.mark_fired(slot, due)
+                # Deadline to posted, including generation when nothing was buffered
+                metrics.observe('slot_post_delay_seconds', clock.time() - due.timestamp(), slot=slot.name)
+                log.info("%s tweet posted successfully!", slot.name.capitalize())
+                self.schedule(slot, self.occurrence(slot, due.date() + timedelta(days=1)))
+            elif retry_at - due <= self.catch_up:
+                metrics.inc('slot_retries_total', slot=slot.name)
+                self.push(slot, due, fire_at=retry_at)
+            else:
+                log.error("Giving up on %s slot for %s", slot.name, due.date())
+                metrics.inc('slot_missed_total', slot=slot.name)
+                self.schedule(slot, self.occurrence(slot, due.date() + timedelta(days=1)))
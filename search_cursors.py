@@ -0,0 +1,66 @@
+import threading
+import json_state
+
+class SearchCursors:
+    """Per-query since_id high-water marks that survive restarts"""
+
+    def __init__(self, filename='search_cursors.json'):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self.cursors = self.load()
+
+    def load(self):
+        return json_state.load(self.filename)
+
+    def save(self):
+        """Atomically persist all cursors (one small entry per query)"""
+        json_state.save(self.filename, self.cursors)
+
+    def get(self, query):
+        with self._lock:
+            return self.cursors.get(query)
+
+    def advance(self, query, newest_id):
+        """Move the cursor of `query` forward to `newest_id`"""
+        with self._lock:
+            current = self.cursors.get(query)
+            if current is None or int(newest_id) > int(current):
+                self.cursors[query] = str(newest_id)
+                self.save()
+
+def fetch_new_tweets(client, query, cursors, max_results=10, max_pages=10, since_id=None,
+                     **params):
+    """Return only tweets newer than the stored cursor of `query`
+
+    Pages through `next_token` until caught up (at most `max_pages`). The
+    very first search for a query only reads one page instead of the whole
+    recent window. On a quiet query this is a single request that returns
+    nothing. An explicit `since_id` is used instead of the stored cursor.
+    """
+    if since_id is None and cursors:
+        since_id = cursors.get(query)
+    tweets = []
+    newest_id = None
+    next_token = None
+
+    for _ in range(max_pages if since_id else 1):
+        request = dict(params, query=query, max_results=max_results)
+        if since_id:
+            request['since_id'] = since_id
+        if next_token:
+            request['next_token'] = next_token
+
+        response = client.search_recent_tweets(**request)
+        meta = response.meta or {}
+        if response.data:
+            tweets.extend(response.data)
+        if newest_id is None and meta.get('newest_id'):
+            newest_id = meta['newest_id']
+
+        next_token = meta.get('next_token')
+        if not next_token:
+            break
+
+    if cursors and newest_id:
+        cursors.advance(query, newest_id)
+    return tweets
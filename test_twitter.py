@@ -1,19 +1,13 @@
 import tweepy
 from dotenv import load_dotenv
-import os
+from twitter_clients import get_provider
 
 def test_twitter_post():
     # Load environment variables
     load_dotenv()
     
     print("1. Creating Twitter client...")
-    client = tweepy.Client(
-        bearer_token=os.getenv("BEARER_TOKEN"),
-        consumer_key=os.getenv("API_KEY"),
-        consumer_secret=os.getenv("API_KEY_SECRET"),
-        access_token=os.getenv("ACCESS_TOKEN"),
-        access_token_secret=os.getenv("ACCESS_TOKEN_SECRET")
-    )
+    client = get_provider().get_client()
     
     print("\n2. Attempting to post a test tweet...")
     try:
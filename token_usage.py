@@ -0,0 +1,183 @@
+import os
+import json
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
+import clock
+import metrics
+import json_state
+
+# USD per million (input, output) tokens, matched by longest model-name prefix;
+# TOKEN_PRICES='{"model": [input, output]}' adds or overrides entries
+MODEL_PRICES = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4.1-mini': (0.40, 1.60),
+    'gpt-4.1': (2.00, 8.00),
+    'gpt-4-turbo': (10.00, 30.00),
+    'gpt-3.5-turbo': (0.50, 1.50),
+    'stub': (0.0, 0.0),
+}
+# Unknown models are priced like gpt-4o, so costs are overestimated rather than hidden
+DEFAULT_PRICE = MODEL_PRICES['gpt-4o']
+
+@lru_cache(maxsize=None)
+def _prices():
+    return dict(MODEL_PRICES, **{model: tuple(price) for model, price
+                                 in json.loads(os.getenv('TOKEN_PRICES') or '{}').items()})
+
+@lru_cache(maxsize=256)
+def price(model):
+    """(input, output) USD per million tokens of `model`"""
+    prices = _prices()
+    matches = [name for name in prices if (model or '').startswith(name)]
+    return prices[max(matches, key=len)] if matches else DEFAULT_PRICE
+
+def cost(model, input_tokens, output_tokens):
+    input_price, output_price = price(model)
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+# (ledger, kind) the generations of the current unit of work are charged to
+_charge = contextvars.ContextVar('token_charge', default=None)
+
+@contextmanager
+def charged_to(ledger, kind):
+    """Charge the tokens of generations in the enclosed calls to `ledger` as `kind`
+
+    Kinds are `slot:<name>` for scheduled posts, `reply` for community
+    replies and `post` for other tweets. Like rate_limits.request_priority,
+    the charge follows the calls into the generation engine's loop.
+    """
+    token = _charge.set((ledger, kind))
+    try:
+        yield
+    finally:
+        _charge.reset(token)
+
+def record(model, input_tokens, output_tokens, purpose=None):
+    """Account the usage reported for one generation request"""
+    charge = _charge.get()
+    kind = charge[1] if charge else purpose or 'other'
+    metrics.inc('generation_tokens_total', input_tokens, kind=kind, direction='input')
+    metrics.inc('generation_tokens_total', output_tokens, kind=kind, direction='output')
+    metrics.inc('generation_cost_usd_total', cost(model, input_tokens, output_tokens), kind=kind)
+    if charge:
+        charge[0].add(kind, model, input_tokens, output_tokens)
+
+def record_usage(model, usage, purpose=None):
+    """`record` from an OpenAI usage object (prompt_tokens / completion_tokens); False without one"""
+    if usage is None:
+        return False
+    record(model, usage.prompt_tokens or 0, usage.completion_tokens or 0, purpose)
+    return True
+
+def utc_day(now=None):
+    return datetime.fromtimestamp(clock.time() if now is None else now, timezone.utc).date().isoformat()
+
+class TokenLedger:
+    """Tokens spent and tweets posted per UTC day and kind, with a daily budget
+
+    Each day holds `{kind: {model: [input, output, requests]}}` and the
+    number of tweets posted per kind, so spend can be divided by what
+    actually went out (including retries, spare candidates and lost
+    hedges). Days older than `retention_days` are dropped.
+
+    With a `daily_limit` (tokens), community replies stop once today's spend
+    reaches the limit minus the `post_reserve` share kept for scheduled
+    posts. Scheduled posts are never held back.
+    """
+
+    def __init__(self, filename='token_usage.json', daily_limit=0, post_reserve=0.25,
+                 retention_days=31):
+        self.filename = filename
+        self.daily_limit = daily_limit
+        self.post_reserve = post_reserve
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self.days = self.load()
+
+    def load(self):
+        return json_state.load(self.filename)
+
+    def save(self):
+        """Atomically persist the ledger (a few entries per day)"""
+        json_state.save(self.filename, self.days)
+
+    def _day(self, now):
+        day = utc_day(now)
+        if day not in self.days:
+            self.days[day] = {'tokens': {}, 'posted': {}}
+            for old in sorted(self.days)[:-self.retention_days]:
+                del self.days[old]
+        return self.days[day]
+
+    def add(self, kind, model, input_tokens, output_tokens, now=None):
+        with self._lock:
+            entry = self._day(now)['tokens'].setdefault(kind, {}).setdefault(model, [0, 0, 0])
+            entry[0] += input_tokens
+            entry[1] += output_tokens
+            entry[2] += 1
+            self.save()
+        if self.daily_limit:
+            metrics.set_gauge('token_budget_used_ratio', self.spent(now) / self.daily_limit)
+
+    def posted(self, kind, count=1, now=None):
+        """Count `count` tweets of `kind` that went out"""
+        if not count:
+            return
+        with self._lock:
+            posted = self._day(now)['posted']
+            posted[kind] = posted.get(kind, 0) + count
+            self.save()
+
+    def spent(self, now=None):
+        """Tokens (input and output) spent today"""
+        with self._lock:
+            day = self.days.get(utc_day(now), {'tokens': {}})
+            return sum(entry[0] + entry[1] for models in day['tokens'].values()
+                       for entry in models.values())
+
+    def allows_replies(self, now=None):
+        """False once today's spend has reached the share of the budget open to replies"""
+        if not self.daily_limit:
+            return True
+        return self.spent(now) < self.daily_limit * (1 - self.post_reserve)
+
+    def summary(self, days=None):
+        """Rows of (day, kind, input, output, requests, cost, posted), newest day first"""
+        rows = []
+        with self._lock:
+            for day in sorted(self.days, reverse=True)[:days]:
+                tokens, posted = self.days[day]['tokens'], self.days[day]['posted']
+                for kind in sorted(set(tokens) | set(posted)):
+                    models = tokens.get(kind, {})
+                    rows.append((
+                        day, kind,
+                        sum(entry[0] for entry in models.values()),
+                        sum(entry[1] for entry in models.values()),
+                        sum(entry[2] for entry in models.values()),
+                        sum(cost(model, entry[0], entry[1]) for model, entry in models.items()),
+                        posted.get(kind, 0),
+                    ))
+        return rows
+
+def format_report(rows):
+    """Cost per posted tweet by kind, as printed by `cli.py usage`"""
+    lines = [f"{'day':<12}{'kind':<24}{'input':>9}{'output':>9}{'requests':>10}"
+             f"{'cost $':>10}{'posted':>8}{'$/tweet':>10}"]
+    totals = {}
+    for day, kind, input_tokens, output_tokens, requests, spent, posted in rows:
+        per_tweet = f"{spent / posted:.5f}" if posted else '-'
+        lines.append(f"{day:<12}{kind:<24}{input_tokens:>9}{output_tokens:>9}{requests:>10}"
+                     f"{spent:>10.4f}{posted:>8}{per_tweet:>10}")
+        group = 'replies' if kind == 'reply' else 'posts'
+        total = totals.setdefault(group, [0, 0.0, 0])
+        total[0] += input_tokens + output_tokens
+        total[1] += spent
+        total[2] += posted
+    for group, (tokens, spent, posted) in sorted(totals.items()):
+        if posted:
+            lines.append(f"{group}: {tokens / posted:.0f} tokens, ${spent / posted:.5f} per posted tweet")
+    return '\n'.join(lines)
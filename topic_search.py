@@ -0,0 +1,93 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from search_cursors import fetch_new_tweets
+from tweet_scoring import TweetScorer, top_tweets
+
+log = logging.getLogger(__name__)
+
+# Recent search rejects longer queries on the standard access levels
+MAX_QUERY_LENGTH = 512
+
+class Topic:
+    """A search term and the weight of its matches in the trending ranking"""
+
+    def __init__(self, query, weight=1.0):
+        self.query = query
+        self.weight = weight
+
+    def __repr__(self):
+        return f"Topic({self.query!r}, {self.weight})"
+
+DEFAULT_TOPICS = [
+    Topic("Cardano"),
+    Topic("DRMZ"),
+    Topic("Web3"),
+    Topic("ADA"),
+    Topic("DeFi"),
+]
+
+def compact_queries(topics, suffix="-is:retweet", max_length=MAX_QUERY_LENGTH):
+    """Pack topics into as few `(a OR b ...) suffix` queries as fit in max_length
+
+    Returns a list of (query, topics in that query).
+    """
+    groups = []
+    current = []
+    for topic in topics:
+        candidate = current + [topic]
+        if current and len(build_query(candidate, suffix)) > max_length:
+            groups.append(current)
+            candidate = [topic]
+        current = candidate
+    if current:
+        groups.append(current)
+    return [(build_query(group, suffix), group) for group in groups]
+
+def build_query(topics, suffix):
+    terms = " OR ".join(topic.query for topic in topics)
+    if len(topics) > 1:
+        terms = f"({terms})"
+    return f"{terms} {suffix}".strip()
+
+def search_topics(client, topics=None, k=5, suffix="-is:retweet", compact=True,
+                  max_length=MAX_QUERY_LENGTH, max_results=None, max_workers=4, cursors=None,
+                  scorer=None):
+    """Search all topics concurrently and return the top-k tweets, one per author
+
+    Tweets are ranked by `scorer` (default: a TweetScorer over the topics,
+    i.e. engagement rate by age, topic relevance and recency). With
+    `compact` the topics are OR-combined into as few queries as the
+    length limit allows. Tweets found by several queries are counted once.
+    With `cursors` only tweets newer than each query's high-water mark
+    are fetched.
+    """
+    topics = topics or DEFAULT_TOPICS
+    scorer = scorer or TweetScorer(topics)
+    if compact:
+        queries = compact_queries(topics, suffix, max_length)
+    else:
+        queries = [(build_query([topic], suffix), [topic]) for topic in topics]
+
+    def run(query, group):
+        tweets = fetch_new_tweets(
+            client,
+            query,
+            cursors,
+            max_results=max_results or min(10 * len(group), 100),
+            tweet_fields=['public_metrics', 'created_at', 'author_id']
+        )
+        return group, tweets
+
+    seen = {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(queries))) as pool:
+        futures = [pool.submit(run, query, group) for query, group in queries]
+        for future in futures:
+            try:
+                group, tweets = future.result()
+            except Exception as e:
+                log.error("Error searching topics: %s", e)
+                continue
+            for tweet in tweets:
+                seen[tweet.id] = tweet
+
+    return top_tweets(list(seen.values()), k, scorer)
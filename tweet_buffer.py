@@ -0,0 +1,61 @@
+import threading
+import clock
+import json_state
+
+class TweetBuffer:
+    """Pre-generated tweet candidates per slot occurrence, persisted to disk
+
+    Entries are keyed by slot name and date. Candidates are dropped once
+    their slot deadline is more than `grace` seconds old or they were
+    generated more than `max_age` seconds ago.
+    """
+
+    def __init__(self, filename='tweet_buffer.json', max_age=6 * 3600, grace=3600):
+        self.filename = filename
+        self.max_age = max_age
+        self.grace = grace
+        self._lock = threading.Lock()
+        self.entries = self.load()
+
+    @staticmethod
+    def key(slot, due):
+        return f"{slot.name}:{due.date().isoformat()}"
+
+    def load(self):
+        return json_state.load(self.filename)
+
+    def save(self):
+        json_state.save(self.filename, self.entries)
+
+    def _evict(self, now):
+        stale = [
+            key for key, entry in self.entries.items()
+            if now - entry['due'] > self.grace or now - entry['created_at'] > self.max_age
+        ]
+        for key in stale:
+            del self.entries[key]
+        return len(stale)
+
+    def has(self, key, now=None):
+        with self._lock:
+            self._evict(clock.time() if now is None else now)
+            return bool(self.entries.get(key, {}).get('candidates'))
+
+    def put(self, key, candidates, due, now=None):
+        """Store validated candidates for the slot occurrence `key` due at `due` (epoch)"""
+        now = clock.time() if now is None else now
+        with self._lock:
+            self._evict(now)
+            self.entries[key] = {'candidates': list(candidates), 'due': due, 'created_at': now}
+            self.save()
+
+    def take(self, key, now=None):
+        """Pop the next candidate for `key`, or None if none is buffered"""
+        with self._lock:
+            self._evict(clock.time() if now is None else now)
+            entry = self.entries.get(key)
+            if not entry or not entry['candidates']:
+                return None
+            candidate = entry['candidates'].pop(0)
+            self.save()
+            return candidate
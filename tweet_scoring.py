@@ -0,0 +1,208 @@
+import re
+import math
+import heapq
+import logging
+from datetime import datetime
+import clock
+import metrics
+
+log = logging.getLogger(__name__)
+
+# Replies and quotes signal conversation, which is where a reply is seen
+ENGAGEMENT_WEIGHTS = {
+    'like_count': 1.0,
+    'retweet_count': 2.0,
+    'reply_count': 3.0,
+    'quote_count': 2.5,
+}
+
+def created_timestamp(tweet):
+    """Unix time of `created_at` (datetime or ISO string), None if the tweet has none"""
+    created = getattr(tweet, 'created_at', None)
+    if created is None:
+        return None
+    if isinstance(created, str):
+        created = datetime.fromisoformat(created.replace('Z', '+00:00'))
+    return created.timestamp()
+
+class TweetScorer:
+    """Value of replying to a tweet: engagement rate x keyword relevance x recency
+
+    Weighted engagement is divided by `(age_hours + 2) ** gravity`, so a
+    tweet gaining likes quickly beats an older one with the same total.
+    Relevance is 1 plus the weights of the distinct keywords (topics)
+    the text mentions. Recency halves the score every `half_life` seconds,
+    since replies to old conversations are rarely seen. A `prior` added to
+    the engagement rate keeps tweets without engagement yet (e.g. streamed
+    seconds after posting) ranked by relevance and recency.
+
+    `features` extracts everything a score needs, so re-scoring queued
+    candidates is a few float operations each. Engagement is as of the
+    last search that returned the tweet; CandidateQueue refreshes it when
+    a tweet is seen again.
+    """
+
+    def __init__(self, topics=(), weights=ENGAGEMENT_WEIGHTS, gravity=1.5, half_life=3 * 3600,
+                 prior=1.0):
+        self.weights = tuple(weights.items())
+        self.prior = prior
+        self.gravity = gravity
+        self.half_life = half_life
+        self.keywords = {topic.query.strip('"').lower(): topic.weight for topic in topics}
+        self.pattern = None
+        if self.keywords:
+            alternatives = '|'.join(re.escape(keyword) for keyword in
+                                    sorted(self.keywords, key=len, reverse=True))
+            self.pattern = re.compile(rf'(?<!\w)(?:{alternatives})(?!\w)', re.IGNORECASE)
+
+    def relevance(self, text):
+        if self.pattern is None:
+            return 1.0
+        found = {match.lower() for match in self.pattern.findall(text)}
+        return 1.0 + sum(self.keywords[keyword] for keyword in found)
+
+    def features(self, tweet):
+        """(weighted engagement, relevance, created timestamp or None)"""
+        public = getattr(tweet, 'public_metrics', None) or {}
+        engagement = sum(weight * public.get(name, 0) for name, weight in self.weights)
+        return engagement, self.relevance(tweet.text), created_timestamp(tweet)
+
+    def score_features(self, features, now):
+        engagement, relevance, created = features
+        age = 0.0 if created is None else max(0.0, now - created)
+        rate = engagement / (age / 3600 + 2) ** self.gravity
+        return math.log1p(rate + self.prior) * relevance * 0.5 ** (age / self.half_life)
+
+    def score(self, tweet, now=None):
+        return self.score_features(self.features(tweet), clock.time() if now is None else now)
+
+    def score_many(self, tweets, now=None):
+        """Scores for a batch of tweets, in order"""
+        now = clock.time() if now is None else now
+        features = self.features
+        score_features = self.score_features
+        return [score_features(features(tweet), now) for tweet in tweets]
+
+def top_tweets(tweets, k, scorer, now=None):
+    """The k highest-scoring tweets, at most one per author"""
+    best = {}
+    for tweet, score in zip(tweets, scorer.score_many(tweets, now)):
+        author = getattr(tweet, 'author_id', None) or tweet.id
+        if author not in best or score > best[author][0]:
+            best[author] = (score, tweet)
+    return [tweet for _, tweet in heapq.nlargest(k, best.values(), key=lambda item: item[0])]
+
+class Candidate:
+    __slots__ = ('tweet', 'author', 'features', 'score')
+
+    def __init__(self, tweet, author, features, score):
+        self.tweet = tweet
+        self.author = author
+        self.features = features
+        self.score = score
+
+class CandidateQueue:
+    """Bounded priority queue of reply candidates kept across polling cycles
+
+    Each author has at most one pending candidate (the best one), and
+    authors we replied to in the last `author_cooldown` seconds are
+    skipped. Candidates older than `max_age` are dropped, and when more
+    than `capacity` are pending the lowest-scoring ones are evicted.
+    """
+
+    def __init__(self, scorer, capacity=500, max_age=6 * 3600, author_cooldown=6 * 3600):
+        self.scorer = scorer
+        self.capacity = capacity
+        self.max_age = max_age
+        self.author_cooldown = author_cooldown
+        self.pending = {}
+        self.by_author = {}
+        self.replied_authors = {}
+
+    def __len__(self):
+        return len(self.pending)
+
+    def _remove(self, candidate):
+        self.pending.pop(candidate.tweet.id, None)
+        if self.by_author.get(candidate.author) == candidate.tweet.id:
+            del self.by_author[candidate.author]
+
+    def _drop(self, candidate, reason):
+        self._remove(candidate)
+        metrics.inc('reply_candidates_dropped_total', reason=reason)
+
+    def _stale(self, candidate, now):
+        created = candidate.features[2]
+        return created is not None and now - created > self.max_age
+
+    def push_many(self, tweets, now=None):
+        """Score and queue tweets (re-scoring pending ones); returns how many are pending afterwards"""
+        now = clock.time() if now is None else now
+        scorer = self.scorer
+        for tweet in tweets:
+            pending = self.pending.get(tweet.id)
+            if pending is not None:
+                # Returned again by a later search: take its current engagement
+                pending.tweet = tweet
+                pending.features = scorer.features(tweet)
+                pending.score = scorer.score_features(pending.features, now)
+                continue
+            author = getattr(tweet, 'author_id', None) or tweet.id
+            replied = self.replied_authors.get(author)
+            if replied is not None and now - replied < self.author_cooldown:
+                metrics.inc('reply_candidates_dropped_total', reason='author_cooldown')
+                continue
+            features = scorer.features(tweet)
+            candidate = Candidate(tweet, author, features, scorer.score_features(features, now))
+            if self._stale(candidate, now):
+                metrics.inc('reply_candidates_dropped_total', reason='stale')
+                continue
+            current = self.pending.get(self.by_author.get(author))
+            if current is not None:
+                if current.score >= candidate.score:
+                    metrics.inc('reply_candidates_dropped_total', reason='same_author')
+                    continue
+                self._drop(current, 'same_author')
+            self.pending[tweet.id] = candidate
+            self.by_author[author] = tweet.id
+
+        if len(self.pending) > self.capacity:
+            keep = heapq.nlargest(self.capacity, self.pending.values(), key=lambda c: c.score)
+            kept = {candidate.tweet.id for candidate in keep}
+            for candidate in [c for c in self.pending.values() if c.tweet.id not in kept]:
+                self._drop(candidate, 'capacity')
+        metrics.set_gauge('reply_candidates_pending', len(self.pending))
+        return len(self.pending)
+
+    def take(self, count, accept=None, now=None):
+        """Remove and return the `count` best pending tweets that pass `accept`
+
+        Scores are refreshed first, since engagement rate and recency
+        change with age. Taking a tweet starts its author's cooldown.
+        """
+        now = clock.time() if now is None else now
+        score_features = self.scorer.score_features
+        for candidate in list(self.pending.values()):
+            if self._stale(candidate, now):
+                self._drop(candidate, 'stale')
+            else:
+                candidate.score = score_features(candidate.features, now)
+        self.replied_authors = {author: replied for author, replied in self.replied_authors.items()
+                                if now - replied < self.author_cooldown}
+
+        taken = []
+        heap = [(-candidate.score, tweet_id) for tweet_id, candidate in self.pending.items()]
+        heapq.heapify(heap)
+        while heap and len(taken) < count:
+            _, tweet_id = heapq.heappop(heap)
+            candidate = self.pending[tweet_id]
+            if accept is not None and not accept(candidate.tweet):
+                self._drop(candidate, 'rejected')
+                continue
+            self._remove(candidate)
+            self.replied_authors[candidate.author] = now
+            taken.append(candidate.tweet)
+        metrics.set_gauge('reply_candidates_pending', len(self.pending))
+        if taken:
+            log.debug("Took %d reply candidates, %d still pending", len(taken), len(self.pending))
+        return taken
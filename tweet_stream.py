@@ -0,0 +1,240 @@
+import time
+import logging
+import threading
+from collections import deque, OrderedDict
+from functools import lru_cache
+import metrics
+from search_cursors import fetch_new_tweets
+from tweet_scoring import created_timestamp
+
+log = logging.getLogger(__name__)
+
+STREAM_TWEET_FIELDS = ['public_metrics', 'created_at', 'author_id']
+
+def account_rules(account):
+    """Filtered-stream rules {tag: query} for an account: its community query
+
+    Only tweets we may reply to are streamed, since every match counts
+    against the stream's monthly tweet cap. Tags start with the account
+    name, so personas sharing one app only ever replace their own rules
+    (rules from older configurations under that name are deleted).
+    """
+    return {f"{account.name}:community": account.community_query}
+
+def sync_rules(client, rules, prefix):
+    """Make the stream rules tagged `prefix...` match `rules`; returns (added, deleted)
+
+    Unchanged rules are kept, so a restart with the same configuration
+    costs a single get_rules call and the stream never runs without them.
+    """
+    from tweepy import StreamRule
+
+    existing = [rule for rule in client.get_rules().data or []
+                if (rule.tag or '').startswith(prefix)]
+    current = {(rule.tag, rule.value) for rule in existing}
+    stale = [rule.id for rule in existing if rules.get(rule.tag) != rule.value]
+    missing = [StreamRule(value, tag) for tag, value in rules.items() if (tag, value) not in current]
+    if stale:
+        client.delete_rules(stale)
+    if missing:
+        for error in client.add_rules(missing).errors or []:
+            log.error("Stream rule rejected: %s", error)
+    return len(missing), len(stale)
+
+class StreamBuffer:
+    """Bounded FIFO between the stream reader thread and the reply pipeline
+
+    A full buffer blocks the reader for up to `block` seconds, which stops
+    reading from the connection until the pipeline catches up. If it still
+    has not, the oldest tweet is dropped, since replies to fresh tweets
+    are worth more.
+    """
+
+    def __init__(self, capacity=1000, block=1.0):
+        self.capacity = capacity
+        self.block = block
+        self.items = deque()
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self.items)
+
+    def _has_room(self):
+        return len(self.items) < self.capacity
+
+    def put(self, item):
+        with self._cond:
+            if not self._has_room():
+                self._cond.wait_for(self._has_room, self.block)
+            if not self._has_room():
+                self.items.popleft()
+                metrics.inc('stream_tweets_dropped_total', reason='buffer_full')
+            self.items.append(item)
+            metrics.set_gauge('stream_buffer_depth', len(self.items))
+            self._cond.notify_all()
+
+    def drain(self, max_items, timeout=None):
+        """Up to `max_items` oldest items, waiting up to `timeout` seconds for the first"""
+        with self._cond:
+            if not self.items and timeout:
+                self._cond.wait_for(lambda: self.items, timeout)
+            batch = [self.items.popleft() for _ in range(min(max_items, len(self.items)))]
+            if batch:
+                metrics.set_gauge('stream_buffer_depth', len(self.items))
+                self._cond.notify_all()
+            return batch
+
+@lru_cache(maxsize=None)
+def ingesting_stream_class():
+    """tweepy StreamingClient passing connects and tweets to a StreamIngestor"""
+    import tweepy
+
+    class IngestingStream(tweepy.StreamingClient):
+        def __init__(self, bearer_token, ingestor, **kwargs):
+            super().__init__(bearer_token, **kwargs)
+            self.ingestor = ingestor
+
+        def on_connect(self):
+            self.ingestor.on_connect()
+
+        def on_response(self, response):
+            self.ingestor.on_response(response)
+
+        def on_keep_alive(self):
+            self.ingestor.last_activity = time.time()
+
+        def on_closed(self, response):
+            metrics.inc('stream_disconnects_total', reason='closed')
+            super().on_closed(response)
+
+        def on_connection_error(self):
+            metrics.inc('stream_disconnects_total', reason='network')
+            super().on_connection_error()
+
+        def on_request_error(self, status_code):
+            metrics.inc('stream_disconnects_total', reason=f"http_{status_code}")
+            super().on_request_error(status_code)
+
+    return IngestingStream
+
+class StreamIngestor:
+    """Filtered-stream ingestion feeding the community reply pipeline
+
+    The stream is read in its own thread, and tweepy reconnects with the
+    backoff Twitter asks for (linear after network errors, exponential
+    after HTTP errors, starting at a minute after a 429). Each connect
+    first backfills every rule with a recent search from its since_id
+    cursor, so tweets posted while disconnected or stopped are not missed.
+    Tweets seen both ways are passed on once.
+
+    Cursors only move when tweets are drained to the pipeline, so tweets
+    still buffered at a crash are backfilled after the restart.
+    """
+
+    def __init__(self, provider, rules, prefix='', cursors=None, capacity=1000, block=1.0,
+                 tweet_fields=STREAM_TWEET_FIELDS, remember=10_000):
+        self.provider = provider
+        self.rules = rules
+        self.prefix = prefix
+        self.cursors = cursors
+        self.buffer = StreamBuffer(capacity, block)
+        self.tweet_fields = tweet_fields
+        self.remember = remember
+        self.seen = OrderedDict()
+        self.stream = None
+        self.connects = 0
+        self.last_activity = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Sync the rules and connect in a background thread"""
+        if self.stream is not None:
+            return self
+        bearer_token = self.provider.credentials.bearer_token
+        if not bearer_token:
+            raise ValueError("The filtered stream needs an app bearer token (BEARER_TOKEN)")
+        stream = ingesting_stream_class()(bearer_token, self, daemon=True)
+        stream.session.close()
+        stream.session = self.provider.make_session()
+        added, deleted = sync_rules(stream, self.rules, self.prefix)
+        log.info("Stream rules synced: %d added, %d deleted, %d active",
+                 added, deleted, len(self.rules))
+        stream.filter(threaded=True, tweet_fields=self.tweet_fields)
+        self.stream = stream
+        return self
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.disconnect()
+
+    def alive(self, timeout=60):
+        """True while tweets or keep-alives (every 20 s) keep arriving"""
+        return self.last_activity is not None and time.time() - self.last_activity < timeout
+
+    def on_connect(self):
+        self.connects += 1
+        self.last_activity = time.time()
+        metrics.inc('stream_connects_total')
+        log.info("Filtered stream connected%s", " again" if self.connects > 1 else "")
+        try:
+            self.backfill()
+        except Exception as e:
+            log.error("Stream backfill failed: %s", e)
+
+    def backfill(self):
+        """Search every rule for tweets newer than its cursor; returns how many were new"""
+        if self.cursors is None:
+            return 0
+        client = self.provider.get_client()
+        added = 0
+        for query in self.rules.values():
+            since_id = self.cursors.get(query)
+            if since_id is None:
+                # Never read before, so there is nothing to catch up on
+                continue
+            tweets = fetch_new_tweets(client, query, None, max_results=100, since_id=since_id,
+                                      tweet_fields=self.tweet_fields)
+            for tweet in reversed(tweets):
+                added += self.offer(tweet, (query,), 'backfill')
+        if added:
+            log.info("Backfilled %d tweets missed while disconnected", added)
+        return added
+
+    def on_response(self, response):
+        self.last_activity = time.time()
+        tweet = response.data
+        if tweet is None:
+            return
+        queries = tuple(self.rules[rule.tag] for rule in response.matching_rules
+                        if rule.tag in self.rules)
+        if not queries:
+            return
+        created = created_timestamp(tweet)
+        if created is not None:
+            metrics.observe('stream_discovery_seconds', max(0.0, self.last_activity - created))
+        self.offer(tweet, queries, 'stream')
+
+    def offer(self, tweet, queries, source):
+        """Buffer a tweet unless it was seen already; returns True if it was buffered"""
+        with self._lock:
+            if tweet.id in self.seen:
+                metrics.inc('stream_duplicates_total', source=source)
+                return False
+            self.seen[tweet.id] = None
+            if len(self.seen) > self.remember:
+                self.seen.popitem(last=False)
+        metrics.inc('stream_tweets_total', source=source)
+        self.buffer.put((tweet, queries))
+        return True
+
+    def drain(self, max_items=100, timeout=None):
+        """Buffered tweets for the pipeline, oldest first, moving rule cursors past them"""
+        batch = self.buffer.drain(max_items, timeout)
+        if self.cursors is not None:
+            newest = {}
+            for tweet, queries in batch:
+                for query in queries:
+                    newest[query] = max(newest.get(query, 0), int(tweet.id))
+            for query, tweet_id in newest.items():
+                self.cursors.advance(query, tweet_id)
+        return [tweet for tweet, _ in batch]
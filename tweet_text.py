@@ -0,0 +1,246 @@
+import re
+
+# Twitter counts in weighted units: 280 "characters" = 28000 units
+MAX_WEIGHTED_LENGTH = 280
+URL_LENGTH = 23
+
+# Code point ranges that count as one character; everything else counts as two
+LIGHT_RANGES = (
+    (0x0000, 0x10FF),
+    (0x2000, 0x200D),
+    (0x2010, 0x201F),
+    (0x2032, 0x2037),
+)
+
+URL_PATTERN = re.compile(r'https?://[^\s]+', re.IGNORECASE)
+
+# Code points that start an emoji; each emoji sequence counts as two
+EMOJI_RANGES = (
+    (0x1F000, 0x1FAFF),
+    (0x2600, 0x27BF),
+    (0x2300, 0x23FF),
+    (0x2B00, 0x2BFF),
+) + tuple((cp, cp) for cp in (0x00A9, 0x00AE, 0x203C, 0x2049, 0x2122, 0x2139, 0x3030, 0x303D))
+
+def _char_class(ranges, negate=False):
+    body = ''.join(
+        re.escape(chr(low)) if low == high else f"{re.escape(chr(low))}-{re.escape(chr(high))}"
+        for low, high in ranges
+    )
+    return f"[{'^' if negate else ''}{body}]"
+
+# An emoji sequence (flag pair, or emoji or keycap base followed by
+# variation selectors, skin tones, tag characters and ZWJ joins), or a
+# single character outside LIGHT_RANGES. Everything else weighs one.
+_MODIFIERS = r'(?:[\ufe0e\ufe0f\u20e3\U0001F3FB-\U0001F3FF\U000E0020-\U000E007F]|\u200d.)*'
+HEAVY_PATTERN = re.compile(
+    rf'[\U0001F1E6-\U0001F1FF]{_MODIFIERS}(?:[\U0001F1E6-\U0001F1FF]{_MODIFIERS})?'
+    rf'|(?:{_char_class(EMOJI_RANGES)}|[\x00-\x7f](?=[\ufe0e\ufe0f\u20e3])){_MODIFIERS}'
+    rf'|{_char_class(LIGHT_RANGES, negate=True)}',
+    re.DOTALL
+)
+
+def _text_weight(text):
+    """Weight of text without URLs: 1 per light character, 2 per other character or emoji"""
+    if text.isascii():
+        return len(text)
+    heavy = HEAVY_PATTERN.findall(text)
+    return len(text) + 2 * len(heavy) - sum(map(len, heavy))
+
+def weighted_length(text):
+    """Tweet length as Twitter counts it: URLs are 23, emoji and CJK count double"""
+    weight = 0
+    last = 0
+    for match in URL_PATTERN.finditer(text):
+        weight += _text_weight(text[last:match.start()]) + URL_LENGTH
+        last = match.end()
+    return weight + _text_weight(text[last:])
+
+def fits(text, limit=MAX_WEIGHTED_LENGTH):
+    return 0 < weighted_length(text) <= limit
+
+# Model output wrapped in quotes, optionally after a lead-in such as
+# 'Here is a tweet:' and followed by hashtags outside the quotes
+QUOTED_PATTERN = re.compile(
+    r'^\s*(?:[^\n"\u201c\u201d:]{1,80}:\s*)?["\u201c](?P<inner>[^"\u201c\u201d]+)["\u201d]'
+    r'(?P<after>(?:\s+#\w+)*)\s*$'
+)
+
+# One scan finds metadata tags (【4:0†source】), URLs, hashtags and
+# whitespace runs that need collapsing; single spaces stay in the plain
+# text between matches. A hashtag needs a letter, so '#1' or 'C#' stay
+# part of the sentence.
+TOKEN_PATTERN = re.compile(
+    r'(?P<meta>\u3010[^\u3011]*\u3011)'
+    r'|(?P<url>https?://\S+)'
+    r'|(?<![\w#&])#(?P<tag>\w*[^\W\d]\w*)'
+    r'|(?P<space>\s{2,}|[^\S ])',
+    re.IGNORECASE
+)
+
+# TOKEN_PATTERN's hashtag at the start of a word, where its look-behind holds
+WORD_HASHTAG_PATTERN = re.compile(r'#\w*[^\W\d]\w*')
+
+# A removed metadata tag leaves no space before these
+AFTER_METADATA = frozenset(' .,;:!?)')
+
+class NormalizedTweet:
+    """Cleaned tweet text with its body, hashtags and weighted length"""
+
+    __slots__ = ('text', 'body', 'hashtags', 'length')
+
+    def __init__(self, text, body, hashtags, length):
+        self.text = text
+        self.body = body
+        self.hashtags = hashtags
+        self.length = length
+
+    def __repr__(self):
+        return f"NormalizedTweet({self.text!r}, length={self.length})"
+
+    def fits(self, limit=MAX_WEIGHTED_LENGTH):
+        return 0 < self.length <= limit
+
+def unwrap_quotes(text):
+    """Text inside wrapping quotes, keeping hashtags that follow the closing quote"""
+    match = QUOTED_PATTERN.match(text)
+    if match is None:
+        return text
+    return match.group('inner') + match.group('after')
+
+def normalize(text):
+    """Strip metadata and quotes, collect hashtags and measure the tweet in one scan
+
+    Hashtags inside sentences stay where they are; the run of hashtags at
+    the end is moved below the body after a blank line. All hashtags are
+    returned (deduplicated, in order) in `hashtags`.
+    """
+    if (text.isascii() and '"' not in text and '://' not in text
+            and ' '.join(text.split()) == text.replace('\n\n', ' ').replace('\n', ' ')):
+        # Most replies: words separated by single spaces, newlines or blank
+        # lines, and no metadata, quotes or URLs
+        return _normalize_plain(text)
+    return _normalize_scan(text)
+
+def _normalize_plain(text):
+    if '#' not in text:
+        return NormalizedTweet(text, text, [], len(text))
+    if text.count('#') != text.count(' #') + text.count('\n#') + (text[0] == '#'):
+        # A hashtag inside a word depends on the character before it
+        return _normalize_scan(text)
+    hashtags = WORD_HASHTAG_PATTERN.findall(text)
+    words = text.split()
+    tail = len(words)
+    while tail and WORD_HASHTAG_PATTERN.fullmatch(words[tail - 1]):
+        tail -= 1
+    trailing = words[tail:]
+    if trailing:
+        start = len(text)
+        for tag in reversed(trailing):
+            start = text.rfind(tag, 0, start)
+        body = text[:start].rstrip()
+    else:
+        body = text
+    if len({tag.lower() for tag in hashtags}) < len(hashtags):
+        seen = {tag.lower() for tag in hashtags[:len(hashtags) - len(trailing)]}
+        return _finish(body, len(body), hashtags, trailing, seen)
+    # No repeated tags, so nothing is dropped and every character weighs one
+    if trailing:
+        block = ' '.join(trailing)
+        text = f"{body}\n\n{block}" if body else block
+    return NormalizedTweet(text, body, hashtags, len(text))
+
+def _normalize_scan(text):
+    text = unwrap_quotes(text).strip()
+    pieces = []
+    append = pieces.append
+    weight = 0
+    hashtags = []
+    tail = None
+    dropped = False
+    last = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        start = match.start()
+        if start > last:
+            plain = text[last:start]
+            if dropped and plain[0] in AFTER_METADATA and pieces and pieces[-1].endswith(' '):
+                pieces[-1] = pieces[-1][:-1]
+                weight -= 1
+            append(plain)
+            weight += len(plain) if plain.isascii() else _text_weight(plain)
+            if tail is not None and not plain.isspace():
+                tail = None
+        last = match.end()
+        dropped = False
+        kind = match.lastgroup
+        if kind == 'tag':
+            tag = match.group()
+            hashtags.append(tag)
+            if tail is None:
+                tail = len(pieces)
+            append(tag)
+            weight += len(tag) if tag.isascii() else _text_weight(tag)
+        elif kind == 'space':
+            if not pieces or pieces[-1][-1:] in ' \n':
+                continue
+            newlines = match.group().count('\n')
+            piece = ' ' if newlines == 0 else '\n' if newlines == 1 else '\n\n'
+            append(piece)
+            weight += len(piece)
+        elif kind == 'url':
+            append(match.group())
+            weight += URL_LENGTH
+            tail = None
+        else:
+            dropped = True
+    if last < len(text):
+        plain = text[last:]
+        if dropped and plain[0] in AFTER_METADATA and pieces and pieces[-1].endswith(' '):
+            pieces[-1] = pieces[-1][:-1]
+            weight -= 1
+        append(plain)
+        weight += _text_weight(plain)
+        if not plain.isspace():
+            tail = None
+
+    trailing = None
+    if tail is not None:
+        trailing = [piece for piece in pieces[tail:] if piece.startswith('#')]
+        weight -= sum(_text_weight(piece) for piece in pieces[tail:])
+        del pieces[tail:]
+    body = ''.join(pieces)
+    stripped = body.rstrip()
+    weight -= len(body) - len(stripped)
+    seen = {piece.lower() for piece in pieces if piece.startswith('#')} if trailing else None
+    return _finish(stripped, weight, hashtags, trailing, seen)
+
+def _finish(body, weight, hashtags, trailing, seen):
+    """The tweet from its body and trailing hashtags; `seen` holds the body's tags, lowercased"""
+    if len(hashtags) > 1:
+        unique = set()
+        hashtags = [tag for tag in hashtags if not (tag.lower() in unique or unique.add(tag.lower()))]
+    if trailing:
+        # Tags already used in the body are not repeated below it
+        trailing = [tag for tag in trailing
+                    if not (tag.lower() in seen or seen.add(tag.lower()))]
+    if not trailing:
+        return NormalizedTweet(body, body, hashtags, weight)
+    block = ' '.join(trailing)
+    block_weight = _text_weight(block)
+    if not body:
+        return NormalizedTweet(block, body, hashtags, block_weight)
+    return NormalizedTweet(f"{body}\n\n{block}", body, hashtags, weight + 2 + block_weight)
+
+def _normalize_chunk(texts):
+    return [normalize(text) for text in texts]
+
+def normalize_many(texts, processes=1, chunk_size=2000):
+    """Normalize a batch of texts, split across `processes` worker processes if > 1"""
+    texts = list(texts)
+    if processes <= 1 or len(texts) <= chunk_size:
+        return _normalize_chunk(texts)
+    from multiprocessing import Pool
+
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    with Pool(processes) as pool:
+        return [tweet for chunk in pool.map(_normalize_chunk, chunks) for tweet in chunk]
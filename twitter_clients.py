@@ -0,0 +1,305 @@
+import os
+import threading
+import time
+from functools import lru_cache
+import metrics
+import deadlines
+from rate_limits import RateLimitGovernor, endpoint_name
+
+TWITTER_API_URL = "https://api.twitter.com"
+
+class TwitterCredentials:
+    """Twitter API credentials, read from the environment once"""
+
+    def __init__(self, bearer_token=None, consumer_key=None, consumer_secret=None,
+                 access_token=None, access_token_secret=None):
+        self.bearer_token = bearer_token
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.access_token = access_token
+        self.access_token_secret = access_token_secret
+
+    @classmethod
+    def from_env(cls, prefix=''):
+        """Credentials from BEARER_TOKEN, API_KEY, ... optionally namespaced by `prefix`"""
+        return cls(
+            bearer_token=os.getenv(prefix + 'BEARER_TOKEN'),
+            consumer_key=os.getenv(prefix + 'API_KEY'),
+            consumer_secret=os.getenv(prefix + 'API_KEY_SECRET'),
+            access_token=os.getenv(prefix + 'ACCESS_TOKEN'),
+            access_token_secret=os.getenv(prefix + 'ACCESS_TOKEN_SECRET')
+        )
+
+    def as_kwargs(self):
+        return {
+            'bearer_token': self.bearer_token,
+            'consumer_key': self.consumer_key,
+            'consumer_secret': self.consumer_secret,
+            'access_token': self.access_token,
+            'access_token_secret': self.access_token_secret,
+        }
+
+# tweepy and requests are imported when the first client is built, so
+# commands that never call Twitter do not pay for loading them
+
+@lru_cache(maxsize=None)
+def governed_client_class():
+    """tweepy.Client that reserves rate-limit budget before every request"""
+    import tweepy
+
+    class GovernedClient(tweepy.Client):
+        def __init__(self, *args, governor=None, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.governor = governor or RateLimitGovernor()
+
+        def request(self, method, route, params=None, json=None, user_auth=False):
+            endpoint = endpoint_name(method, route)
+            for attempt in range(2):
+                # Waiting for budget counts against the caller's deadline
+                if not self.governor.acquire(endpoint, timeout=deadlines.bound(None, endpoint)):
+                    raise deadlines.DeadlineExceeded(f"No {endpoint} budget before the deadline")
+                started = time.perf_counter()
+                try:
+                    response = super().request(method, route, params, json, user_auth)
+                except tweepy.TooManyRequests as e:
+                    # Budget was out of sync with the server: wait for the reset and retry once
+                    self.governor.exhaust(endpoint, e.reset_time)
+                    metrics.inc('twitter_rate_limited_total', endpoint=endpoint)
+                    if attempt:
+                        raise
+                    metrics.inc('twitter_retries_total', endpoint=endpoint)
+                    continue
+                except tweepy.HTTPException as e:
+                    self.governor.release(endpoint, e.response.headers)
+                    raise
+                except Exception:
+                    self.governor.release(endpoint)
+                    raise
+                finally:
+                    metrics.observe(
+                        'twitter_call_seconds', time.perf_counter() - started, endpoint=endpoint
+                    )
+                self.governor.release(endpoint, response.headers)
+                return response
+
+    return GovernedClient
+
+@lru_cache(maxsize=None)
+def governed_async_client_class():
+    """AsyncClient counterpart of GovernedClient (tweepy.asynchronous is optional)"""
+    import asyncio
+    import tweepy
+    from tweepy.asynchronous import AsyncClient
+
+    class GovernedAsyncClient(AsyncClient):
+        def __init__(self, *args, governor=None, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.governor = governor or RateLimitGovernor()
+
+        async def request(self, method, route, params=None, json=None, user_auth=False):
+            endpoint = endpoint_name(method, route)
+            for attempt in range(2):
+                acquired = await asyncio.to_thread(
+                    self.governor.acquire, endpoint, timeout=deadlines.bound(None, endpoint)
+                )
+                if not acquired:
+                    raise deadlines.DeadlineExceeded(f"No {endpoint} budget before the deadline")
+                started = time.perf_counter()
+                try:
+                    response = await super().request(method, route, params, json, user_auth)
+                except tweepy.TooManyRequests as e:
+                    self.governor.exhaust(endpoint, e.reset_time)
+                    metrics.inc('twitter_rate_limited_total', endpoint=endpoint)
+                    if attempt:
+                        raise
+                    metrics.inc('twitter_retries_total', endpoint=endpoint)
+                    continue
+                except tweepy.HTTPException as e:
+                    self.governor.release(endpoint, e.response.headers)
+                    raise
+                except Exception:
+                    self.governor.release(endpoint)
+                    raise
+                finally:
+                    metrics.observe(
+                        'twitter_call_seconds', time.perf_counter() - started, endpoint=endpoint
+                    )
+                self.governor.release(endpoint, response.headers)
+                return response
+
+    return GovernedAsyncClient
+
+@lru_cache(maxsize=None)
+def deadline_adapter_class():
+    """Transport adapter whose read timeout is the time left before the caller's deadline
+
+    tweepy sends requests without a timeout, so this is where a slot's
+    deadline reaches the socket.
+    """
+    from requests.adapters import HTTPAdapter
+
+    class DeadlineAdapter(HTTPAdapter):
+        def send(self, request, **kwargs):
+            timeout = kwargs.get('timeout')
+            if not isinstance(timeout, tuple):
+                kwargs['timeout'] = deadlines.bound(timeout, request.method + ' ' + request.path_url)
+            return super().send(request, **kwargs)
+
+    return DeadlineAdapter
+
+@lru_cache(maxsize=None)
+def redirect_adapter_class():
+    """Transport adapter that sends api.twitter.com requests to `base_url`
+
+    tweepy hard-codes the API host, so this is the hook used to point the
+    client at a local stand-in server.
+    """
+    class RedirectAdapter(deadline_adapter_class()):
+        def __init__(self, base_url, **kwargs):
+            self.base_url = base_url.rstrip('/')
+            super().__init__(**kwargs)
+
+        def send(self, request, **kwargs):
+            if request.url.startswith(TWITTER_API_URL):
+                request.url = self.base_url + request.url[len(TWITTER_API_URL):]
+            return super().send(request, **kwargs)
+
+    return RedirectAdapter
+
+class RedirectSession:
+    """aiohttp session wrapper with the same redirect as RedirectAdapter"""
+
+    def __init__(self, session, base_url):
+        self.session = session
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, url, **kwargs):
+        from yarl import URL
+        target = str(url)
+        if target.startswith(TWITTER_API_URL):
+            url = URL(self.base_url + target[len(TWITTER_API_URL):], encoded=True)
+        return self.session.request(method, url, **kwargs)
+
+    async def close(self):
+        await self.session.close()
+
+class TwitterClientProvider:
+    """Process-wide tweepy clients sharing pooled keep-alive connections
+
+    `base_url` (or the TWITTER_API_BASE_URL environment variable) redirects
+    every request to a local stand-in server for tests and benchmarks.
+    Providers of several accounts can share one connection pool by passing
+    the same `adapter` (see `make_adapter`).
+    """
+
+    def __init__(self, credentials=None, pool_size=10, base_url=None, governor=None, adapter=None):
+        self.credentials = credentials or TwitterCredentials.from_env()
+        self.pool_size = pool_size
+        self.base_url = base_url or os.getenv('TWITTER_API_BASE_URL')
+        self.adapter = adapter
+        # Shared by the sync and async clients so both draw from one budget
+        self.governor = governor or RateLimitGovernor()
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    def make_adapter(self):
+        """Transport adapter holding a keep-alive pool of `pool_size` connections"""
+        if self.base_url:
+            return redirect_adapter_class()(
+                self.base_url, pool_connections=self.pool_size, pool_maxsize=self.pool_size
+            )
+        return deadline_adapter_class()(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+
+    def make_session(self):
+        """requests.Session using the shared adapter, or a pool of its own"""
+        import requests
+
+        session = requests.Session()
+        adapter = self.adapter or self.make_adapter()
+        if self.base_url:
+            session.mount(TWITTER_API_URL, adapter)
+            session.mount(self.base_url, adapter)
+        else:
+            session.mount('https://', adapter)
+        return session
+
+    def get_client(self):
+        """Shared synchronous tweepy.Client"""
+        with self._lock:
+            if self._client is None:
+                client = governed_client_class()(
+                    **self.credentials.as_kwargs(),
+                    governor=self.governor
+                )
+                client.session.close()
+                client.session = self.make_session()
+                self._client = client
+            return self._client
+
+    async def get_async_client(self):
+        """Shared tweepy AsyncClient, must be called from the event loop that uses it"""
+        if self._async_client is None:
+            import aiohttp
+
+            client = governed_async_client_class()(
+                **self.credentials.as_kwargs(),
+                governor=self.governor
+            )
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size)
+            )
+            client.session = RedirectSession(session, self.base_url) if self.base_url else session
+            self._async_client = client
+        return self._async_client
+
+    def rate_limit_metrics(self):
+        """Remaining budget, queued calls and throttling per endpoint"""
+        return self.governor.metrics()
+
+    def connection_stats(self):
+        """Connections opened and requests sent by the synchronous client's pools"""
+        stats = {'connections': 0, 'requests': 0}
+        if self._client is None:
+            return stats
+        for adapter in set(self._client.session.adapters.values()):
+            for key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is not None:
+                    stats['connections'] += pool.num_connections
+                    stats['requests'] += pool.num_requests
+        return stats
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.session.close()
+            self._async_client = None
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.session.close()
+                self._client = None
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_provider():
+    """The process-wide client provider, created on first use"""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = TwitterClientProvider()
+        return _provider
+
+def configure(**kwargs):
+    """Replace the process-wide provider (e.g. to set pool_size or base_url)"""
+    global _provider
+    with _provider_lock:
+        if _provider is not None:
+            _provider.close()
+        _provider = TwitterClientProvider(**kwargs)
+        return _provider
+
+def get_client():
+    return get_provider().get_client()